@@ -2,11 +2,19 @@ import psycopg2
 from psycopg2 import pool
 from psycopg2.extras import execute_values
 import io
+import uuid
 import numpy as np
 import csv
 
 import logpool as control
 
+from astroinject.profiling import stage
+
+# text payload of `COPY ... WITH (FORMAT CSV, DELIMITER E'\t', NULL '')`: values holding a tab,
+# a newline or a quote are quoted, quotes doubled; backslashes are plain characters in CSV COPY
+# (bytea hex values start with one), so they must not be escaped
+COPY_CSV_DIALECT = dict(delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_MINIMAL, quotechar='"', doublequote=True)
+
 class PostgresConnectionManager:
     """
     PostgreSQL Connection Manager that supports both connection pooling and single connection modes.
@@ -27,6 +35,11 @@ class PostgresConnectionManager:
             self.pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, **db_params)
         else:
             self.connection = psycopg2.connect(**db_params)
+        
+        # size of the payload sent by the last `insert_data_copy`
+        self.last_copy_bytes = 0
+        # rows refused by the last COPY run with `isolate=True`: [(index in records, error)]
+        self.last_rejects = []
     
     def get_connection(self):
         """Retrieve a connection from the pool or the single connection."""
@@ -97,7 +110,8 @@ class PostgresConnectionManager:
         finally:
             self.release_connection(conn)
     
-    def format_pg_array_vectorized(self, values):
+    @staticmethod
+    def format_pg_array_vectorized(values):
         """
         ✅ Fully vectorized function to format PostgreSQL arrays.
         
@@ -125,7 +139,7 @@ class PostgresConnectionManager:
 
         return values.tolist()
     
-    def insert_data_copy_w_idhandling(self, table_name, columns, records, id_col):
+    def insert_data_copy_w_idhandling(self, table_name, columns, records, id_col, isolate=False, before_commit=()):
         """
         Bulk insert data using COPY with temporary table to handle primary key conflicts.
         
@@ -133,24 +147,31 @@ class PostgresConnectionManager:
         :param columns: List of column names.
         :param records: List of tuples containing the data.
         :param id_col: The primary key column name (for conflict handling).
+        :param isolate: Load the good rows when some are refused, see `copy_isolating`.
+        :param before_commit: (query, params) run in the same transaction, after the rows.
+        :return: Number of rows inserted (rows whose id already existed are skipped), None on failure.
         """
         conn = self.get_connection()
+        self.last_rejects = []
         try:
+            csv_data = self.encode_copy_records(records)
+            self.last_copy_bytes = csv_data.seek(0, io.SEEK_END)
+            csv_data.seek(0)
+
             with conn.cursor() as cur:
                 # Create a temporary table based on the target table
-                temp_table = f"{table_name}_temp"
-                cur.execute(f"CREATE TEMP TABLE {temp_table} (LIKE {table_name} INCLUDING ALL) ON COMMIT DROP;")
-                
-                # Format records using the vectorized function
-                records_np = np.array(records, dtype=object)
-                formatted_records = self.format_pg_array_vectorized(records_np)
-                
-                # Convert formatted records to CSV-like text in memory
-                csv_data = io.StringIO("\n".join(["\t".join(map(str, row)) for row in formatted_records]) + "\n")
+                # (temporary tables live in their own schema, so drop the schema part; the unique
+                # suffix keeps tables of the same name in different schemas apart in one session)
+                temp_table = f"{table_name.split('.')[-1][:40]}_temp_{uuid.uuid4().hex[:12]}"
+                cur.execute(f"CREATE TEMP TABLE {temp_table} (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DROP;")
                 
                 # Copy data into the temporary table
-                copy_query = f"COPY {temp_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\t', NULL 'None')"
-                cur.copy_expert(copy_query, csv_data)
+                copy_query = f"COPY {temp_table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\t', NULL '')"
+                if isolate:
+                    self.last_rejects = self.copy_isolating(cur, copy_query, records, csv_data)
+                else:
+                    with stage("copy_expert"):
+                        cur.copy_expert(copy_query, csv_data)
                 
                 # Merge data from the temporary table into the main table, handling conflicts
                 column_list = ", ".join(columns)
@@ -162,43 +183,138 @@ class PostgresConnectionManager:
                     {conflict_case};
                 """
                 cur.execute(insert_query)
+                inserted = cur.rowcount
+                for query, params in before_commit:
+                    cur.execute(query, params)
                 conn.commit()
-                print(f"✅ Inserted {len(records)} rows into {table_name} using COPY with vectorized array handling.")
+                print(f"✅ Inserted {inserted} of {len(records)} rows into {table_name} using COPY with conflict handling.")
+                return inserted
         except Exception as e:
             conn.rollback()
             control.critical(f"COPY insert failed: {e}")
+            return None
         finally:
             self.release_connection(conn)
     
-    def insert_data_copy(self, table_name, columns, records):
+    @staticmethod
+    def copy_isolating(cur, copy_query, records, csv_data):
+        """
+        Run `copy_query` with the encoded `records` inside a savepoint. When the server refuses it,
+        split the rows in halves, COPY each half in its own savepoint, and split again the halves
+        that fail, down to single rows: the good rows stay in the transaction (the caller commits).
+        A single bad row costs about 2 * log2(len(records)) extra COPYs of shrinking size.
+        Only data errors (SQLSTATE classes 22 and 23: overflow, invalid input, null or unique
+        violations...) are isolated, any other error is raised.
+        
+        :return: The refused rows, [(index in records, error message)].
+        """
+        def attempt(payload):
+            cur.execute("SAVEPOINT astroinject_copy;")
+            try:
+                with stage("copy_expert"):
+                    cur.copy_expert(copy_query, payload)
+            except psycopg2.Error as e:
+                cur.execute("ROLLBACK TO SAVEPOINT astroinject_copy;")
+                if not (e.pgcode or "").startswith(("22", "23")):
+                    raise
+                return (e.pgerror or str(e)).strip()
+            cur.execute("RELEASE SAVEPOINT astroinject_copy;")
+            return None
+
+        error = attempt(csv_data)
+        if error is None:
+            return []
+        
+        # encode again, remembering where each record ends, to COPY any slice of the payload
+        with stage("bisect_copy"):
+            lines, ends = PostgresConnectionManager.encode_copy_lines(records)
+            rejects = []
+            
+            def bisect(lo, hi, error):
+                if hi - lo == 1:
+                    rejects.append((lo, error))
+                    return
+                mid = (lo + hi) // 2
+                for start, stop in ((lo, mid), (mid, hi)):
+                    payload = io.StringIO(lines[ends[start - 1] if start else 0:ends[stop - 1]])
+                    half_error = attempt(payload)
+                    if half_error is not None:
+                        bisect(start, stop, half_error)
+            
+            bisect(0, len(records), error)
+        control.warn(f"COPY refused {len(rejects)} of {len(records)} rows, the others were loaded")
+        return rejects
+    
+    @staticmethod
+    def encode_copy_lines(records):
+        """
+        Same payload as `encode_copy_records`, as a string, with the offset where each record ends.
+        """
+        formatted_records = PostgresConnectionManager.format_pg_array_vectorized(np.array(records, dtype=object))
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, **COPY_CSV_DIALECT)
+        ends = []
+        for record in formatted_records:
+            writer.writerow(record)
+            ends.append(buffer.tell())
+        return buffer.getvalue(), ends
+    
+    @staticmethod
+    def encode_copy_records(records):
+        """
+        Encode records as the tab separated text payload read by `insert_data_copy`.
+        
+        :param records: List of tuples containing the data.
+        :return: io.StringIO positioned at the start of the payload.
+        """
+        # Format records using the vectorized function    
+        records_np = np.array(records, dtype=object)
+        with stage("format_pg_array_vectorized"):
+            formatted_records = PostgresConnectionManager.format_pg_array_vectorized(records_np)
+        
+        # Convert formatted records to CSV-like text in memory
+        with stage("write_copy_buffer"):
+            csv_data = io.StringIO()
+            writer = csv.writer(csv_data, **COPY_CSV_DIALECT)
+            writer.writerows(formatted_records)
+            csv_data.seek(0)
+        return csv_data
+    
+    def insert_data_copy(self, table_name, columns, records, isolate=False, before_commit=()):
         """
         Bulk insert data using COPY without conflict handling for maximum performance.
         
         :param table_name: Target table name.
         :param columns: List of column names.
         :param records: List of tuples containing the data.
+        :param isolate: Load the good rows when some are refused, see `copy_isolating`.
+        :param before_commit: (query, params) run in the same transaction, after the COPY.
+        :return: True if the COPY was committed, False otherwise.
         """
         conn = self.get_connection()
+        self.last_rejects = []
         try:
-            # Format records using the vectorized function    
-            records_np = np.array(records, dtype=object)
-            formatted_records = self.format_pg_array_vectorized(records_np)
+            csv_data = self.encode_copy_records(records)
+            self.last_copy_bytes = csv_data.seek(0, io.SEEK_END)
+            csv_data.seek(0)
                 
             with conn.cursor() as cur:
-                # Convert formatted records to CSV-like text in memory
-                csv_data = io.StringIO()
-                writer = csv.writer(csv_data, delimiter='\t', lineterminator='\n', quoting=csv.QUOTE_NONE, escapechar='\\')
-                writer.writerows(formatted_records)
-                csv_data.seek(0)
-                
                 # Copy data directly into the main table
                 copy_query = f"""COPY {table_name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT CSV, DELIMITER E'\t', NULL '')"""                
-                cur.copy_expert(copy_query, csv_data)
+                if isolate:
+                    self.last_rejects = self.copy_isolating(cur, copy_query, records, csv_data)
+                else:
+                    with stage("copy_expert"):
+                        cur.copy_expert(copy_query, csv_data)
+                for query, params in before_commit:
+                    cur.execute(query, params)
                 conn.commit()
-                print(f"✅ Inserted {len(records)} rows into {table_name} using COPY (no conflict handling).")
+                print(f"✅ Inserted {len(records) - len(self.last_rejects)} rows into {table_name} using COPY (no conflict handling).")
+                return True
         except Exception as e:
             conn.rollback()
             control.critical(f"COPY insert failed: {e}")
+            return False
         finally:
             self.release_connection(conn)
     
@@ -4,13 +4,17 @@ from astroinject.utils import first_valid_index
 from astroinject.database.utils import infer_pg_type
 
 # Function to generate CREATE TABLE query dynamically
-def generate_create_table_query(table_name, table, id_col=None):
+def generate_create_table_query(table_name, table, id_col=None, column_types=None):
     columns_definitions = []
+    column_types = column_types or {}
     
     for col in table.colnames:
-        sample_value = table[col][first_valid_index(table[col])]  # Take first row as a sample
-        
-        pg_type = infer_pg_type(sample_value)
+        if col in column_types:
+            pg_type = column_types[col]
+        else:
+            sample_value = table[col][first_valid_index(table[col])]  # Take first row as a sample
+            
+            pg_type = infer_pg_type(sample_value)
         
         if id_col and id_col.lower() == col.lower():  # Ensure 'id' is the primary key
             columns_definitions.append(f"{col} {pg_type} PRIMARY KEY")  # Use BIGINT to avoid range issues
@@ -23,3 +27,67 @@ def generate_create_table_query(table_name, table, id_col=None):
 
 def vacuum_query(table_name):
     return f"VACUUM ANALYZE {table_name};"
+
+def maintenance_query(table_name, mode):
+    """`mode` is "vacuum_analyze", "analyze" or "none" (returns None)."""
+    if mode == "vacuum_analyze":
+        return vacuum_query(table_name)
+    if mode == "analyze":
+        return f"ANALYZE {table_name};"
+    return None
+
+# decoding of the `bytea_columns` (raw little-endian float32) back to arrays, server side
+BYTEA_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION astroinject_float4_at(data bytea, i integer) RETURNS real
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT CASE
+        WHEN e = 255 AND m <> 0 THEN 'NaN'::real
+        WHEN e = 255 THEN (CASE WHEN s = 1 THEN '-Infinity' ELSE 'Infinity' END)::real
+        WHEN e = 0 THEN ((1 - 2 * s) * m * 2::float8 ^ (-149))::real
+        ELSE ((1 - 2 * s) * (8388608 + m) * 2::float8 ^ (e - 150))::real
+    END
+    FROM (
+        SELECT (w >> 31) & 1 AS s, (w >> 23) & 255 AS e, w & 8388607 AS m
+        FROM (
+            SELECT get_byte(data, 4 * (i - 1))::bigint
+                 | (get_byte(data, 4 * (i - 1) + 1)::bigint << 8)
+                 | (get_byte(data, 4 * (i - 1) + 2)::bigint << 16)
+                 | (get_byte(data, 4 * (i - 1) + 3)::bigint << 24) AS w
+            WHERE i BETWEEN 1 AND length(data) / 4
+        ) word
+    ) parts
+$$;
+
+CREATE OR REPLACE FUNCTION astroinject_float4_array(data bytea) RETURNS real[]
+LANGUAGE sql IMMUTABLE STRICT PARALLEL SAFE AS $$
+    SELECT coalesce(array_agg(astroinject_float4_at(data, i) ORDER BY i), '{}'::real[])
+    FROM generate_series(1, length(data) / 4) AS i
+$$;
+"""
+
+def bytea_comment_query(table_name, col):
+    """Record the encoding of a `bytea_columns` column in its comment."""
+    return (
+        f"COMMENT ON COLUMN {table_name}.{col} IS "
+        f"'astroinject bytea: little-endian float32 (numpy <f4), length = octet_length / 4, "
+        f"decode with astroinject_float4_array({col})';"
+    )
+
+def grid_table_name(table_name):
+    """Companion table of the distinct wavelength grids of `table_name` (`dedup_columns`)."""
+    return f"{table_name}_grids"
+
+def grid_table_queries(table_name, columns):
+    """
+    CREATE the companion grid table and a `<table>_with_grids` view giving back each
+    `dedup_columns` column from its `<column>_grid_id`.
+    """
+    grids = grid_table_name(table_name)
+    joins = "\n".join(
+        f"LEFT JOIN {grids} g{i} ON g{i}.grid_id = m.{col}_grid_id" for i, col in enumerate(columns)
+    )
+    selects = ", ".join(f"g{i}.grid AS {col}" for i, col in enumerate(columns))
+    return [
+        f"CREATE TABLE IF NOT EXISTS {grids} (grid_id BIGINT PRIMARY KEY, grid FLOAT4[] NOT NULL);",
+        f"CREATE OR REPLACE VIEW {table_name}_with_grids AS\nSELECT m.*, {selects}\nFROM {table_name} m\n{joins};",
+    ]
@@ -5,6 +5,8 @@ def make_pg_sphere_index(table, ra_col, dec_col):
     
     if "." in table:
         wtdtable = table.split(".")[1]
+    else:
+        wtdtable = table
     index_name = f"{wtdtable}_{ra_col}_{dec_col}_pgsphere_idx"
     
     query = f"""CREATE INDEX {index_name} 
@@ -27,4 +29,159 @@ def make_q3c_index(table, ra_col, dec_col):
     ON {table} (q3c_ang2ipix("{ra_col}", "{dec_col}"));
     """
 
-    return query, index_name
\ No newline at end of file
+    return query, index_name
+
+
+# HEALPix NESTED pixel (same algorithm as `astroinject.spatial.ang2pix_nest`, -1 without coordinates),
+# angular distance in degrees and the pixel ranges covering a cone (see `astroinject.spatial.cone_pixel_ranges`)
+PIXEL_FUNCTIONS = """
+CREATE OR REPLACE FUNCTION astroinject_ang2pix_nest(ord integer, ra_deg double precision, dec_deg double precision)
+RETURNS bigint AS $$
+DECLARE
+    nside bigint := 1::bigint << ord;
+    z double precision;
+    za double precision;
+    tt double precision;
+    tp double precision;
+    tmp double precision;
+    t1 double precision;
+    t2 double precision;
+    jp bigint;
+    jm bigint;
+    ifp bigint;
+    ifm bigint;
+    ntt bigint;
+    face bigint;
+    ix bigint;
+    iy bigint;
+    xy bigint := 0;
+BEGIN
+    IF ra_deg IS NULL OR dec_deg IS NULL
+       OR ra_deg IN ('NaN', 'Infinity', '-Infinity') OR dec_deg IN ('NaN', 'Infinity', '-Infinity') THEN
+        RETURN -1;
+    END IF;
+
+    z := sin(radians(greatest(-90.0, least(90.0, dec_deg))));
+    za := abs(z);
+    tt := (ra_deg - 360.0 * floor(ra_deg / 360.0)) / 90.0;
+
+    IF za <= 2.0 / 3.0 THEN
+        t1 := nside * (0.5 + tt);
+        t2 := nside * z * 0.75;
+        jp := floor(t1 - t2)::bigint;
+        jm := floor(t1 + t2)::bigint;
+        ifp := jp >> ord;
+        ifm := jm >> ord;
+        IF ifp = ifm THEN
+            face := ifp | 4;
+        ELSIF ifp < ifm THEN
+            face := ifp;
+        ELSE
+            face := ifm + 8;
+        END IF;
+        ix := jm & (nside - 1);
+        iy := nside - (jp & (nside - 1)) - 1;
+    ELSE
+        ntt := least(floor(tt)::bigint, 3);
+        tp := tt - ntt;
+        tmp := nside * sqrt(3.0 * (1.0 - za));
+        jp := least(floor(tp * tmp)::bigint, nside - 1);
+        jm := least(floor((1.0 - tp) * tmp)::bigint, nside - 1);
+        IF z >= 0 THEN
+            face := ntt;
+            ix := nside - jm - 1;
+            iy := nside - jp - 1;
+        ELSE
+            face := ntt + 8;
+            ix := jp;
+            iy := jm;
+        END IF;
+    END IF;
+
+    FOR i IN 0 .. ord - 1 LOOP
+        xy := xy | (((ix >> i) & 1) << (2 * i)) | (((iy >> i) & 1) << (2 * i + 1));
+    END LOOP;
+    RETURN (face << (2 * ord)) + xy;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION astroinject_distance(ra1 double precision, dec1 double precision,
+                                                ra2 double precision, dec2 double precision)
+RETURNS double precision AS $$
+    SELECT degrees(2 * asin(least(1.0, sqrt(
+        sin(radians(dec2 - dec1) / 2) ^ 2
+        + cos(radians(dec1)) * cos(radians(dec2)) * sin(radians(ra2 - ra1) / 2) ^ 2
+    ))));
+$$ LANGUAGE sql IMMUTABLE PARALLEL SAFE;
+
+CREATE OR REPLACE FUNCTION astroinject_cone_ranges(ra_deg double precision, dec_deg double precision,
+                                                   radius double precision, ord integer DEFAULT 16)
+RETURNS TABLE(lo bigint, hi bigint) AS $$
+DECLARE
+    r double precision := radians(radius);
+    coarse integer := ord;
+    nside bigint;
+    reach double precision;
+    extent double precision;
+    steps integer;
+    shift integer;
+BEGIN
+    IF r > 0 THEN
+        coarse := greatest(0, least(ord, floor(ln(sqrt(pi() / 3) / r) / ln(2))::integer));
+    END IF;
+    nside := 1::bigint << coarse;
+    reach := r + 2.2 / nside;
+    IF reach > pi() / 3 THEN
+        RETURN QUERY SELECT 0::bigint, 12 * (1::bigint << (2 * ord)) - 1;
+        RETURN;
+    END IF;
+
+    extent := tan(reach);
+    steps := ceil(extent / (0.25 / nside))::integer;
+    shift := 2 * (ord - coarse);
+    RETURN QUERY
+    WITH grid AS (
+        SELECT -extent + g * extent / steps AS v FROM generate_series(0, 2 * steps) g
+    ), pixels AS (
+        SELECT DISTINCT astroinject_ang2pix_nest(
+            coarse,
+            degrees(radians(ra_deg) + atan2(x.v, cos(radians(dec_deg)) - y.v * sin(radians(dec_deg)))),
+            degrees(asin((sin(radians(dec_deg)) + y.v * cos(radians(dec_deg))) / sqrt(1 + x.v ^ 2 + y.v ^ 2)))
+        ) AS pixel
+        FROM grid x CROSS JOIN grid y
+    )
+    SELECT pixel << shift, ((pixel + 1) << shift) - 1 FROM pixels ORDER BY 1;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE;
+"""
+
+# whether a table already has its stored pixel column, `%s` = table, column
+PIXEL_COLUMN_QUERY = """
+SELECT 1 FROM pg_attribute
+WHERE attrelid = to_regclass(%s) AND attname = %s AND attnum > 0 AND NOT attisdropped
+"""
+
+def make_pixel_column(table, ra_col, dec_col, pixel_col, order):
+    """
+    Queries adding and filling the stored pixel column of a table loaded without it.
+    The UPDATE rewrites every row, leaving as many dead tuples for VACUUM.
+    """
+    return [
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {pixel_col} BIGINT;",
+        f"""UPDATE {table} SET {pixel_col} = astroinject_ang2pix_nest({order}, "{ra_col}", "{dec_col}")
+    WHERE {pixel_col} IS NULL;""",
+    ]
+
+def make_brin_index(table, pixel_col, pages_per_range=32):
+    if "." in table:
+        wtdtable = table.split(".")[1]
+    else:
+        wtdtable = table
+
+    index_name = f"{wtdtable}_{pixel_col}_brin_idx"
+
+    query = f"""CREATE INDEX IF NOT EXISTS {index_name} 
+    ON {table} USING brin ({pixel_col}) WITH (pages_per_range = {pages_per_range});
+    """
+
+    return query, index_name
@@ -1,74 +1,114 @@
 from astroinject.database.dbpool import PostgresConnectionManager
 
 import numpy as np
+import json
+import os
 import logpool as control 
 
 from astropy.table import MaskedColumn 
 
-def build_type_map(config):
-    """
-    Build a type map dictionary by querying PostgreSQL's information_schema.
+# columns of one relation with their base type name (`udt_name` of information_schema, arrays start with "_")
+TYPE_MAP_QUERY = """
+SELECT a.attname, t.typname
+FROM   pg_attribute a
+JOIN   pg_type t ON t.oid = a.atttypid
+WHERE  a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY a.attnum
+"""
+
+# changes whenever the relation is recreated or a column is added, dropped, renamed or retyped
+TYPE_MAP_KEY_QUERY = """
+SELECT c.oid::bigint,
+       c.xmin::text || ':' || (SELECT string_agg(a.xmin::text, ',' ORDER BY a.attnum)
+                               FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0)
+FROM   pg_class c
+WHERE  c.oid = to_regclass(%s)
+"""
+
+def db_type(col_type, column_name=None):
+    """Type name used by `force_cast_types` for a PostgreSQL type name (int4, float8, varchar...)."""
+    col_type = col_type.replace('character varying', 'VARCHAR')
+    col_type = col_type.replace('character', 'CHAR')
     
-    :param db_params: Dictionary with connection parameters (dbname, user, password, host, port)
-    :param table_name: Name of the target table.
-    :param schema: Schema name (default is "public").
-    :return: A dictionary mapping column names (lowercase) to type strings.
-    """
-    # Connect to PostgreSQL
-    pg_conn = PostgresConnectionManager(**config["database"])
+    col_type = col_type.upper()
     
-    infos = pg_conn.execute_query(f"""
-            select *
-            from information_schema.columns
-            where table_schema NOT IN ('information_schema', 'pg_catalog')
-            order by table_schema, table_name
-        """, fetch = True)
+    if 'DOUBLE' in col_type or 'FLOAT8' in col_type:
+        return 'DOUBLE'
+    elif 'REAL' in col_type or 'FLOAT4' in col_type or 'FLOAT' in col_type:
+        return 'REAL'
+    elif 'SMALLINT' in col_type or 'SHORT' in col_type:
+        return 'SMALLINT'
+    elif 'INTEGER' in col_type:
+        return 'INTEGER'
+    elif 'LONG' in col_type or 'BIGINT' in col_type:
+        return 'BIGINT'
+    elif 'INT' in col_type:
+        return 'BIGINT'
+    elif 'BOOL' in col_type:
+        return 'BOOL'
+    elif 'CHAR' in col_type or 'TEXT' in col_type:
+        return 'VARCHAR'
     
+    control.critical(f'did not found type representation for: {col_type} on column: {column_name}')
+    return None
+
+def type_map_cache_path(config):
+    """`general.type_map_cache`, default <tablename>.types.json; "none" disables the cache."""
+    path = config.get("general", {}).get("type_map_cache") or f"{config['tablename']}.types.json"
+    return None if str(path).lower() == "none" else path
 
-    type_map = {}
-    for row in infos:
-        table_name = row[2]
-        if table_name == config['tablename']:
+def _read_type_map_cache(path, key):
+    try:
+        with open(path) as f:
+            cached = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if cached.get("key") != key:
+        return None
+    return cached["types"]
 
-            column_name = row[3]
-            col_type = row[27]
-            
-            col_type = col_type.replace('character varying', 'VARCHAR')
-            col_type = col_type.replace('character', 'CHAR')
-            
-            col_type = col_type.upper()
-            
-            db_type = None
-            if 'DOUBLE' in col_type or 'FLOAT8' in col_type:
-                db_type = 'DOUBLE'
-                
-            elif 'REAL' in col_type or 'FLOAT4' in col_type or 'FLOAT' in col_type:
-                db_type = 'REAL'
-                
-            elif 'SMALLINT' in col_type or 'SHORT' in col_type:
-                db_type = 'SMALLINT'
-            
-            elif 'INTEGER' in col_type:
-                db_type = 'INTEGER'
-                
-            elif 'LONG' in col_type or 'BIGINT' in col_type:
-                db_type = 'BIGINT'
-            
-            elif 'INT' in col_type:
-                db_type = 'BIGINT'
-            
-            elif 'BOOL' in col_type:
-                db_type = 'BOOL'
-                
-            elif 'CHAR' in col_type or 'TEXT' in col_type:
-                db_type = 'VARCHAR'
-            
-            else:
-                control.critical(f'did not found type representation for: {col_type} on column: {column_name}')
+def _write_type_map_cache(path, key, type_map):
+    tmp = f"{path}.tmp"
+    try:
+        with open(tmp, "w") as f:
+            json.dump({"key": key, "types": type_map}, f, indent=1)
+        os.replace(tmp, path)
+    except OSError as e:
+        control.warn(f"could not write type map cache {path}: {e}")
 
+def build_type_map(config):
+    """
+    Map the columns of `config["tablename"]` to the type names used by `force_cast_types`.
+
+    Only the target relation is read from `pg_attribute`, on a single connection. The
+    result is cached on disk (see `type_map_cache_path`) keyed by the relation OID and
+    the catalog rows of its columns, so it is read again only after a DDL change.
+    Array columns are left out. Returns {} when the table does not exist.
+    """
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    try:
+        key_row = pg_conn.execute_query(TYPE_MAP_KEY_QUERY, (config["tablename"],), fetch=True)
+        if not key_row:
+            control.warn(f"table {config['tablename']} not found, no type map")
+            return {}
+        key = f"{key_row[0][0]}:{key_row[0][1]}"
+
+        cache_path = type_map_cache_path(config)
+        if cache_path:
+            cached = _read_type_map_cache(cache_path, key)
+            if cached is not None:
+                control.info(f"using cached type map of {config['tablename']} ({cache_path})")
+                return cached
+
+        type_map = {}
+        for column_name, col_type in pg_conn.execute_query(TYPE_MAP_QUERY, (config["tablename"],), fetch=True) or []:
             if not col_type.startswith("_"):
-                type_map[column_name] = db_type
-            
+                type_map[column_name] = db_type(col_type, column_name)
+    finally:
+        pg_conn.close()
+
+    if cache_path:
+        _write_type_map_cache(cache_path, key, type_map)
     return type_map
 
 def force_cast_types(table, type_map):
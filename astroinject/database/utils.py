@@ -33,6 +33,112 @@ def infer_pg_type(value):
     else:
         raise ValueError(f"Unsupported type: {type(value)}")
     
+# integer types by width, with the range they hold
+INT_PG_TYPES = (
+    ("SMALLINT", -2**15, 2**15 - 1),
+    ("INTEGER", -2**31, 2**31 - 1),
+    ("BIGINT", -2**63, 2**63 - 1),
+)
+
+def column_stats(col):
+    """
+    Type statistics of a whole column: numpy kind and item size, shape of each value,
+    number of rows and of nulls (masked or NaN), min / max of the valid values of integer columns.
+    """
+    data = np.ma.asarray(col)
+    mask = np.ma.getmaskarray(data)
+    if data.dtype.kind == "f":
+        mask = mask | np.isnan(np.ma.getdata(data))
+    if mask.ndim > 1:
+        mask = mask.all(axis=tuple(range(1, mask.ndim)))
+
+    stats = {
+        "kind": data.dtype.kind, "itemsize": data.dtype.itemsize, "shape": tuple(data.shape[1:]),
+        "rows": len(data), "nulls": int(mask.sum()), "min": None, "max": None,
+    }
+    if stats["kind"] in "iu" and stats["nulls"] < stats["rows"]:
+        valid = np.ma.getdata(data)[~mask]
+        stats["min"], stats["max"] = int(valid.min()), int(valid.max())
+    return stats
+
+def merge_column_stats(a, b):
+    """Statistics of the column made of both columns (e.g. the same column of two files)."""
+    kinds = {a["kind"], b["kind"]}
+    if len(kinds) == 1:
+        kind = a["kind"]
+    elif kinds <= {"i", "u", "b"}:
+        kind = "i"
+    elif kinds <= {"i", "u", "b", "f"}:
+        kind = "f"
+    else:
+        kind = "U"
+
+    merged = {
+        "kind": kind, "itemsize": max(a["itemsize"], b["itemsize"]),
+        "shape": a["shape"] if a["shape"] == b["shape"] else max(a["shape"], b["shape"], key=len),
+        "rows": a["rows"] + b["rows"], "nulls": a["nulls"] + b["nulls"], "min": None, "max": None,
+    }
+    bounds = [s for s in (a, b) if s["min"] is not None]
+    if bounds:
+        merged["min"] = min(s["min"] for s in bounds)
+        merged["max"] = max(s["max"] for s in bounds)
+    return merged
+
+def table_stats(table, stats=None):
+    """`column_stats` of every column of `table`, merged into `stats` (from other files)."""
+    stats = dict(stats or {})
+    for col in table.colnames:
+        col_stats = column_stats(table[col])
+        stats[col] = merge_column_stats(stats[col], col_stats) if col in stats else col_stats
+    return stats
+
+def _int_type_for_range(low, high):
+    for pg_type, type_min, type_max in INT_PG_TYPES:
+        if type_min <= low and high <= type_max:
+            return pg_type
+    return "NUMERIC"
+
+def pg_type_from_stats(stats, narrow_integers=False):
+    """
+    Smallest PostgreSQL type holding every value described by `stats` (see `column_stats`).
+
+    Integers get the type of their numpy width (int16 -> SMALLINT, int32 -> INTEGER,
+    int64 / uint32 -> BIGINT), wider when the values need it (uint64 above the BIGINT
+    range -> NUMERIC); with `narrow_integers` the smallest type holding the sampled
+    min / max is used instead, which is only safe when the sample covers the data.
+    Floats are REAL when every file stores float32, DOUBLE PRECISION otherwise.
+    Returns None for object columns, left to `infer_pg_type`.
+    """
+    kind, itemsize = stats["kind"], stats["itemsize"]
+    if kind == "O":
+        return None
+    if stats["shape"]:
+        if kind == "b":
+            return "BOOLEAN[]"
+        if kind in "iu":
+            return "BIGINT[]"
+        if kind == "f":
+            return "FLOAT4[]" if itemsize <= 4 else "FLOAT8[]"
+        return "TEXT[]"
+
+    if kind == "b":
+        return "BOOLEAN"
+    if kind == "f":
+        return "FLOAT4" if itemsize <= 4 else "FLOAT8"
+    if kind in "iu":
+        if kind == "i":
+            width_type = {1: "SMALLINT", 2: "SMALLINT", 4: "INTEGER"}.get(itemsize, "BIGINT")
+        else:
+            width_type = {1: "SMALLINT", 2: "INTEGER"}.get(itemsize, "BIGINT")
+        if stats["min"] is None:  # only nulls in the sample
+            return width_type
+        range_type = _int_type_for_range(stats["min"], stats["max"])
+        if narrow_integers:
+            return range_type
+        order = [pg_type for pg_type, _, _ in INT_PG_TYPES] + ["NUMERIC"]
+        return max(width_type, range_type, key=order.index)
+    return "TEXT"
+
 def convert_table_to_postgres_records(table):
     """Optimized conversion of an `astropy.table.Table` for PostgreSQL `COPY` bulk insert.
        Converts masked columns to replace masked values with `None`.
@@ -11,8 +11,8 @@ import numpy as np
 import warnings
 warnings.filterwarnings("ignore")
 
-def open_table(table_name, config):
-	
+def resolve_format(table_name, config):
+	"""Return the reader format for `table_name`, honouring `config["format"]`."""
 	if "format" in config:
 		format = config["format"]
 	else:
@@ -20,6 +20,25 @@ def open_table(table_name, config):
 	
 	if format == "auto":
 		format = table_name.split(".")[-1]
+	return format
+
+def open_table(table_name, config, row_range=None):
+	"""
+	Read `table_name` into an astropy Table.
+
+	`row_range` is an optional (start, stop) pair. FITS binary tables and parquet
+	files read only those rows; other formats are read whole and sliced.
+	"""
+	format = resolve_format(table_name, config)
+	
+	if row_range is not None:
+		if format == "fits":
+			return _read_fits_rows(table_name, *row_range)
+		if ".parquet" in table_name or format == "parquet":
+			return _read_parquet_rows(table_name, *row_range)
+		
+		table = open_table(table_name, config)
+		return table[row_range[0]:row_range[1]]
 	
 	if format == "gaia":
 		control.info(f"reading table {table_name} with format {format}")
@@ -45,12 +64,7 @@ def open_table(table_name, config):
 	if format == "fits":
 		table = Table.read(table_name)
 	elif ".parquet" in table_name or format == "parquet":
-		try:
-			table = Table.read(table_name, format="parquet")
-		except Exception as e:
-			#control.critical(f"Error reading parquet file, falling back to pandas: {e}")
-			table = pd.read_parquet(table_name)
-			table = Table.from_pandas(table)
+		table = _read_parquet(table_name)
 	
  
 	elif ".csv" in table_name or format == "csv":
@@ -61,6 +75,171 @@ def open_table(table_name, config):
 
 
 
+def _first_table_hdu(hdul):
+	for idx, hdu in enumerate(hdul):
+		if isinstance(hdu, (fits.BinTableHDU, fits.TableHDU)):
+			return idx
+	raise ValueError("no table HDU found")
+
+def read_table_shape(table_name, config):
+	"""
+	(number of rows, bytes per row) of `table_name`, read from its header / footer only.
+	Returns (None, None) for formats where this is not cheaply available.
+	"""
+	format = resolve_format(table_name, config)
+	if format == "fits":
+		with fits.open(table_name, memmap=True) as hdul:
+			header = hdul[_first_table_hdu(hdul)].header
+			n_rows = header["NAXIS2"]
+			# variable length arrays live in the heap (PCOUNT bytes)
+			heap = header.get("PCOUNT", 0) / n_rows if n_rows else 0
+			return n_rows, header["NAXIS1"] + heap
+	if ".parquet" in table_name or format == "parquet":
+		import pyarrow.parquet as pq
+		metadata = pq.ParquetFile(table_name).metadata
+		if not metadata.num_rows:
+			return 0, 0
+		uncompressed = sum(metadata.row_group(rg).total_byte_size for rg in range(metadata.num_row_groups))
+		return metadata.num_rows, uncompressed / metadata.num_rows
+	return None, None
+
+def parquet_row_group_bounds(path):
+	"""Row offsets where the row groups of a parquet file start, followed by the number of rows."""
+	import pyarrow.parquet as pq
+	metadata = pq.ParquetFile(path).metadata
+	bounds = [0]
+	for rg in range(metadata.num_row_groups):
+		bounds.append(bounds[-1] + metadata.row_group(rg).num_rows)
+	return bounds
+
+def _read_fits_rows(path, start, stop):
+	"""Read rows [start, stop) of the first table HDU through memmap."""
+	with fits.open(path, memmap=True) as hdul:
+		idx = _first_table_hdu(hdul)
+		# slicing the memmapped FITS_rec only touches the requested rows
+		hdu = fits.BinTableHDU(data=hdul[idx].data[start:stop].copy(), header=hdul[idx].header)
+		table = Table.read(hdu)
+	# read from an HDU, character columns come back as str; `Table.read(path)` keeps them as bytes
+	table.convert_unicode_to_bytestring()
+	return table
+
+def _read_parquet_rows(path, start, stop):
+	"""Read rows [start, stop) of a parquet file, touching only the row groups that overlap."""
+	import pyarrow as pa
+	import pyarrow.parquet as pq
+
+	pf = pq.ParquetFile(path)
+	groups = []
+	offset = None
+	first_row = 0
+	for rg in range(pf.metadata.num_row_groups):
+		n = pf.metadata.row_group(rg).num_rows
+		if first_row < stop and first_row + n > start:
+			if offset is None:
+				offset = start - first_row
+			groups.append(rg)
+		first_row += n
+	
+	arrow_table = pf.read_row_groups(groups).slice(offset or 0, stop - start)
+	if _astropy_reads_parquet(pf):
+		try:
+			return _arrow_to_table(arrow_table)
+		except Exception:
+			pass
+	return Table.from_pandas(arrow_table.to_pandas())
+
+def _arrow_to_table(arrow_table):
+	"""
+	Astropy table of an in-memory Arrow table, converted column by column as the astropy
+	parquet reader does for whole files (strings, fixed size lists, `table_meta_yaml` units
+	and mixins), so row ranges and whole files give the same columns. Strings are as wide as
+	the `table::len::` metadata, else as the longest one of the rows read.
+	"""
+	import pyarrow as pa
+	import pyarrow.compute as pc
+	from astropy.table import meta, serialize
+
+	def is_text(t):
+		return pa.types.is_string(t) or pa.types.is_large_string(t) or pa.types.is_binary(t) or pa.types.is_large_binary(t)
+
+	schema = arrow_table.schema
+	md = {k.decode(): v.decode() for k, v in (schema.metadata or {}).items()}
+	meta_hdr = meta.get_header_from_yaml(md["table_meta_yaml"].split("\n")) if "table_meta_yaml" in md else None
+	table = Table(meta=(meta_hdr or {}).get("meta", {}))
+	for field in schema:
+		t = field.type
+		col = arrow_table[field.name].to_numpy()
+		value_type = t.value_type if isinstance(t, (pa.FixedSizeListType, pa.ListType)) else t
+		if is_text(value_type):
+			values = arrow_table[field.name]
+			if value_type is not t:
+				values = pc.list_flatten(values)
+			if f"table::len::{field.name}" in md:
+				strlen = int(md[f"table::len::{field.name}"])
+			else:
+				lengths = pc.binary_length(values)
+				strlen = max(pc.max(lengths).as_py() or 0, 1)
+			strname = f"U{strlen}" if pa.types.is_string(value_type) or pa.types.is_large_string(value_type) else f"|S{strlen}"
+		if is_text(t):
+			col = col.astype(strname)
+		elif isinstance(t, pa.FixedSizeListType):
+			if len(col) > 0:
+				col = np.stack(col)
+				if is_text(value_type):
+					col = col.astype(strname)
+			else:
+				col = np.zeros((0, t.list_size), dtype=strname if is_text(value_type) else value_type.to_pandas_dtype())
+		elif isinstance(t, pa.ListType) and is_text(value_type):
+			col = np.array([row.astype(strname) for row in col], dtype=np.object_)
+		table.add_column(Column(name=field.name, data=col))
+
+	if meta_hdr is not None:
+		header_cols = {x["name"]: x for x in meta_hdr["datatype"]}
+		for col in table.columns.values():
+			for attr in ("description", "format", "unit", "meta"):
+				if attr in header_cols.get(col.name, {}):
+					setattr(col, attr, header_cols[col.name][attr])
+	return serialize._construct_mixins_from_columns(table)
+
+def _astropy_reads_parquet(pf):
+	"""
+	False when the astropy parquet reader fails on the file: a string / binary column
+	without `table::len::` metadata may hold nulls (row group statistics). Those files are
+	read through pandas, whole or by row range, so both give the same columns.
+	"""
+	import pyarrow as pa
+
+	schema = pf.schema_arrow
+	md = schema.metadata or {}
+	leaves = {}
+	for j in range(pf.metadata.num_columns):
+		leaves.setdefault(pf.schema.column(j).path.split(".")[0], []).append(j)
+	for field in schema:
+		value_type = getattr(field.type, "value_type", field.type)
+		if not (pa.types.is_string(value_type) or pa.types.is_large_string(value_type)
+				or pa.types.is_binary(value_type) or pa.types.is_large_binary(value_type)):
+			continue
+		if f"table::len::{field.name}".encode() in md:
+			continue
+		for rg in range(pf.metadata.num_row_groups):
+			for j in leaves.get(field.name, []):
+				stats = pf.metadata.row_group(rg).column(j).statistics
+				if stats is None or not stats.has_null_count or stats.null_count:
+					return False
+	return True
+
+def _read_parquet(path):
+	"""Read a whole parquet file, see `_astropy_reads_parquet`."""
+	import pyarrow.parquet as pq
+
+	if _astropy_reads_parquet(pq.ParquetFile(path)):
+		try:
+			return Table.read(path, format="parquet")
+		except Exception:
+			pass
+	return Table.from_pandas(pd.read_parquet(path))
+
+
 def _read_desi_coadd_as_table(path):
 	"""
 	Read DESI DR1 coadd FITS file and return a Table with:
@@ -1,12 +1,14 @@
 import argparse
 
-from astroinject.pipeline.apply_index import apply_pgsphere_index, apply_q3c_index, apply_btree_index
+from astroinject.pipeline.apply_index import apply_pgsphere_index, apply_q3c_index, apply_brin_index, apply_btree_index, build_indexes
 from astroinject.pipeline.injection import injection_procedure, create_table, parallel_insertion
+from astroinject.pipeline.sinks import uses_database
+from astroinject.pipeline.watch import watch_folder
 
-from astroinject.utils import find_files_with_pattern
+from astroinject.utils import iter_files_with_pattern
 from astroinject.config import load_config
 
-from astroinject.pipeline.map_tap_schema import map_table
+from astroinject.pipeline.map_tap_schema import map_table, map_schema
 
 import warnings
 import logpool as control
@@ -18,33 +20,42 @@ def injection():
     
     parser.add_argument("-b", "--baseconfig", help="Base database config file")
     parser.add_argument("-c", "--tableconfig", help="Table specifig config file")
+    parser.add_argument("--profile", nargs="?", const="astroinject_profile.json", default=None,
+                        help="Record wall/CPU time and peak memory of every stage per file and write a report (default: astroinject_profile.json)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and load new or changed files of the folder into the existing table")
+    parser.add_argument("--watch_baseline", action="store_true",
+                        help="With --watch, consider the files already in the folder as loaded")
     args = parser.parse_args()
 
     config = load_config(args.baseconfig)
     config.update(load_config(args.tableconfig))
+    if args.profile:
+        config["profile"] = args.profile
+
+    if args.watch:
+        control.info("starting watch procedure")
+        watch_folder(config, baseline=args.watch_baseline)
+        return
 
     control.info("starting injection procedure")
     control.info(f"config: \n{config}")
     
-    files = find_files_with_pattern(
+    # files are loaded while the folder is still being walked
+    files = iter_files_with_pattern(
         config["folder"],
-        config["pattern"]
+        config["pattern"],
+        workers=config["general"].get("discovery_threads", 8),
     )
     
-    control.info(f"found {len(files)} files to inject")
-    
     parallel_insertion(files, config)
     
-    if "additional_btree_index" in config and config["additional_btree_index"]:
-        control.info("creating additional B-Tree index")
-        apply_btree_index(config)
+    if not uses_database(config):
+        control.info("no postgres sink configured, skipping index creation")
+        return
     
-    if not "index_type" in config or config["index_type"] is None:
-        control.info("no index type specified, skipping index creation")
-    elif config["index_type"] == "pgsphere":
-        apply_pgsphere_index(config)
-    elif config["index_type"] == "q3c":
-        apply_q3c_index(config)
+    # btree and spatial indexes are built at the same time, see `general.index_jobs`
+    build_indexes(config)
 
 def create_schema_command():
     from astroinject.database.dbpool import PostgresConnectionManager
@@ -72,11 +83,12 @@ def create_index_command():
     parser = argparse.ArgumentParser(description="Create indexes on a table in the database")
     
     parser.add_argument("-b", "--baseconfig", help="Base database config file")
-    parser.add_argument("-i", "--index_type", choices=["pgsphere", "q3c", "btree"], help="Type of index to create")
+    parser.add_argument("-i", "--index_type", choices=["pgsphere", "q3c", "brin", "btree"], help="Type of index to create")
     parser.add_argument("-st", "--schema_table", help="Table to create indexes on (format: schema.table)")
     parser.add_argument("-ra", "--ra_col", help="Column name for Right Ascension")
     parser.add_argument("-dec", "--dec_col", help="Column name for Declination")
     parser.add_argument("-c", "--target_col", nargs='*', help="Additional columns for B-Tree index creation")
+    parser.add_argument("--fill_pixel_column", action="store_true", help="brin: add and fill the pixel column of a table loaded without it (rewrites every row)")
     
     args = parser.parse_args()
 
@@ -90,6 +102,8 @@ def create_index_command():
     config["ra_col"] = args.ra_col.lower() if args.ra_col else None
     config["dec_col"] = args.dec_col.lower() if args.dec_col else None
     config["additional_btree_index"] = [args.target_col] if not isinstance(args.target_col, list) else args.target_col
+    if args.fill_pixel_column:
+        config.setdefault("general", {})["fill_pixel_column"] = True
     
     control.info("starting index creation procedure")
     
@@ -97,6 +111,8 @@ def create_index_command():
         apply_pgsphere_index(config)
     elif args.index_type == "q3c":
         apply_q3c_index(config)
+    elif args.index_type == "brin":
+        apply_brin_index(config)
     elif args.index_type == "btree":
         apply_btree_index(config)
     
@@ -146,11 +162,16 @@ def map_table_command():
     
     parser.add_argument("-b", "--baseconfig", help="Base database config file")
     parser.add_argument("-c", "--tableconfig", help="Table specifig config file")
+    parser.add_argument("--schema", help="Map every table and view of this schema instead of the table of --tableconfig")
     args = parser.parse_args()
 
     config = load_config(args.baseconfig)
-    config.update(load_config(args.tableconfig))
+    if args.tableconfig:
+        config.update(load_config(args.tableconfig))
     
     control.info("starting mapping procedure")
-    map_table(config)
+    if args.schema:
+        map_schema(config, args.schema)
+    else:
+        map_table(config)
     control.info("finished mapping procedure")
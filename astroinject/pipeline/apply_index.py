@@ -1,27 +1,57 @@
 from astroinject.database.dbpool import PostgresConnectionManager
-from astroinject.database.gen_index_queries import make_pg_sphere_index, make_q3c_index
-from astroinject.database.gen_base_queries import vacuum_query
+from astroinject.database.gen_index_queries import make_pg_sphere_index, make_q3c_index, make_brin_index, make_pixel_column, PIXEL_FUNCTIONS, PIXEL_COLUMN_QUERY
+from astroinject.spatial import pixel_column
+from astroinject.database.gen_base_queries import maintenance_query
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import logpool as control 
 
+def maintenance_mode(config):
+    """
+    Maintenance run once after a table's indexes are built, `general.post_load_maintenance`:
+    "vacuum_analyze", "analyze", "none" or "auto" (default): ANALYZE only when the table was
+    created by this run (`config["fresh_table"]`, nothing to vacuum after COPY into a
+    new table) or gets a q3c index (as `index_schema` always did), VACUUM ANALYZE otherwise.
+    """
+    mode = config.get("general", {}).get("post_load_maintenance") or "auto"
+    if mode not in ("auto", "vacuum_analyze", "analyze", "none"):
+        raise ValueError(f"unknown post_load_maintenance {mode}, use auto, vacuum_analyze, analyze or none")
+    if mode == "auto":
+        mode = "analyze" if config.get("fresh_table") or config.get("index_type") == "q3c" else "vacuum_analyze"
+    return mode
+
+def run_maintenance(config, pg_conn=None):
+    """Run the single maintenance pass of `config["tablename"]`, see `maintenance_mode`."""
+    query = maintenance_query(config["tablename"], maintenance_mode(config))
+    if query is None:
+        control.info(f"skipping maintenance of {config['tablename']}")
+        return
+
+    own_conn = pg_conn is None
+    if own_conn:
+        pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    control.info(f"executing:\n{query}")
+    pg_conn.execute_query_wt_tblock(query)
+    if own_conn:
+        pg_conn.close()
+
 def apply_pgsphere_index(config):
     index_query = make_pg_sphere_index(config["tablename"], config["ra_col"], config["dec_col"])
-    vacuum_q = vacuum_query(config["tablename"])
     
     pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
     control.info(f"executing:\n{index_query}")
     
     pg_conn.execute_query(index_query)
     
-    control.info(f"executing:\n{vacuum_q}")
-    pg_conn.execute_query_wt_tblock(vacuum_q)
+    run_maintenance(config, pg_conn)
     
     pg_conn.close()
     control.info("done applying indexes.")
     
 def apply_q3c_index(config):
     index_query, index_name = make_q3c_index(config["tablename"], config["ra_col"], config["dec_col"])
-    #vacuum_q = vacuum_query(config["tablename"])
     
     pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
     control.info(f"executing:\n{index_query}")
@@ -31,15 +61,86 @@ def apply_q3c_index(config):
     # control.info(f"executing cluster")
     # pg_conn.execute_query_wt_tblock(f"""CLUSTER {config["tablename"]} USING {index_name};""")
     
-    control.info(f"executing analyze")
-    pg_conn.execute_query_wt_tblock(f"""ANALYZE {config["tablename"]};""")
+    run_maintenance(config, pg_conn)
+    
+    pg_conn.close()
+    control.info("done applying indexes.")
+    
+def pixel_column_queries(config, exists):
+    """
+    Queries giving `config["tablename"]` its stored pixel column (`pixel_col`) before the BRIN index.
+
+    None when the column `exists`: the workers filled it while loading (`add_pixel_column`).
+    Filling a table loaded without it rewrites every row (then VACUUM), so it is only done
+    with `general.fill_pixel_column` (`--fill_pixel_column`), otherwise ValueError.
+    """
+    pixel_col, order = pixel_column(config)
+    if not config.get("general", {}).get("fill_pixel_column"):
+        if exists:
+            return []
+        raise ValueError(
+            f"{config['tablename']} has no {pixel_col} column; set general.fill_pixel_column "
+            f"(--fill_pixel_column) to add and fill it, which rewrites every row"
+        )
+    control.warn(f"filling {pixel_col} of {config['tablename']}: rows are rewritten, the table needs a VACUUM")
+    return make_pixel_column(config["tablename"], config["ra_col"], config["dec_col"], pixel_col, order)
+
+def index_prerequisites(config, conn=None, functions=True):
+    """
+    (description, query) to run once, in order, before the CREATE INDEX of `index_queries`.
+    The catalog is read on `conn` (psycopg2 connection) when given, else on a new connection.
+    Without `functions` the `PIXEL_FUNCTIONS` are left out, for callers that created them
+    once before building the indexes of several tables at the same time.
+    """
+    if config.get("index_type") != "brin":
+        return []
+    params = (config["tablename"], pixel_column(config)[0].lower())
+    if conn is not None:
+        with conn.cursor() as cur:
+            cur.execute(PIXEL_COLUMN_QUERY, params)
+            exists = cur.fetchall()
+    else:
+        pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+        try:
+            exists = pg_conn.execute_query(PIXEL_COLUMN_QUERY, params, fetch=True)
+        finally:
+            pg_conn.close()
+    pixel_queries = pixel_column_queries(config, bool(exists))
+    queries = [("cone search functions", PIXEL_FUNCTIONS)] if functions else []
+    return queries + [("pixel column", query) for query in pixel_queries]
+
+def apply_brin_index(config):
+    """
+    BRIN index on the stored HEALPix pixel column (`pixel_col`, default hpx, at `pixel_order`),
+    see `pixel_column_queries` for tables loaded without it. The index only pays off when
+    the rows are in spatial order (see `spatial_sort`).
+    Also (re)creates the `astroinject_*` SQL helpers used by cone searches.
+    """
+    pixel_col, order = pixel_column(config)
+    index_query, index_name = make_brin_index(config["tablename"], pixel_col, config.get("brin_pages_per_range", 32))
+    try:
+        prerequisites = index_prerequisites(dict(config, index_type="brin"))
+    except ValueError as e:
+        control.critical(str(e))
+        return
+    
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    for _, query in prerequisites:
+        control.info(f"executing:\n{query}")
+        pg_conn.execute_query(query)
+    
+    control.info(f"executing:\n{index_query}")
+    pg_conn.execute_query(index_query)
+    
+    run_maintenance(config, pg_conn)
     
     pg_conn.close()
     control.info("done applying indexes.")
     
 def apply_btree_index(config):
     """
-    Applies a B-Tree index to the specified table.
+    Applies a B-Tree index on every column of `additional_btree_index`,
+    then runs a single maintenance pass (see `maintenance_mode`).
     """
     
     if "additional_btree_index" not in config:
@@ -48,19 +149,114 @@ def apply_btree_index(config):
     if not isinstance(config["additional_btree_index"], list):
         config["additional_btree_index"] = [config["additional_btree_index"]]
     
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
     for col in config["additional_btree_index"]:
-        if col not in config["additional_btree_index"]:
-            control.warn(f"Column {col} not found in table {config['tablename']}. Skipping B-Tree index creation.")
-            continue
-        
-        index_query = f"CREATE INDEX IF NOT EXISTS {config['tablename'].replace('.', '_')}_{col}_btree ON {config['tablename']} USING btree ({col});"
-        vacuum_q = vacuum_query(config["tablename"])
-        
-        pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+        index_query = btree_index_query(config, col)
         control.info(f"executing:\n{index_query}")
         pg_conn.execute_query(index_query)
-        control.info(f"executing:\n{vacuum_q}")
-        pg_conn.execute_query_wt_tblock(vacuum_q)
-        pg_conn.close()
-        control.info("done applying B-Tree indexes.")
-    
\ No newline at end of file
+    
+    run_maintenance(config, pg_conn)
+    pg_conn.close()
+    control.info("done applying B-Tree indexes.")
+
+def btree_index_query(config, col):
+    return f"CREATE INDEX IF NOT EXISTS {config['tablename'].replace('.', '_')}_{col}_btree ON {config['tablename']} USING btree ({col});"
+
+def index_queries(config):
+    """(description, CREATE INDEX query) of every index requested by the table config."""
+    queries = []
+    btree_cols = config.get("additional_btree_index") or []
+    if not isinstance(btree_cols, list):
+        btree_cols = [btree_cols]
+    for col in btree_cols:
+        queries.append((f"btree on {col}", btree_index_query(config, col)))
+
+    if config.get("index_type") == "pgsphere":
+        queries.append(("pgsphere", make_pg_sphere_index(config["tablename"], config["ra_col"], config["dec_col"])))
+    elif config.get("index_type") == "q3c":
+        queries.append(("q3c", make_q3c_index(config["tablename"], config["ra_col"], config["dec_col"])[0]))
+    elif config.get("index_type") == "brin":
+        # the pixel column was filled by the workers (see `index_prerequisites`)
+        pixel_col, _ = pixel_column(config)
+        queries.append(("brin", make_brin_index(config["tablename"], pixel_col, config.get("brin_pages_per_range", 32))[0]))
+    return queries
+
+def _build_index(config, description, query, settings, conn=None):
+    """
+    Run one CREATE INDEX (or prerequisite) with the session `settings`, on `conn`
+    (autocommit psycopg2 connection) when given, else on its own connection.
+    """
+    pg_conn = None
+    if conn is None:
+        pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+        conn = pg_conn.get_connection()
+        conn.autocommit = True
+    try:
+        start = time.perf_counter()
+        with conn.cursor() as cur:
+            for setting, value in settings.items():
+                cur.execute(f"SET {setting} = %s;", (value,))
+            control.info(f"executing:\n{query}")
+            cur.execute(query)
+        control.info(f"{config['tablename']}: {description} done in {time.perf_counter() - start:.1f}s")
+    finally:
+        if pg_conn is not None:
+            pg_conn.close()
+
+def build_indexes(config, conn=None, functions=True):
+    """
+    Build every index requested by the table config (`additional_btree_index` and
+    `index_type`) at the same time, each on its own connection, at most `general.index_jobs`
+    (default 2) at once, then run one maintenance pass (see `maintenance_mode`).
+    With `conn` (autocommit psycopg2 connection, e.g. an `index_schema` worker's) everything
+    runs on it, one statement after the other, and no other session is opened.
+    `functions=False` skips the `CREATE OR REPLACE FUNCTION` of the BRIN helpers: sessions
+    replacing the same function at once fail with "tuple concurrently updated".
+
+    `general.maintenance_work_mem` and `general.max_parallel_maintenance_workers` are set
+    on every session when given; memory use is up to `index_jobs` x `maintenance_work_mem`.
+    Returns the number of indexes that failed (all of them when a prerequisite failed).
+    """
+    queries = index_queries(config)
+    if not queries:
+        control.info("no index requested, skipping index creation")
+        return 0
+
+    general = config.get("general", {})
+    jobs = 1 if conn is not None else max(1, min(general.get("index_jobs", 2), len(queries)))
+    settings = {}
+    for setting in ("maintenance_work_mem", "max_parallel_maintenance_workers"):
+        if general.get(setting) is not None:
+            settings[setting] = str(general[setting])
+
+    try:
+        # functions / columns the indexes need, once and before any of them
+        for description, query in index_prerequisites(config, conn, functions):
+            _build_index(config, description, query, settings, conn)
+    except Exception as e:
+        control.critical(f"{config['tablename']}: no index built, {e}")
+        return len(queries)
+
+    control.info(f"building {len(queries)} indexes on {config['tablename']}, {jobs} at a time")
+    failed = 0
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {executor.submit(_build_index, config, f"{description} index", query, settings, conn): description
+                   for description, query in queries}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception as e:
+                failed += 1
+                control.critical(f"{config['tablename']}: {futures[future]} failed: {e}")
+
+    if conn is None:
+        run_maintenance(config)
+    else:
+        query = maintenance_query(config["tablename"], maintenance_mode(config))
+        if query is not None:
+            try:
+                _build_index(config, "maintenance", query, {}, conn)
+            except Exception as e:
+                control.critical(f"{config['tablename']}: maintenance failed: {e}")
+    control.info(f"done applying indexes ({failed} failed).")
+    return failed
@@ -0,0 +1,120 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from astroinject.io import resolve_format, parquet_row_group_bounds
+from astroinject.pipeline.scheduler import split_row_ranges
+from astroinject.database.dbpool import PostgresConnectionManager
+
+# checkpoints of the database sink, written in the transaction of each chunk's COPY
+CHECKPOINT_TABLE_QUERY = """
+CREATE TABLE IF NOT EXISTS astroinject_checkpoints (
+    table_name TEXT NOT NULL,
+    task TEXT NOT NULL,
+    state JSONB NOT NULL,
+    updated TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (table_name, task)
+);
+"""
+
+SAVE_CHECKPOINT_QUERY = """
+INSERT INTO astroinject_checkpoints (table_name, task, state) VALUES (%s, %s, %s)
+ON CONFLICT (table_name, task) DO UPDATE SET state = EXCLUDED.state, updated = now();
+"""
+
+LOAD_CHECKPOINT_QUERY = "SELECT state FROM astroinject_checkpoints WHERE table_name = %s AND task = %s;"
+
+CLEAR_CHECKPOINTS_QUERY = "DELETE FROM astroinject_checkpoints WHERE table_name = %s;"
+
+def checkpoint_rows(config, filepath):
+    """
+    Rows committed per chunk when intra-file checkpoints apply to `filepath`
+    (`general.checkpoint_rows`, FITS binary tables and parquet only), else None.
+    """
+    rows = config.get("general", {}).get("checkpoint_rows")
+    if not rows or not isinstance(filepath, str):
+        return None
+    format = resolve_format(filepath, config)
+    if format != "fits" and format != "parquet" and ".parquet" not in filepath:
+        return None
+    return rows
+
+def chunk_ranges(filepath, start, stop, rows, config):
+    """
+    Consecutive (start, stop) chunks of about `rows` rows covering [start, stop).
+    Parquet chunks end on row group boundaries, so each chunk reads whole row groups.
+    """
+    bounds = parquet_row_group_bounds(filepath) if resolve_format(filepath, config) != "fits" else None
+    return split_row_ranges(stop, rows, bounds, start)
+
+def table_hash(table):
+    """Hash of the rows of an astropy table as read from the file (values and masks)."""
+    digest = hashlib.sha1()
+    for col in table.colnames:
+        data = table[col]
+        if data.dtype == object:
+            digest.update(repr(data.tolist()).encode())
+        else:
+            digest.update(np.ascontiguousarray(data).tobytes())
+        if hasattr(data, "mask"):
+            digest.update(np.ascontiguousarray(np.ma.getmaskarray(data)).tobytes())
+    return digest.hexdigest()
+
+def checkpoint_key(filepath, row_range):
+    """Name of the checkpoint of one task (a file or a row range of it)."""
+    return f"{os.path.basename(filepath)}.{hashlib.sha1(f'{os.path.abspath(filepath)}|{row_range}'.encode()).hexdigest()[:16]}"
+
+def checkpoint_path(config, filepath, row_range):
+    """Checkpoint file of one task in `general.checkpoint_dir` (default <tablename>.checkpoints)."""
+    folder = config.get("general", {}).get("checkpoint_dir") or f"{config['tablename']}.checkpoints"
+    return os.path.join(folder, f"{checkpoint_key(filepath, row_range)}.json")
+
+def load_checkpoint(path):
+    """{"task", "file", "row_range", "offset", "chunk", "chunk_hash", "complete"} or None."""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def save_checkpoint(path, checkpoint):
+    """Write the checkpoint atomically (write + rename), creating the folder if needed."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f, indent=1)
+    os.replace(tmp, path)
+
+def checkpoint_statement(config, checkpoint):
+    """(query, params) saving `checkpoint` in `astroinject_checkpoints`, run by `PostgresSink` before its COMMIT."""
+    return SAVE_CHECKPOINT_QUERY, (config["tablename"], checkpoint["task"], json.dumps(checkpoint))
+
+def create_checkpoint_table(config):
+    """Create `astroinject_checkpoints` (once, before the workers start)."""
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    pg_conn.execute_query(CHECKPOINT_TABLE_QUERY)
+    pg_conn.close()
+
+def load_db_checkpoint(config, task):
+    """Checkpoint of `task` in `astroinject_checkpoints`, or None."""
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    try:
+        rows = pg_conn.execute_query(LOAD_CHECKPOINT_QUERY, (config["tablename"], task), fetch=True)
+    finally:
+        pg_conn.close()
+    return rows[0][0] if rows else None
+
+def save_db_checkpoint(config, checkpoint):
+    """Save `checkpoint` on its own, for chunks that did not COPY anything (skipped, empty)."""
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    pg_conn.execute_query(*checkpoint_statement(config, checkpoint))
+    pg_conn.close()
+
+def clear_db_checkpoints(config):
+    """Forget the checkpoints of `config["tablename"]`, for a table created again (its rows are gone)."""
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    found = pg_conn.execute_query("SELECT to_regclass('astroinject_checkpoints');", fetch=True)
+    if found and found[0][0]:
+        pg_conn.execute_query(CLEAR_CHECKPOINTS_QUERY, (config["tablename"],))
+    pg_conn.close()
@@ -1,12 +1,140 @@
 import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from astroinject.config import load_config
 import logpool as control
-from astroinject.pipeline.apply_index import apply_pgsphere_index, apply_q3c_index, apply_btree_index
+from astroinject.spatial import pixel_column
+from astroinject.pipeline.apply_index import build_indexes
+from astroinject.database.gen_index_queries import PIXEL_FUNCTIONS
+
+def _connect(base_config):
+    """Autocommit connection from the `database` section of a base config (or the config itself)."""
+    import psycopg2
+
+    cfg = base_config.get("database", base_config)
+    if "dsn" in cfg:
+        conn = psycopg2.connect(cfg["dsn"])
+    else:
+        conn = psycopg2.connect(
+            host=cfg.get("host"),
+            port=cfg.get("port"),
+            dbname=cfg.get("dbname"),
+            user=cfg.get("user"),
+            password=cfg.get("password"),
+        )
+    conn.autocommit = True
+    return conn
+
+def run_table_jobs(tables, jobs, base_config, work):
+    """
+    Call `work(conn, i, table)` for every table, `jobs` tables at a time, each worker thread
+    on its own connection. Tables are started in the given order.
+    Yields `(i, table, result, error)` as tables finish.
+    """
+    local = threading.local()
+    connections = []
+    lock = threading.Lock()
+
+    def run(i, tbl):
+        if not hasattr(local, "conn"):
+            local.conn = _connect(base_config)
+            with lock:
+                connections.append(local.conn)
+        return work(local.conn, i, tbl)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = {executor.submit(run, i, tbl): (i, tbl) for i, tbl in enumerate(tables, start=1)}
+            for future in as_completed(futures):
+                i, tbl = futures[future]
+                try:
+                    yield i, tbl, future.result(), None
+                except Exception as e:
+                    yield i, tbl, None, e
+    finally:
+        for conn in connections:
+            conn.close()
+
+# catalog of every target table of a schema-wide command, see `schema_snapshot`
+SNAPSHOT_INDEXES_QUERY = """
+SELECT t.relname, i.relname, am.amname, pg_get_indexdef(ix.indexrelid), ix.indisunique, ix.indnatts,
+       ARRAY(SELECT opc.opcname FROM unnest(ix.indclass::oid[]) AS ic(opclass_oid)
+             JOIN pg_opclass opc ON opc.oid = ic.opclass_oid),
+       ARRAY(SELECT a.attname FROM pg_attribute a
+             WHERE a.attrelid = t.oid AND a.attnum = ANY(ix.indkey) AND a.attnum > 0)
+FROM   pg_index ix
+JOIN   pg_class  i   ON i.oid = ix.indexrelid
+JOIN   pg_class  t   ON t.oid = ix.indrelid
+JOIN   pg_namespace n ON n.oid = t.relnamespace
+JOIN   pg_am     am  ON am.oid = i.relam
+WHERE  n.nspname = %s AND t.relname = ANY(%s)
+"""
+
+SNAPSHOT_COLUMNS_QUERY = """
+SELECT t.relname, a.attname, a.attnotnull
+FROM   pg_attribute a
+JOIN   pg_class t ON t.oid = a.attrelid
+JOIN   pg_namespace n ON n.oid = t.relnamespace
+WHERE  n.nspname = %s AND t.relname = ANY(%s) AND a.attnum > 0 AND NOT a.attisdropped
+ORDER BY t.relname, a.attnum
+"""
+
+SNAPSHOT_PKEYS_QUERY = """
+SELECT DISTINCT t.relname
+FROM   pg_constraint c
+JOIN   pg_class t ON t.oid = c.conrelid
+JOIN   pg_namespace n ON n.oid = t.relnamespace
+WHERE  n.nspname = %s AND t.relname = ANY(%s) AND c.contype = 'p'
+"""
+
+def schema_snapshot(conn, schema, tables):
+    """
+    Read indexes, columns and primary keys of all `tables` of `schema` at once.
+    Returns {table: {"indexes": [{"name", "am", "definition", "unique", "key_count", "opclasses", "columns"}],
+    "columns": {lower name: (name, not null)}, "has_pkey": bool}}.
+    """
+    snapshot = {table: {"indexes": [], "columns": {}, "has_pkey": False} for table in tables}
+    with conn.cursor() as cur:
+        cur.execute(SNAPSHOT_INDEXES_QUERY, (schema, list(tables)))
+        for table, name, am, definition, unique, key_count, opclasses, columns in cur.fetchall():
+            snapshot[table]["indexes"].append({
+                "name": name, "am": am, "definition": definition, "unique": unique, "key_count": key_count,
+                "opclasses": list(opclasses), "columns": list(columns),
+            })
+
+        cur.execute(SNAPSHOT_COLUMNS_QUERY, (schema, list(tables)))
+        for table, name, notnull in cur.fetchall():
+            snapshot[table]["columns"][name.lower()] = (name, bool(notnull))
+
+        cur.execute(SNAPSHOT_PKEYS_QUERY, (schema, list(tables)))
+        for (table,) in cur.fetchall():
+            snapshot[table]["has_pkey"] = True
+    return snapshot
+
+def spatial_indexes(table_snapshot, index_type, pixel_col="hpx"):
+    """
+    Names of the spatial indexes of one table of a `schema_snapshot`:
+    pgsphere: GiST index with gist_spoint_ops or definition mentioning spoint(...)
+    q3c: any index (typically btree) whose definition uses q3c_ang2ipix(ra, dec)
+    brin: BRIN index on the HEALPix pixel column
+    """
+    found = []
+    for index in table_snapshot["indexes"]:
+        definition = index["definition"].lower()
+        if index_type == "pgsphere":
+            match = index["am"] == "gist" and ("gist_spoint_ops" in index["opclasses"] or "spoint(" in definition)
+        elif index_type == "q3c":
+            match = "q3c_ang2ipix(" in definition
+        else:
+            match = index["am"] == "brin" and pixel_col in index["columns"]
+        if match:
+            found.append(index["name"])
+    return found
 
 def index_schema():
     """
-    Create / recreate / drop spatial indexes (pgsphere GiST or q3c) across a schema or a single table.
+    Create / recreate / drop spatial indexes (pgsphere GiST, q3c or BRIN on a HEALPix pixel column) across a schema or a single table.
 
     Examples:
       # create missing pgsphere indexes across a schema
@@ -24,6 +152,12 @@ def index_schema():
       # only drop all q3c indexes (no re-create, no PK)
       astroinject index_schema_pgsphere -b base.yaml -s cat --drop_only --index-type q3c
 
+      # BRIN on a stored HEALPix pixel column (for tables loaded in spatial order)
+      astroinject index_schema_pgsphere -b base.yaml -s sky --index-type brin
+
+      # 4 tables at a time, largest first
+      astroinject index_schema_pgsphere -b base.yaml -s vac --index-type q3c --jobs 4
+
       # operate on a single table
       astroinject index_schema_pgsphere -b base.yaml -s public.mytable --recreate --index-type pgsphere
       astroinject index_schema_pgsphere -b base.yaml -s public.mytable --drop_only  --index-type q3c
@@ -33,7 +167,7 @@ def index_schema():
     from psycopg2 import sql
 
     parser = argparse.ArgumentParser(
-        description="Manage spatial indexes (pgsphere GiST or q3c) across a schema or a single table.",
+        description="Manage spatial indexes (pgsphere GiST, q3c or BRIN) across a schema or a single table.",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter,
     )
 
@@ -49,8 +183,8 @@ def index_schema():
                         help="Candidate names for DEC column (comma/semicolon/pipe-separated)")
     parser.add_argument("--include_partitions", action="store_true",
                         help="Also consider partitioned tables (relkind='p').")
-    parser.add_argument("--index-type", choices=["pgsphere", "q3c"], default="pgsphere",
-                        help="Index type to manage (pgsphere or q3c).")
+    parser.add_argument("--index-type", choices=["pgsphere", "q3c", "brin"], default="pgsphere",
+                        help="Index type to manage (pgsphere, q3c or brin).")
     parser.add_argument("--recreate", action="store_true",
                         help="Drop existing spatial indexes and recreate them.")
     parser.add_argument("--ensure_pk", action="store_true",
@@ -59,9 +193,15 @@ def index_schema():
                         help="ONLY drop existing spatial indexes; do NOT recreate; ignores --ensure_pk.")
     parser.add_argument("--dry_run", action="store_true",
                         help="Print intended actions without executing any DDL.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Tables processed at the same time, each on its own connection (index builds included: --jobs sessions in all).")
+    parser.add_argument("--fill_pixel_column", action="store_true",
+                        help="brin: add and fill the pixel column of tables loaded without it (rewrites every row).")
     args = parser.parse_args()
 
     base_config = load_config(args.baseconfig)
+    if args.fill_pixel_column:
+        base_config.setdefault("general", {})["fill_pixel_column"] = True
 
     def parse_list(s):
         if not s:
@@ -82,89 +222,9 @@ def index_schema():
         target_schema, target_table = args.schema, None
         single_table_mode = False
 
-    # --- queries ---
-    # pgsphere: GiST index with gist_spoint_ops or definition mentioning spoint(...)
-    PGS_INDEX_QUERY = """
-    SELECT i.relname AS index_name
-    FROM   pg_index ix
-    JOIN   pg_class  i   ON i.oid = ix.indexrelid
-    JOIN   pg_class  t   ON t.oid = ix.indrelid
-    JOIN   pg_namespace n ON n.oid = t.relnamespace
-    JOIN   pg_am     am  ON am.oid = i.relam
-    LEFT JOIN unnest(ix.indclass) WITH ORDINALITY AS ic(opclass_oid, ord) ON TRUE
-    LEFT JOIN pg_opclass opc   ON opc.oid = ic.opclass_oid
-    WHERE  n.nspname = %s
-    AND  t.relname = %s
-    AND  am.amname = 'gist'
-    AND (
-            opc.opcname = 'gist_spoint_ops'
-            OR pg_get_indexdef(ix.indexrelid) ILIKE '%%spoint(%%'
-        )
-    GROUP BY i.relname, ix.indexrelid
-    """
-
-    # q3c: any index (typically btree) whose definition uses q3c_ang2ipix(ra, dec)
-    Q3C_INDEX_QUERY = """
-    SELECT i.relname AS index_name
-    FROM   pg_index ix
-    JOIN   pg_class  i   ON i.oid = ix.indexrelid
-    JOIN   pg_class  t   ON t.oid = ix.indrelid
-    JOIN   pg_namespace n ON n.oid = t.relnamespace
-    WHERE  n.nspname = %s
-    AND    t.relname = %s
-    AND    pg_get_indexdef(ix.indexrelid) ILIKE '%%q3c_ang2ipix(%%'
-    GROUP BY i.relname, ix.indexrelid
-    """
-
-    COLS_QUERY = """
-    SELECT attname, attnotnull
-    FROM   pg_attribute
-    WHERE  attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped
-    """
-
-    HAS_PKEY_QUERY = """
-    SELECT 1
-    FROM   pg_constraint c
-    JOIN   pg_class t ON t.oid = c.conrelid
-    JOIN   pg_namespace n ON n.oid = t.relnamespace
-    WHERE  n.nspname = %s AND t.relname = %s AND c.contype = 'p'
-    LIMIT 1
-    """
-
-    UNIQUE_IDX_ON_ID_QUERY = """
-    SELECT i.relname
-    FROM   pg_index ix
-    JOIN   pg_class i ON i.oid = ix.indexrelid
-    JOIN   pg_class t ON t.oid = ix.indrelid
-    JOIN   pg_namespace n ON n.oid = t.relnamespace
-    WHERE  n.nspname = %s AND t.relname = %s
-      AND  ix.indisunique = true
-      AND  ix.indnatts = 1
-      AND  (SELECT a.attname FROM pg_attribute a
-            WHERE a.attrelid = t.oid AND a.attnum = ANY(ix.indkey)) = 'id'
-    LIMIT 1
-    """
-
-    def list_spatial_indexes(conn, schema, table):
-        query = PGS_INDEX_QUERY if args.index_type == "pgsphere" else Q3C_INDEX_QUERY
-        with conn.cursor() as cur:
-            cur.execute(query, (schema, table))
-            return [r[0] for r in cur.fetchall()]
-
-    def has_primary_key(conn, schema, table):
-        with conn.cursor() as cur:
-            cur.execute(HAS_PKEY_QUERY, (schema, table))
-            return cur.fetchone() is not None
-
-    def column_map(conn, schema, table):
-        regclass = f"{schema}.{table}"
-        with conn.cursor() as cur:
-            cur.execute(COLS_QUERY, (regclass,))
-            # {lower_name: (orig_name, attnotnull_bool)}
-            return {row[0].lower(): (row[0], bool(row[1])) for row in cur.fetchall()}
-
-    def find_ra_dec(conn, schema, table):
-        cmap = column_map(conn, schema, table)
+    def find_ra_dec(table):
+        # {lower_name: (orig_name, attnotnull_bool)}
+        cmap = snapshot[table]["columns"]
         ra  = next((cmap[c][0] for c in ra_list  if c in cmap), None)
         dec = next((cmap[c][0] for c in dec_list if c in cmap), None)
         return ra, dec
@@ -186,20 +246,20 @@ def index_schema():
 
     # PK helper (unchanged safety; skipped when --drop_only)
     def ensure_pk_on_id(conn, schema, table):
-        if has_primary_key(conn, schema, table):
+        if snapshot[table]["has_pkey"]:
             return "skip_pkey_exists"
-        cmap = column_map(conn, schema, table)
+        cmap = snapshot[table]["columns"]
         if "id" not in cmap:
             return "skip_no_safe_id"
         id_orig, id_notnull = cmap["id"]
         if not id_notnull:
             return "skip_no_safe_id"
 
+        unique_on_id = [index["name"] for index in snapshot[table]["indexes"]
+                        if index["unique"] and index["key_count"] == 1 and index["columns"] == ["id"]]
         with conn.cursor() as cur:
-            cur.execute(UNIQUE_IDX_ON_ID_QUERY, (schema, table))
-            row = cur.fetchone()
-            if row:
-                uniq_idx = row[0]
+            if unique_on_id:
+                uniq_idx = unique_on_id[0]
             else:
                 uniq_idx = f"ux_{schema}_{table}_id"
                 if args.dry_run:
@@ -239,18 +299,7 @@ def index_schema():
             return "attached_pk"
 
     # connect
-    cfg = base_config.get("database", base_config)
-    if "dsn" in cfg:
-        conn = psycopg2.connect(cfg["dsn"])
-    else:
-        conn = psycopg2.connect(
-            host=cfg.get("host"),
-            port=cfg.get("port"),
-            dbname=cfg.get("dbname"),
-            user=cfg.get("user"),
-            password=cfg.get("password"),
-        )
-    conn.autocommit = True
+    conn = _connect(base_config)
 
     # Only need extension check if we might CREATE. For drop-only, skip this.
     if not args.drop_only:
@@ -268,7 +317,7 @@ def index_schema():
                         )
                         conn.close()
                         sys.exit(1)
-                else:  # q3c
+                elif args.index_type == "q3c":
                     cur.execute(
                         "SELECT 1 FROM pg_extension "
                         "WHERE extname = 'q3c' LIMIT 1"
@@ -300,7 +349,7 @@ def index_schema():
         WHERE  n.nspname = %s
           AND  t.relkind IN ({relkind_clause})
           {{name_filter}}
-        ORDER BY t.relname;
+        ORDER BY t.relpages DESC, t.relname;
         """
         params = [target_schema]
         name_filter_sql = ""
@@ -317,57 +366,32 @@ def index_schema():
             conn.close()
             sys.exit(1)
 
+    # indexes, columns and primary keys of every target table in a few set-based queries
+    try:
+        snapshot = schema_snapshot(conn, target_schema, tables)
+    except Exception as e:
+        control.info(f"Could not read the catalog of schema '{target_schema}': {e}")
+        conn.close()
+        sys.exit(1)
+
     control.info(
         f"Target: {target_schema}{('.' + target_table) if single_table_mode else ''} ; "
         f"count={len(tables)} ; options: index_type={args.index_type}, "
         f"drop_only={args.drop_only}, recreate={args.recreate}, "
-        f"ensure_pk={args.ensure_pk and not args.drop_only}, dry_run={args.dry_run}"
+        f"ensure_pk={args.ensure_pk and not args.drop_only}, dry_run={args.dry_run}, jobs={args.jobs}"
     )
 
-    created=dropped=skipped_exists=skipped_missing_cols=pks_attached=pks_skipped=failed=0
-
-    for i, tbl in enumerate(tables, start=1):
-        try:
-            existing = list_spatial_indexes(conn, target_schema, tbl)
-            qnames = [f"{target_schema}.{name}" if "." not in name else name for name in existing]
-
-            # drop-only path
-            if args.drop_only:
-                if existing:
-                    if args.dry_run:
-                        control.info(
-                            f"[dry-run] would drop {args.index_type} index(es) "
-                            f"on {target_schema}.{tbl}: {existing}"
-                        )
-                    else:
-                        drop_indexes(conn, qnames)
-                        dropped += len(existing)
-                    control.info(
-                        f"[{i}] {target_schema}.{tbl}: dropped "
-                        f"{len(existing)} {args.index_type} index(es)."
-                    )
-                else:
-                    control.info(
-                        f"[{i}] {target_schema}.{tbl}: no {args.index_type} index found — nothing to drop."
-                    )
-                continue  # skip all other actions
+    COUNTERS = ("created", "dropped", "skipped_exists", "skipped_missing_cols", "pks_attached", "pks_skipped")
 
-            # optional PK attach (safe path only)
-            if args.ensure_pk:
-                pk_status = ensure_pk_on_id(conn, target_schema, tbl)
-                if pk_status in ("attached_pk", "would_attach_pk"):
-                    pks_attached += 1
-                    control.info(
-                        f"[{i}] {target_schema}.{tbl}: primary key on id attached."
-                    )
-                else:
-                    pks_skipped += 1
-                    control.info(
-                        f"[{i}] {target_schema}.{tbl}: skipped PK ({pk_status})."
-                    )
+    def process_table(conn, i, tbl):
+        """Drop / create the spatial index of one table, returns the counters it increments."""
+        counts = dict.fromkeys(COUNTERS, 0)
+        existing = spatial_indexes(snapshot[tbl], args.index_type, pixel_column(base_config)[0])
+        qnames = [f"{target_schema}.{name}" if "." not in name else name for name in existing]
 
-            # recreate: drop existing first
-            if args.recreate and existing:
+        # drop-only path
+        if args.drop_only:
+            if existing:
                 if args.dry_run:
                     control.info(
                         f"[dry-run] would drop {args.index_type} index(es) "
@@ -375,64 +399,141 @@ def index_schema():
                     )
                 else:
                     drop_indexes(conn, qnames)
-                    dropped += len(existing)
-                existing = []
-
-            # already has index?
-            if existing:
-                skipped_exists += 1
+                    counts["dropped"] += len(existing)
                 control.info(
-                    f"[{i}] {target_schema}.{tbl}: {args.index_type} index already "
-                    f"exists ({existing}) — skipping create."
+                    f"[{i}] {target_schema}.{tbl}: dropped "
+                    f"{len(existing)} {args.index_type} index(es)."
                 )
-                continue
-
-            # create new if we got here
-            ra_col, dec_col = find_ra_dec(conn, target_schema, tbl)
-            if not (ra_col and dec_col):
-                skipped_missing_cols += 1
+            else:
                 control.info(
-                    f"[{i}] {target_schema}.{tbl}: could not find RA/DEC columns — skipping."
+                    f"[{i}] {target_schema}.{tbl}: no {args.index_type} index found — nothing to drop."
                 )
-                continue
-
-            cfg_to_apply = dict(base_config)
-            cfg_to_apply["tablename"] = f"{target_schema}.{tbl}"
-            cfg_to_apply["ra_col"] = ra_col
-            cfg_to_apply["dec_col"] = dec_col
-            cfg_to_apply["additional_btree_index"] = []
+            return counts  # skip all other actions
 
-            if args.dry_run:
+        # optional PK attach (safe path only)
+        if args.ensure_pk:
+            pk_status = ensure_pk_on_id(conn, target_schema, tbl)
+            if pk_status in ("attached_pk", "would_attach_pk"):
+                counts["pks_attached"] += 1
                 control.info(
-                    f"[dry-run] would create {args.index_type} index on "
-                    f"{target_schema}.{tbl} (ra={ra_col}, dec={dec_col})"
+                    f"[{i}] {target_schema}.{tbl}: primary key on id attached."
                 )
             else:
+                counts["pks_skipped"] += 1
                 control.info(
-                    f"[{i}] {target_schema}.{tbl}: creating {args.index_type} index "
-                    f"(ra={ra_col}, dec={dec_col})"
+                    f"[{i}] {target_schema}.{tbl}: skipped PK ({pk_status})."
                 )
-                if args.index_type == "pgsphere":
-                    apply_pgsphere_index(cfg_to_apply)
-                else:
-                    apply_q3c_index(cfg_to_apply)
-                created += 1
 
+        # recreate: drop existing first
+        if args.recreate and existing:
+            if args.dry_run:
+                control.info(
+                    f"[dry-run] would drop {args.index_type} index(es) "
+                    f"on {target_schema}.{tbl}: {existing}"
+                )
+            else:
+                drop_indexes(conn, qnames)
+                counts["dropped"] += len(existing)
+            existing = []
+
+        # already has index?
+        if existing:
+            counts["skipped_exists"] += 1
+            control.info(
+                f"[{i}] {target_schema}.{tbl}: {args.index_type} index already "
+                f"exists ({existing}) — skipping create."
+            )
+            return counts
+
+        # create new if we got here
+        ra_col, dec_col = find_ra_dec(tbl)
+        if not (ra_col and dec_col):
+            counts["skipped_missing_cols"] += 1
+            control.info(
+                f"[{i}] {target_schema}.{tbl}: could not find RA/DEC columns — skipping."
+            )
+            return counts
+
+        cfg_to_apply = dict(base_config)
+        cfg_to_apply["tablename"] = f"{target_schema}.{tbl}"
+        cfg_to_apply["ra_col"] = ra_col
+        cfg_to_apply["dec_col"] = dec_col
+        cfg_to_apply["additional_btree_index"] = []
+        cfg_to_apply["index_type"] = args.index_type
+
+        if args.dry_run:
+            control.info(
+                f"[dry-run] would create {args.index_type} index on "
+                f"{target_schema}.{tbl} (ra={ra_col}, dec={dec_col})"
+            )
+        else:
+            control.info(
+                f"[{i}] {target_schema}.{tbl}: creating {args.index_type} index "
+                f"(ra={ra_col}, dec={dec_col})"
+            )
+            # on the worker's connection: one session per table, whatever `index_jobs`
+            if build_indexes(cfg_to_apply, conn, functions=False):
+                raise RuntimeError(f"{args.index_type} index was not created")
+            counts["created"] += 1
+        return counts
+
+    if args.index_type == "brin" and not (args.drop_only or args.dry_run):
+        # cone search helpers, once here: the workers replacing them at the same time would fail
+        try:
+            with conn.cursor() as cur:
+                cur.execute(PIXEL_FUNCTIONS)
         except Exception as e:
+            control.info(f"Could not create the cone search functions: {e}")
+            conn.close()
+            sys.exit(1)
+
+    # largest tables first so the long ones start right away
+    totals = dict.fromkeys(COUNTERS, 0)
+    failed = 0
+    for done, (i, tbl, counts, error) in enumerate(run_table_jobs(tables, args.jobs, base_config, process_table), start=1):
+        if error is not None:
             failed += 1
-            control.info(f"[{i}] {target_schema}.{tbl}: failed with error: {e}")
+            control.info(f"[{done}/{len(tables)}] {target_schema}.{tbl}: failed with error: {error}")
+            continue
+        for name in COUNTERS:
+            totals[name] += counts[name]
+        control.info(f"[{done}/{len(tables)}] {target_schema}.{tbl}: finished")
 
     control.info(
-        f"Finished. Created: {created}, Dropped: {dropped}, "
-        f"Skipped (exists): {skipped_exists}, Skipped (no RA/DEC): {skipped_missing_cols}, "
-        f"PK attached: {pks_attached}, PK skipped: {pks_skipped}, Failed: {failed}"
+        f"Finished. Created: {totals['created']}, Dropped: {totals['dropped']}, "
+        f"Skipped (exists): {totals['skipped_exists']}, Skipped (no RA/DEC): {totals['skipped_missing_cols']}, "
+        f"PK attached: {totals['pks_attached']}, PK skipped: {totals['pks_skipped']}, Failed: {failed}"
     )
     conn.close()
     
     
+def maintenance_needed(stats, threshold, analyze_only=False):
+    """
+    What a table needs according to its `pg_stat_user_tables` counters: "vacuum_analyze",
+    "analyze" or None. A table never (auto)analyzed / vacuumed always needs it; otherwise
+    it needs ANALYZE when `n_mod_since_analyze`, VACUUM when `n_dead_tup` or
+    `n_ins_since_vacuum` (PostgreSQL 13+) exceed `threshold` x live rows (any change at 0).
+    """
+    if stats is None:
+        # no statistics entry (partitioned parent, stats reset): do it
+        return "analyze" if analyze_only else "vacuum_analyze"
+
+    limit = threshold * max(stats["n_live_tup"] or 0, 1)
+    never_analyzed = stats["last_analyze"] is None and stats["last_autoanalyze"] is None
+    never_vacuumed = stats["last_vacuum"] is None and stats["last_autovacuum"] is None
+
+    needs_analyze = never_analyzed or (stats["n_mod_since_analyze"] or 0) > limit
+    needs_vacuum = never_vacuumed or (stats["n_dead_tup"] or 0) > limit or (stats["n_ins_since_vacuum"] or 0) > limit
+
+    if needs_vacuum and not analyze_only:
+        return "vacuum_analyze"
+    if needs_analyze:
+        return "analyze"
+    return None
+
 def vacuum_schema():
     """
-    VACUUM ANALYZE all tables in a schema.
+    VACUUM ANALYZE (or ANALYZE) all tables in a schema.
 
     Examples:
       # vacuum analyze all tables in a schema
@@ -443,9 +544,14 @@ def vacuum_schema():
 
       # include partitioned tables
       astroinject vacuum_schema -b base.yaml -s cat --include_partitions
+
+      # nightly: 4 tables at a time, only those changed since their last vacuum / analyze
+      astroinject vacuum_schema -b base.yaml -s dr5 --jobs 4 --changed_only
+
+      # refresh planner statistics only
+      astroinject vacuum_schema -b base.yaml -s dr5 --analyze_only --changed_only
     """
     import sys
-    import psycopg2
     from psycopg2 import sql
 
     parser = argparse.ArgumentParser(
@@ -460,38 +566,42 @@ def vacuum_schema():
                         help="Also consider partitioned tables (relkind='p').")
     parser.add_argument("--dry_run", action="store_true",
                         help="Print intended actions without executing any DDL.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="Tables processed at the same time, each on its own connection.")
+    parser.add_argument("--analyze_only", action="store_true",
+                        help="Run ANALYZE instead of VACUUM ANALYZE.")
+    parser.add_argument("--changed_only", action="store_true",
+                        help="Skip tables whose pg_stat_user_tables counters show no change since their last vacuum / analyze.")
+    parser.add_argument("--change_threshold", type=float, default=0.0,
+                        help="With --changed_only, fraction of the live rows that must have changed (0: any change).")
     args = parser.parse_args()
 
     base_config = load_config(args.baseconfig)
 
     # connect
-    cfg = base_config.get("database", base_config)
-    if "dsn" in cfg:
-        conn = psycopg2.connect(cfg["dsn"])
-    else:
-        conn = psycopg2.connect(
-            host=cfg.get("host"),
-            port=cfg.get("port"),
-            dbname=cfg.get("dbname"),
-            user=cfg.get("user"),
-            password=cfg.get("password"),
-        )
-    conn.autocommit = True
+    conn = _connect(base_config)
 
-    # figure out tables to process
+    # figure out tables to process, largest first, with their activity counters
     RELKINDS = ["'r'"]
     if args.include_partitions:
         RELKINDS.append("'p'")
     relkind_clause = ",".join(RELKINDS)
     LIST_TABLES = f"""
-    SELECT t.relname
+    SELECT t.relname,
+           s.relid IS NOT NULL,
+           s.n_live_tup, s.n_dead_tup, s.n_mod_since_analyze,
+           (to_jsonb(s) ->> 'n_ins_since_vacuum')::bigint,
+           s.last_vacuum, s.last_autovacuum, s.last_analyze, s.last_autoanalyze
     FROM   pg_class t
     JOIN   pg_namespace n ON n.oid = t.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = t.oid
     WHERE  n.nspname = %s
       AND  t.relkind IN ({relkind_clause})
       {{name_filter}}
-    ORDER BY t.relname;
+    ORDER BY t.relpages DESC, t.relname;
     """
+    STATS_COLUMNS = ("n_live_tup", "n_dead_tup", "n_mod_since_analyze", "n_ins_since_vacuum",
+                     "last_vacuum", "last_autovacuum", "last_analyze", "last_autoanalyze")
     params = [args.schema]
     name_filter_sql = ""
     if args.name_like:
@@ -501,33 +611,55 @@ def vacuum_schema():
     try:
         with conn.cursor() as cur:
             cur.execute(list_sql, params)
-            tables = [r[0] for r in cur.fetchall()]
+            rows = cur.fetchall()
     except Exception as e:
         control.info(f"Could not list tables in schema '{args.schema}': {e}")
         conn.close()
         sys.exit(1)
+    conn.close()
+
+    default_action = "analyze" if args.analyze_only else "vacuum_analyze"
+    actions = {}
+    for row in rows:
+        stats = dict(zip(STATS_COLUMNS, row[2:])) if row[1] else None
+        if args.changed_only:
+            actions[row[0]] = maintenance_needed(stats, args.change_threshold, args.analyze_only)
+        else:
+            actions[row[0]] = default_action
+    tables = [tbl for tbl, action in actions.items() if action]
+    skipped = len(actions) - len(tables)
         
     control.info(
-        f"Target: {args.schema} ; count={len(tables)} ; "
-        f"options: include_partitions={args.include_partitions}, dry_run={args.dry_run}"
+        f"Target: {args.schema} ; count={len(tables)} (unchanged, skipped: {skipped}) ; "
+        f"options: include_partitions={args.include_partitions}, dry_run={args.dry_run}, "
+        f"jobs={args.jobs}, analyze_only={args.analyze_only}, changed_only={args.changed_only}"
     )
-    vacuumed=failed=0
-    for i, tbl in enumerate(tables, start=1):
-        try:
-            if args.dry_run:
-                control.info(f"[dry-run] would VACUUM ANALYZE {args.schema}.{tbl}")
-            else:
-                control.info(f"[{i}] VACUUM ANALYZE {args.schema}.{tbl}")
-                with conn.cursor() as cur:
-                    cur.execute(
-                        sql.SQL("VACUUM ANALYZE {}.{}").format(
-                            sql.Identifier(args.schema),
-                            sql.Identifier(tbl),
-                        )
-                    )
-                vacuumed += 1
-        except Exception as e:
+
+    def process_table(conn, i, tbl):
+        statement = "VACUUM ANALYZE {}.{}" if actions[tbl] == "vacuum_analyze" else "ANALYZE {}.{}"
+        label = statement.format(args.schema, tbl)
+        if args.dry_run:
+            control.info(f"[dry-run] would {label}")
+            return actions[tbl]
+        control.info(f"[{i}] {label}")
+        with conn.cursor() as cur:
+            cur.execute(
+                sql.SQL(statement).format(
+                    sql.Identifier(args.schema),
+                    sql.Identifier(tbl),
+                )
+            )
+        return actions[tbl]
+
+    vacuumed=analyzed=failed=0
+    for done, (i, tbl, action, error) in enumerate(run_table_jobs(tables, args.jobs, base_config, process_table), start=1):
+        if error is not None:
             failed += 1
-            control.info(f"[{i}] {args.schema}.{tbl}: failed with error: {e}")
-    control.info(f"Vacuumed: {vacuumed}, Failed: {failed}")
-    conn.close()
\ No newline at end of file
+            control.info(f"[{done}/{len(tables)}] {args.schema}.{tbl}: failed with error: {error}")
+            continue
+        if action == "vacuum_analyze":
+            vacuumed += 1
+        else:
+            analyzed += 1
+        control.info(f"[{done}/{len(tables)}] {args.schema}.{tbl}: done")
+    control.info(f"Vacuumed: {vacuumed}, Analyzed only: {analyzed}, Skipped (unchanged): {skipped}, Failed: {failed}")
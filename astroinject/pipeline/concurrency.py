@@ -0,0 +1,134 @@
+import time
+import logpool as control
+
+from astroinject.database.dbpool import PostgresConnectionManager
+
+# COPY sessions waiting on these are contending with each other (relation extension
+# locks, WAL insertion/flush, buffer mapping) rather than doing useful work.
+WAIT_EVENTS_QUERY = """
+SELECT count(*) AS active,
+       count(*) FILTER (
+           WHERE wait_event_type IN ('Lock', 'LWLock')
+              OR (wait_event_type = 'IO' AND wait_event LIKE 'WAL%%')
+       ) AS waiting
+FROM   pg_stat_activity
+WHERE  datname = current_database()
+  AND  state = 'active'
+  AND  query ILIKE 'COPY %%'
+  AND  pid <> pg_backend_pid()
+"""
+
+class AdaptiveConcurrency:
+    """
+    Decides how many loaders may run at the same time while `parallel_insertion` runs.
+
+    Without `general.adaptive_concurrency` the limit is fixed to `general.injection_processes`.
+    When enabled, every `window` finished COPYs the controller compares the aggregated
+    throughput (rows/s) and the per-row COPY latency with what it saw before:
+
+    - latency above `latency_factor` times the best one seen, or more than `max_wait_ratio`
+      of the COPY sessions waiting on locks / WAL (`pg_wait_events: true`), lowers the limit;
+    - otherwise the limit goes up while throughput keeps improving, and steps back
+      when the last increase did not pay off.
+
+    Example config:
+
+        general:
+          injection_processes: 4
+          adaptive_concurrency:
+            min_processes: 2
+            max_processes: 12
+            pg_wait_events: true
+    """
+
+    def __init__(self, config):
+        general = config["general"]
+        opts = general.get("adaptive_concurrency")
+
+        self.enabled = bool(opts)
+        if not isinstance(opts, dict):
+            opts = {}
+
+        self.min = max(1, opts.get("min_processes", 1))
+        self.max = max(self.min, opts.get("max_processes", general["injection_processes"]))
+        self.limit = min(max(general["injection_processes"], self.min), self.max)
+
+        self._window_opt = opts.get("window")
+        self.window = self._window_opt or max(self.limit, 2)
+        self.latency_factor = opts.get("latency_factor", 1.5)
+        self.max_wait_ratio = opts.get("max_wait_ratio", 0.5)
+        self.tolerance = opts.get("tolerance", 0.05)
+
+        self.pg_conn = None
+        if self.enabled and opts.get("pg_wait_events"):
+            try:
+                self.pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+            except Exception as e:
+                control.warn(f"could not open connection to watch pg_stat_activity: {e}")
+
+        self._samples = []
+        self._window_start = time.monotonic()
+        self._best_latency = None
+        self._last_throughput = None
+        self._last_direction = 0
+
+    def record(self, result):
+        """Feed the result dict of a finished task. Only successful COPYs are used."""
+        if not self.enabled or not result or result.get("status") != "ok":
+            return
+        if result.get("rows") and result.get("copy_seconds"):
+            self._samples.append((result["rows"], result["copy_seconds"]))
+        if len(self._samples) >= self.window:
+            self._update()
+
+    def wait_ratio(self):
+        """Fraction of active COPY sessions waiting on contention events, None if not watched."""
+        if self.pg_conn is None:
+            return None
+        row = self.pg_conn.execute_query(WAIT_EVENTS_QUERY, fetch=True)
+        if not row or not row[0][0]:
+            return None
+        active, waiting = row[0]
+        return waiting / active
+
+    def _update(self):
+        elapsed = time.monotonic() - self._window_start
+        rows = sum(n for n, _ in self._samples)
+        throughput = rows / elapsed if elapsed > 0 else 0.0
+        latency = sum(t for _, t in self._samples) / rows
+
+        if self._best_latency is None or latency < self._best_latency:
+            self._best_latency = latency
+
+        wait_ratio = self.wait_ratio()
+        previous = self.limit
+
+        if latency > self.latency_factor * self._best_latency or (
+            wait_ratio is not None and wait_ratio > self.max_wait_ratio
+        ):
+            self.limit = max(self.min, self.limit - 1)
+            self._last_direction = -1
+        elif self._last_throughput is None or throughput >= self._last_throughput * (1 + self.tolerance):
+            self.limit = min(self.max, self.limit + 1)
+            self._last_direction = 1
+        elif self._last_direction == 1 and throughput < self._last_throughput * (1 - self.tolerance):
+            # the last increase made things worse
+            self.limit = max(self.min, self.limit - 1)
+            self._last_direction = -1
+        else:
+            self._last_direction = 0
+
+        control.info(
+            f"adaptive concurrency: {throughput:.0f} rows/s, {latency * 1e6:.1f} us/row"
+            + (f", {wait_ratio:.0%} COPYs waiting" if wait_ratio is not None else "")
+            + f" -> {previous} => {self.limit} loaders"
+        )
+
+        self._last_throughput = throughput
+        self._samples = []
+        self._window_start = time.monotonic()
+        self.window = self._window_opt or max(self.limit, 2)
+
+    def close(self):
+        if self.pg_conn is not None:
+            self.pg_conn.close()
@@ -1,31 +1,90 @@
 import logpool as control
-from astroinject.io import open_table
+from astroinject.io import open_table, resolve_format, read_table_shape
 from astroinject.processing import preprocess_table
-from astroinject.database.utils import convert_table_to_postgres_records
-from astroinject.database.gen_base_queries import generate_create_table_query
+from astroinject.database.utils import convert_table_to_postgres_records, table_stats, pg_type_from_stats
+from astroinject.database.gen_base_queries import generate_create_table_query, BYTEA_FUNCTIONS, bytea_comment_query, grid_table_queries
 from astroinject.database.dbpool import PostgresConnectionManager
 from astroinject.database.types import build_type_map
+from astroinject import profiling
+from astroinject.profiling import stage
+from astroinject.spatial import sort_by_pixel, pixel_column
+
+from astroinject.pipeline.scheduler import build_tasks, stream_tasks, PendingTasks, task_label
+from astroinject.pipeline.concurrency import AdaptiveConcurrency
+from astroinject.pipeline.memory import MemoryBudget, current_rss
+from astroinject.pipeline.metrics import IngestionMetrics
+from astroinject.pipeline.sinks import open_sinks, counting_sink, uses_database
+from astroinject.pipeline.prescan import run_prescan, apply_union_schema, wider_type
+from astroinject.pipeline.ledger import CompletionLedger
+from astroinject.pipeline.checkpoint import (
+    checkpoint_rows, chunk_ranges, table_hash, checkpoint_key, checkpoint_path, load_checkpoint, save_checkpoint,
+    create_checkpoint_table, load_db_checkpoint, save_db_checkpoint, clear_db_checkpoints,
+)
 
 from multiprocessing import get_context
+import itertools
+import threading
+import queue
 import gc
 
-def injection_procedure(filepath, types_map, config):
+def injection_procedure(filepath, types_map, config, row_range=None, checkpoint=None):
+    """
+    Load one file (or one row range of it) into `config["tablename"]`, or more
+    generally through every sink listed in `config["sinks"]` (see `astroinject.pipeline.sinks`).
+
+    Returns a result dict: `status` ("ok", "skipped", "empty" or "error"),
+    `rows` (written), `rows_in` (read), `bytes_out` (COPY payload / file written), `copy_seconds`
+    (time spent in the COPY itself), `stages` (wall seconds per top level stage),
+    `peak_rss_delta` (largest RSS growth seen while the task ran, in bytes), `rejected`
+    (rows refused by COPY and quarantined, see `PostgresSink`) and,
+    when `config["profile"]` is set, `profile` (every stage record, see `astroinject.profiling`).
+
+    With `general.checkpoint_rows`, FITS / parquet files are loaded in committed chunks
+    (see `checkpointed_injection`); `checkpoint` marks one of those calls: the state saved
+    once the chunk is loaded (the database sink saves it in its COPY transaction), to
+    which the `chunk_hash` of the rows read is added. It is also returned.
+    """
+    if checkpoint is None and checkpoint_rows(config, filepath):
+        return checkpointed_injection(filepath, types_map, config, row_range)
+
+    result = {
+        "status": "error", "rows": 0, "rows_in": 0, "bytes_out": 0,
+        "copy_seconds": 0.0, "stages": {}, "peak_rss_delta": 0, "rejected": 0,
+    }
+    rss_start = current_rss()
+
+    def sample_rss():
+        result["peak_rss_delta"] = max(result["peak_rss_delta"], current_rss() - rss_start)
+
+    if isinstance(filepath, str):
+        profiling.begin_task(filepath, resolve_format(filepath, config), profile=bool(config.get("profile")))
+    else:
+        profiling.begin_task("Memory file.", "memory", profile=bool(config.get("profile")))
+
     try:
         
         if isinstance(filepath, str):
-            table = open_table(filepath, config)
+            with stage("open_table"):
+                table = open_table(filepath, config, row_range=row_range)
+            sample_rss()
+            if checkpoint is not None:
+                result["chunk_hash"] = checkpoint["chunk_hash"] = table_hash(table)
+            if row_range is not None:
+                filepath = f"{filepath}[{row_range[0]}:{row_range[1]}]"
         else:
             table = filepath
             filepath = "Memory file."
         
         control.info(f"Injecting table {filepath} into the database")
+        result["rows_in"] = len(table)
 
         if len(table) == 0:
             control.warn(f"Table {filepath} is empty. Skipping...")
-            return
+            result["status"] = "empty"
+            return result
         
         # check if the first row already exists in the database because of id column
-        if "id_col" in config and config["id_col"] is not None:
+        if "id_col" in config and config["id_col"] is not None and uses_database(config):
             id_col = config["id_col"]
             if "rename_columns" in config and config["rename_columns"] is not None:
                 for col in config["rename_columns"]:
@@ -44,11 +103,12 @@ def injection_procedure(filepath, types_map, config):
             except (ValueError, TypeError):
                 constrain = f"{config['id_col']} = '{first_table_id}'"
             
-            existing_ids = pg_conn.execute_query(f"""
-                SELECT {config['id_col']}
-                FROM {config['tablename']}
-                WHERE {constrain}
-            """, fetch=True)
+            with stage("id_probe"):
+                existing_ids = pg_conn.execute_query(f"""
+                    SELECT {config['id_col']}
+                    FROM {config['tablename']}
+                    WHERE {constrain}
+                """, fetch=True)
             if existing_ids:
                 control.warn(f"Row with ID {first_table_id} already exists in the database. Skipping {filepath}.")
                 pg_conn.close()
@@ -61,17 +121,49 @@ def injection_procedure(filepath, types_map, config):
                 except: pass
                 
                 gc.collect()
-                return
+                result["status"] = "skipped"
+                return result
+            pg_conn.close()
         
-        table = preprocess_table(table, config, types_map)
-        records = convert_table_to_postgres_records(table)
+        with stage("preprocess_table"):
+            table = preprocess_table(table, config, types_map)
+        sample_rss()
 
-        pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
-        pg_conn.insert_data_copy(config["tablename"], table.columns, records)
-        pg_conn.close()
+        if config.get("spatial_sort"):
+            # neighbours on the sky end up in neighbouring heap pages
+            with stage("spatial_sort"):
+                table = sort_by_pixel(table, config)
+            sample_rss()
+        if checkpoint is not None:
+            table.meta["checkpoint"] = checkpoint
+        records = None
+
+        def get_records():
+            nonlocal records
+            if records is None:
+                with stage("convert_table_to_postgres_records"):
+                    records = convert_table_to_postgres_records(table)
+                sample_rss()
+            return records
+
+        sinks = open_sinks(config)
+        counted = counting_sink(sinks)
+        for sink in sinks:
+            try:
+                written = sink.write(table, get_records, filepath)
+            finally:
+                sink.close()
+            sample_rss()
+            if sink is counted:
+                result["rows"] = written["rows"]
+            result["bytes_out"] += written["bytes"]
+            result["rejected"] += written.get("rejected", 0)
+
+        result["status"] = "ok"
 
     except Exception as e:
         control.critical(f"Error while injecting {filepath}: {e}")
+        result["error"] = str(e)
 
     finally:
         # Libera memória explicitamente
@@ -84,9 +176,120 @@ def injection_procedure(filepath, types_map, config):
             
         gc.collect()
 
-def create_table(filepath, config):
+        task_record = profiling.end_task()
+        result["stages"] = profiling.stage_seconds(task_record)
+        result["copy_seconds"] = result["stages"].get("insert_data_copy", 0.0)
+        if task_record["profile"]:
+            result["profile"] = task_record
+
+    return result
+
+def checkpointed_injection(filepath, types_map, config, row_range=None):
+    """
+    `injection_procedure` of a FITS / parquet file (or row range of it) in chunks of about
+    `general.checkpoint_rows` rows, each committed on its own (see `chunk_ranges`).
+
+    After each chunk, (file, row offset, hash of the chunk rows) is saved to the task
+    checkpoint, so an interrupted run continues after the last committed chunk. With the
+    database sink the checkpoint is a row of `astroinject_checkpoints` written in the
+    transaction of the chunk's COPY, so a crash cannot commit rows without their checkpoint;
+    it is also written to `checkpoint_path` (the only copy for the other sinks).
+    The hash of that chunk is checked first: a file that changed fails the task
+    instead of loading rows twice. A completed task is skipped by later runs.
+    Returns the result dict of `injection_procedure`, summed over the chunks.
+    """
+    result = {
+        "status": "error", "rows": 0, "rows_in": 0, "bytes_out": 0,
+        "copy_seconds": 0.0, "stages": {}, "peak_rss_delta": 0, "rejected": 0,
+    }
+    path = checkpoint_path(config, filepath, row_range)
+    task = checkpoint_key(filepath, row_range)
+    database = uses_database(config)
+    start, stop = row_range if row_range is not None else (0, read_table_shape(filepath, config)[0])
+    label = f"{filepath}[{start}:{stop}]"
+
+    offset = start
+    checkpoint = load_db_checkpoint(config, task) if database else load_checkpoint(path)
+    if checkpoint:
+        if checkpoint.get("complete"):
+            control.info(f"{label} already loaded (checkpoint {path}). Skipping...")
+            result["status"] = "skipped"
+            return result
+        try:
+            last_hash = table_hash(open_table(filepath, config, row_range=tuple(checkpoint["chunk"])))
+        except Exception:
+            last_hash = None
+        if last_hash != checkpoint["chunk_hash"]:
+            result["error"] = f"{filepath} changed since checkpoint {path}, remove the checkpoint to load it again"
+            control.critical(result["error"])
+            return result
+        offset = checkpoint["offset"]
+        control.info(f"resuming {label} at row {offset} (checkpoint {path})")
+
+    statuses = set()
+    profiles = []
+    for chunk_range in chunk_ranges(filepath, offset, stop, checkpoint_rows(config, filepath), config):
+        state = {
+            "task": task, "file": filepath, "row_range": row_range, "offset": chunk_range[1],
+            "chunk": chunk_range, "complete": chunk_range[1] >= stop,
+        }
+        chunk_result = injection_procedure(filepath, types_map, config, row_range=chunk_range, checkpoint=state)
+        for key in ("rows", "rows_in", "bytes_out", "copy_seconds", "rejected"):
+            result[key] += chunk_result.get(key, 0)
+        for name, seconds in chunk_result.get("stages", {}).items():
+            result["stages"][name] = result["stages"].get(name, 0.0) + seconds
+        result["peak_rss_delta"] = max(result["peak_rss_delta"], chunk_result.get("peak_rss_delta", 0))
+        if "profile" in chunk_result:
+            profiles.append(chunk_result["profile"])
+
+        if chunk_result["status"] == "error":
+            result["error"] = chunk_result.get("error")
+            break
+        statuses.add(chunk_result["status"])
+        state["chunk_hash"] = chunk_result["chunk_hash"]
+        if database and chunk_result["status"] != "ok":
+            # nothing was copied, so no transaction carried it
+            save_db_checkpoint(config, state)
+        save_checkpoint(path, state)
+    else:
+        if "ok" in statuses:
+            result["status"] = "ok"
+        elif "skipped" in statuses:
+            result["status"] = "skipped"
+        else:
+            result["status"] = "empty"
+
+    if profiles:
+        result["profile"] = dict(profiles[0], name=filepath, stages=[record for p in profiles for record in p["stages"]])
+    return result
+
+def infer_table_types(paths, config, table=None):
+    """
+    PostgreSQL type of every column from whole-column statistics (`table_stats`) of the
+    preprocessed files `paths` (and of an already preprocessed `table`), see `pg_type_from_stats`.
+    `infer_types_narrow_integers` picks integer types from the sampled min / max.
+    """
+    stats = table_stats(table) if table is not None else {}
+    for path in paths:
+        try:
+            stats = table_stats(preprocess_table(open_table(path, config), config), stats)
+        except Exception as e:
+            control.warn(f"could not sample types of {path}: {e}")
+
+    column_types = {}
+    for col, col_stats in stats.items():
+        pg_type = pg_type_from_stats(col_stats, config.get("infer_types_narrow_integers", False))
+        if pg_type is not None:
+            column_types[col] = pg_type
+    return column_types
+
+def create_table(filepath, config, sample=None, column_types=None):
     """
     Filepath or astropy.table.Table
+    Column types come from `column_types` (e.g. the pre-scan union schema), widened with
+    `sample` (more file paths) to the types inferred from the statistics of whole columns of
+    the table and of those files (`infer_table_types`), else from the first value of each column.
+    Returns True when the table did not exist and was created.
     """
     try:
         if isinstance(filepath, str):
@@ -97,34 +300,212 @@ def create_table(filepath, config):
 
         table = preprocess_table(table, config)
 
-        create_query = generate_create_table_query(config["tablename"], table, config["id_col"])
+        column_types = dict(column_types or {})
+        if sample is not None:
+            # the pre-scan saw every file, the sample only some: keep the wider type of each column
+            for col, pg_type in infer_table_types(sample, config, table).items():
+                column_types[col] = wider_type(column_types.get(col), pg_type)
+            control.info(f"column types inferred from {len(sample) + 1} files: {column_types}")
+        if config.get("index_type") == "brin":
+            # the first pixel may fit an INTEGER, later ones do not
+            column_types[pixel_column(config)[0]] = "BIGINT"
+        grid_cols = [col.lower() for col in config.get("dedup_columns") or [] if f"{col.lower()}_grid_id" in table.colnames]
+        for col in grid_cols:
+            column_types[f"{col}_grid_id"] = "BIGINT"
+        bytea_cols = [col.lower() for col in config.get("bytea_columns") or [] if col.lower() in table.colnames]
+        for col in bytea_cols:
+            column_types[col] = "BYTEA"
+
+        create_query = generate_create_table_query(config["tablename"], table, config["id_col"], column_types)
         control.info(f"Creating table {config['tablename']} in the database")
         control.info(f"Query: \n{create_query}")
 
         pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+        existed = pg_conn.execute_query("SELECT to_regclass(%s);", (config["tablename"],), fetch=True)
         pg_conn.execute_query(create_query)
+        if grid_cols:
+            # distinct wavelength grids, stored once, and the view joining them back
+            for query in grid_table_queries(config["tablename"], grid_cols):
+                control.info(f"executing:\n{query}")
+                pg_conn.execute_query(query)
+        created = not (existed and existed[0][0])
+        if created and config.get("bytea_columns"):
+            # decoding helpers, and the encoding of each column in its comment
+            pg_conn.execute_query(BYTEA_FUNCTIONS)
+            for col in bytea_cols:
+                pg_conn.execute_query(bytea_comment_query(config["tablename"], col))
         pg_conn.close()
+        if sample is not None and created:
+            # the workers cast their columns to the same types (`optimize_table_types`)
+            config["column_types"] = column_types
+        return created
     except Exception as e:
         print(e)
+        return False
+
+def table_missing(config):
+    """True when `config["tablename"]` does not exist (False when that could not be checked)."""
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    found = pg_conn.execute_query("SELECT to_regclass(%s);", (config["tablename"],), fetch=True)
+    pg_conn.close()
+    return bool(found) and found[0][0] is None
+
+def _injection_task(task, types_map, config):
+    return task, injection_procedure(task["filepath"], types_map, config, row_range=task["row_range"])
+
+def _dispatch(pool, events, pending, discovering, types_map, config, controller, budget, metrics, profiles, ledger):
+    """
+    Submit tasks in scheduling order (largest first by default), keeping at most `controller.limit` of them in flight
+    and, with a memory budget, only those whose estimated footprint fits.
+
+    `events` carries newly discovered tasks (`("task", task)`, then `("discovered", None)`)
+    and finished ones (`("result", (task, result))`), so loading starts while the
+    discovery is still running and results are consumed as soon as each task ends.
+    `pending` holds the tasks already known; `discovering` tells whether more will come.
+    """
+    in_flight = 0
+    done = 0
+
+    def handle(kind, payload):
+        nonlocal discovering, in_flight, done
+        if kind == "task":
+            pending.add(payload)
+            metrics.add_task(payload)
+        elif kind == "discovered":
+            discovering = False
+            metrics.discovery_done()
+            control.info(f"found {metrics.files_total} files to inject")
+        else:
+            task, result = payload
+            in_flight -= 1
+            done += 1
+
+            controller.record(result)
+            budget.release(task, result)
+            metrics.record(task, result)
+            ledger.record(task, result)
+            if "profile" in result:
+                profiles.append(result.pop("profile"))
+            control.info(f"[{done}/{metrics.tasks_total}] {result['status']}: {task_label(task)}")
+
+    while discovering or pending or in_flight:
+        while pending and in_flight < controller.limit:
+            task = budget.next_task(pending, in_flight)
+            if task is None:
+                break
+            budget.admit(task)
+            pool.apply_async(
+                _injection_task,
+                (task, types_map, config),
+                callback=lambda finished: events.put(("result", finished)),
+                error_callback=lambda e, task=task: events.put(("result", (task, {"status": "error", "error": str(e)}))),
+            )
+            in_flight += 1
+
+        # wait for something to happen, then take everything that is already there
+        # so a burst of discovered files is ordered before choosing the next one
+        handle(*events.get())
+        while True:
+            try:
+                handle(*events.get_nowait())
+            except queue.Empty:
+                break
 
 def parallel_insertion(files, config):
     """
     Uses multiprocessing to insert data in parallel.
+    - `files` is a list of paths / `(path, size)` pairs, or a generator of them
+      (e.g. `iter_files_with_pattern`): loading then starts while files are still being found
     - Uses `spawn` context to avoid memory leaks from fork
-    - Uses starmap instead of partial to pass arguments cleanly
+    - Files are scheduled largest first, or in sky order with `spatial_schedule` (see `build_tasks`),
+      big files may be split in row ranges loaded by different workers; a file is recorded
+      as complete once all its ranges committed (`CompletionLedger`)
+    - Tasks are submitted one at a time and results stream back as soon as each task ends
+    - The number of concurrent loaders follows `AdaptiveConcurrency` (fixed unless
+      `general.adaptive_concurrency` is set)
+    - With `general.memory_budget_mb`, a task only starts when its estimated memory fits (`MemoryBudget`)
+    - Workers are recycled every `general.max_tasks_per_child` tasks to release fragmented memory
+    - With `general.prescan`, the headers of all files are read first (`run_prescan`): the table
+      gets the union of their columns with promoted types, drift is reported per file and the
+      total row count drives the ETA
     """
-    # Cria a tabela com o primeiro arquivo
-    create_table(files[0], config)
+    # files whose every task committed in a previous run are not loaded again
+    ledger = CompletionLedger(config)
+    if uses_database(config) and table_missing(config):
+        # the table is created by this run: files and chunks committed to a dropped table of that name are gone
+        ledger.clear()
+        clear_db_checkpoints(config)
+    files = ledger.pending(files)
+
+    sample_size = config.get("infer_types_files") or 0
+    prescan = config["general"].get("prescan")
+    if prescan and not isinstance(files, list):
+        # the pre-scan needs every file before loading starts
+        files = list(files)
+    if isinstance(files, list):
+        first = files[0] if files else None
+        # evenly spread over the list
+        sample = files[1::max(1, (len(files) - 1) // max(1, sample_size - 1))][:max(0, sample_size - 1)]
+    else:
+        files = iter(files)
+        sample = list(itertools.islice(files, max(1, sample_size)))
+        first = sample.pop(0) if sample else None
+        if first is not None:
+            files = itertools.chain([first], sample, files)
+
+    if first is None:
+        control.warn("no files to insert")
+        return
+    first = first[0] if isinstance(first, tuple) else first
+
+    union_types, rows_total = run_prescan(files, config) if prescan else (None, None)
+
+    if uses_database(config):
+        # Cria a tabela com o primeiro arquivo
+        # (a table created by this run only needs ANALYZE after the load, see `maintenance_mode`)
+        # with `infer_types_files`, column types come from whole columns of that many files
+        sample = [item[0] if isinstance(item, tuple) else item for item in sample] if sample_size else None
+        config["fresh_table"] = create_table(first, config, sample, union_types)
+        if union_types:
+            # columns of files that differ from the first one
+            apply_union_schema(config, union_types)
+        if config["general"].get("checkpoint_rows"):
+            create_checkpoint_table(config)
 
     # Gera o types_map se necessário
-    types_map = build_type_map(config) if config.get("force_cast_correction") else None
+    types_map = build_type_map(config) if config.get("force_cast_correction") and uses_database(config) else None
 
-    # Cria lista de argumentos para starmap
-    args = [(filepath, types_map, config) for filepath in files]
+    events = queue.Queue()
+    if isinstance(files, list):
+        # everything is known already, keep a strict scheduling order
+        tasks = build_tasks(files, config)
+        control.info(f"found {len(files)} files to inject")
+    else:
+        tasks = []
+        threading.Thread(target=stream_tasks, args=(files, config, events), daemon=True).start()
+    pending = PendingTasks(tasks)
+
+    controller = AdaptiveConcurrency(config)
+    budget = MemoryBudget(config)
+    metrics = IngestionMetrics(tasks, config, rows_total)
+    metrics.start()
+    profiles = []
 
     # Contexto spawn evita fork-related memory leaks
     ctx = get_context("spawn")
-    with ctx.Pool(processes=config["general"]["injection_processes"]) as pool:
-        pool.starmap(injection_procedure, args)
+    try:
+        with ctx.Pool(
+            processes=controller.max,
+            maxtasksperchild=config["general"].get("max_tasks_per_child", 10),
+        ) as pool:
+            _dispatch(
+                pool, events, pending, not isinstance(files, list),
+                types_map, config, controller, budget, metrics, profiles, ledger,
+            )
+    finally:
+        controller.close()
+        metrics.stop()
+        if config.get("profile"):
+            profiling.write_profile_report(config["profile"], profiles)
 
-    control.info("✅ All files inserted in parallel!")
\ No newline at end of file
+    control.info("✅ All files inserted in parallel!")
@@ -0,0 +1,102 @@
+import os
+import json
+import logpool as control
+
+from astroinject.pipeline.sinks import uses_database
+
+def file_signature(filepath):
+    stat = os.stat(filepath)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+class CompletionLedger:
+    """
+    Files of a table whose every task (all row ranges of a split file) committed.
+
+    Kept as JSON lines in `general.completion_ledger` (by default <tablename>.completed.jsonl
+    when `general.split_rows` is set, disabled otherwise). A file is appended only when its
+    last task finished and none failed, so a file split in ranges is never recorded as
+    loaded while part of it is missing. Later runs skip the recorded files whose size and
+    mtime did not change. Only runs writing to the database use it: files written by a
+    `null` or `parquet` run are not in the table.
+    """
+
+    def __init__(self, config):
+        general = config.get("general", {})
+        self.path = general.get("completion_ledger")
+        if not self.path and general.get("split_rows"):
+            self.path = f"{config['tablename']}.completed.jsonl"
+        if not uses_database(config):
+            self.path = None
+        self.table = config["tablename"]
+        self.completed = {}
+        self._progress = {}
+        if self.path:
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.completed[entry["file"]] = entry
+        except FileNotFoundError:
+            pass
+
+    def clear(self):
+        """Forget every recorded file, for a table created again (its rows are gone)."""
+        if not self.path:
+            return
+        if self.completed:
+            control.warn(f"{self.path}: {len(self.completed)} files recorded for a previous {self.table} will be loaded again")
+        self.completed = {}
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def is_complete(self, filepath):
+        entry = self.completed.get(os.path.abspath(filepath))
+        if entry is None:
+            return False
+        try:
+            signature = file_signature(filepath)
+        except OSError:
+            return False
+        return entry["size"] == signature["size"] and entry["mtime"] == signature["mtime"]
+
+    def pending(self, files):
+        """`files` (list or iterator of paths / `(path, size)` pairs) without the completed ones."""
+        if not self.path or not self.completed:
+            return files
+
+        def keep(item):
+            filepath = item[0] if isinstance(item, tuple) else item
+            if isinstance(filepath, str) and self.is_complete(filepath):
+                control.info(f"{filepath} already loaded (completion ledger {self.path}). Skipping...")
+                return False
+            return True
+
+        if isinstance(files, list):
+            return [item for item in files if keep(item)]
+        return (item for item in files if keep(item))
+
+    def record(self, task, result):
+        """Account for a finished task, append its file to the ledger when it was the last one."""
+        if not self.path or not isinstance(task["filepath"], str):
+            return
+        key = os.path.abspath(task["filepath"])
+        progress = self._progress.setdefault(key, {"done": 0, "failed": False})
+        progress["done"] += 1
+        progress["failed"] |= result.get("status") == "error"
+        if progress["done"] < task.get("file_tasks", 1):
+            return
+
+        del self._progress[key]
+        if progress["failed"]:
+            control.warn(f"{task['filepath']} not fully loaded, not recorded as complete")
+            return
+        entry = {"file": key, "tasks": task.get("file_tasks", 1), **file_signature(task["filepath"])}
+        self.completed[key] = entry
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
@@ -1,108 +1,125 @@
 import logpool as control
 from astroinject.database.dbpool import PostgresConnectionManager
+from astroinject.database.types import db_type
 
-def map_table(config):
-    pg_conn = PostgresConnectionManager(**config["database"])
-    
-    infos = pg_conn.execute_query(f"""
-            select *
-            from information_schema.columns
-            where table_schema NOT IN ('information_schema', 'pg_catalog')
-            order by table_schema, table_name
-        """, fetch = True)
-    
-    schema = None
-    table_name = None
-    
-    if "." in config['tablename']:
-        schema = config['tablename'].split(".")[0]
-        table_name = config['tablename'].split(".")[1]
-    else:
-        table_name = config['tablename']
-    
-    dic = {}
-    count = 0
-    for row in infos:
-        table_name = row[2]
-            
-        if row[2] == table_name:
-            if schema is not None and schema != row[1]:
-                continue
-            
-            if schema is None:
-                schema = row[1]
-                
-            column_name = row[3]
-            col_type = row[27]
-            
-            col_type = col_type.replace('character varying', 'VARCHAR')
-            col_type = col_type.replace('character', 'CHAR')
-            
-            col_type = col_type.upper()
-            
-            if 'DOUBLE' in col_type or 'FLOAT8' in col_type:
-                count = count + 1
-                dic[column_name] = 'DOUBLE'
-                
-            elif 'REAL' in col_type or 'FLOAT4' in col_type or 'FLOAT' in col_type:
-                count = count + 1
-                dic[column_name] = 'REAL'
-                
-            elif 'SMALLINT' in col_type or 'SHORT' in col_type:
-                count = count + 1
-                dic[column_name] = 'SMALLINT'
-            
-            elif 'INTEGER' in col_type:
-                count = count + 1
-                dic[column_name] = 'INTEGER'
-                
-            elif 'LONG' in col_type or 'BIGINT' in col_type:
-                count = count + 1
-                dic[column_name] = 'BIGINT'
-            
-            elif 'INT' in col_type:
-                count = count + 1
-                dic[column_name] = 'BIGINT'
-            
-            elif 'BOOL' in col_type:
-                count = count + 1
-                dic[column_name] = 'BOOL'
-                
-            elif 'CHAR' in col_type or 'TEXT' in col_type:
-                count = count + 1
-                dic[column_name] = 'VARCHAR'
-            
-            else:
-                control.critical(f'did not found type representation for: {col_type} on column: {column_name}')
+from psycopg2.extras import execute_values
+
+# columns of the tables (and views, VACs are often views) of a schema, `%s` = schema, table names or NULL for all
+TAP_COLUMNS_QUERY = """
+SELECT c.relname, a.attname, t.typname
+FROM   pg_attribute a
+JOIN   pg_class c ON c.oid = a.attrelid
+JOIN   pg_namespace n ON n.oid = c.relnamespace
+JOIN   pg_type t ON t.oid = a.atttypid
+WHERE  n.nspname = %s
+  AND  (%s::text[] IS NULL OR c.relname = ANY(%s::text[]))
+  AND  c.relkind IN ('r', 'p', 'v', 'm')
+  AND  a.attnum > 0 AND NOT a.attisdropped
+ORDER BY c.relname, a.attnum
+"""
+
+# column rows of the mapped tables (schema.table), and the ones older versions wrote under the
+# bare table name when no other schema has a table of that name
+DELETE_COLUMNS_QUERY = """
+DELETE FROM "TAP_SCHEMA"."columns" c
+WHERE  c.table_name = ANY(%s)
+   OR  (c.table_name = ANY(%s) AND NOT EXISTS (
+           SELECT 1 FROM "TAP_SCHEMA"."tables" t WHERE t.table_name = c.table_name AND t.schema_name <> %s))
+"""
 
-    ##Insert Columns
-    querycols = []
-    for column in dic:
-        if column in dic:
-            if column == 'ID' or column == 'RA' or column == 'DEC':
-                principal = 1
-                indexed = 0
-                query = f"""INSERT INTO "TAP_SCHEMA"."columns" VALUES ('{table_name}', '{column}', '{dic[column]}', -1, 1, '', NULL, NULL, NULL, {indexed}, {principal}, 0, NULL);"""
-                querycols.append(query)
-            else:
-                principal = 0
-                indexed = 0
-                query = f"""INSERT INTO "TAP_SCHEMA"."columns" VALUES ('{table_name}', '{column}', '{dic[column]}', -1, 1, '', NULL, NULL, NULL, {indexed}, {principal}, 0, NULL);"""
-                querycols.append(query)
+INSERT_SCHEMA_QUERY = """
+INSERT INTO "TAP_SCHEMA"."schemas"
+SELECT %s, %s, %s WHERE NOT EXISTS (SELECT 1 FROM "TAP_SCHEMA"."schemas" WHERE schema_name = %s)
+"""
 
-    for com in querycols:
-        pg_conn.execute_query(com)
+def tap_rows(schema, columns, principal=("id", "ra", "dec")):
+    """
+    Rows of "TAP_SCHEMA"."schemas", "tables" and "columns" for `columns`, a list of
+    (table, column, PostgreSQL type name). Tables are named schema.table, as TAP clients query
+    them, so tables of the same name in different schemas keep their own rows. Columns named in
+    `principal` (any case) are flagged principal.
+    """
+    principal = {name.lower() for name in principal if name}
+    tables = []
+    column_rows = []
+    for table, column, col_type in columns:
+        datatype = db_type(col_type, column)
+        if datatype is None:
+            continue
+        if table not in tables:
+            tables.append(table)
+        column_rows.append((f"{schema}.{table}", column, datatype, -1, 1, '', None, None, None, 0,
+                            int(column.lower() in principal), 0, None))
 
-    ##Insert schema 
+    schema_rows = [(schema, None, None)]
+    table_rows = [(schema, f"{schema}.{table}", 'table', None, None, None) for table in tables]
+    return schema_rows, table_rows, column_rows
+
+def write_tap_rows(pg_conn, schema, schema_rows, table_rows, column_rows):
+    """
+    Replace the TAP_SCHEMA rows of the mapped tables of `schema` in one transaction.
+
+    The schema row is only added when missing: the rows of the other tables of the schema
+    reference it. Rows written by older versions under the bare table name are replaced too,
+    unless another schema registered a table of that name.
+    """
+    tables = [row[1] for row in table_rows]
+    names = [table.split(".", 1)[1] for table in tables]
+    conn = pg_conn.get_connection()
     try:
-        query = f"""INSERT INTO "TAP_SCHEMA"."schemas" VALUES ('{schema}', NULL, NULL);"""
-        pg_conn.execute_query(query)
-    except:
-        control.critical(f'Could not insert schema {schema}')
+        with conn.cursor() as cur:
+            cur.execute(DELETE_COLUMNS_QUERY, (tables, names, schema))
+            cur.execute('DELETE FROM "TAP_SCHEMA"."tables" WHERE schema_name = %s AND table_name = ANY(%s);', (schema, tables + names))
+            cur.execute(INSERT_SCHEMA_QUERY, (*schema_rows[0], schema))
+            execute_values(cur, 'INSERT INTO "TAP_SCHEMA"."tables" VALUES %s', table_rows)
+            execute_values(cur, 'INSERT INTO "TAP_SCHEMA"."columns" VALUES %s', column_rows, page_size=1000)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pg_conn.release_connection(conn)
+
+def map_tables(config, schema, tables=None):
+    """
+    Register `tables` of `schema` (every table and view of it when None) in TAP_SCHEMA.
+
+    The rows are built in memory from one catalog query and written in a single
+    transaction, replacing the existing rows of those tables. Returns the number of
+    tables mapped.
+    """
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    try:
+        columns = pg_conn.execute_query(TAP_COLUMNS_QUERY, (schema, tables, tables), fetch=True) or []
+        principal = ("id", "ra", "dec", config.get("id_col"), config.get("ra_col"), config.get("dec_col"))
+        schema_rows, table_rows, column_rows = tap_rows(schema, columns, principal)
+
+        if not table_rows:
+            control.warn(f"nothing to map in schema {schema}")
+            return 0
+
+        try:
+            write_tap_rows(pg_conn, schema, schema_rows, table_rows, column_rows)
+        except Exception as e:
+            control.critical(f"could not map schema {schema} to TAP_SCHEMA: {e}")
+            return 0
+    finally:
+        pg_conn.close()
+
+    for table in tables or []:
+        if f"{schema}.{table}" not in [row[1] for row in table_rows]:
+            control.warn(f"table {schema}.{table} not found")
+    control.info(f"succesfully mapped {len(table_rows)} tables of {schema} with {len(column_rows)} columns")
+    return len(table_rows)
+
+def map_table(config):
+    """Register `config["tablename"]` (schema.table, default schema public) in TAP_SCHEMA."""
+    if "." in config['tablename']:
+        schema, table_name = config['tablename'].split(".", 1)
+    else:
+        schema, table_name = "public", config['tablename']
+    return map_tables(config, schema, [table_name])
 
-    ##Insert Table
-    query = f"""INSERT INTO "TAP_SCHEMA"."tables" VALUES ('{schema}', '{table_name}', 'table', NULL, NULL, NULL);"""
-    pg_conn.execute_query(query)
-    
-    pg_conn.close()
-    control.info(f'succesfully mapped table {table_name} with {count} columns')
\ No newline at end of file
+def map_schema(config, schema):
+    """Register every table and view of `schema` (e.g. a schema of VACs) in TAP_SCHEMA."""
+    return map_tables(config, schema)
@@ -0,0 +1,90 @@
+import psutil
+import logpool as control
+
+# compressed text inputs expand a lot once parsed, uncompressed ones roughly 1:1
+GZIP_EXPANSION = 5
+
+def current_rss():
+    """Resident set size of the current process, in bytes."""
+    return psutil.Process().memory_info().rss
+
+def raw_task_bytes(task, n_rows, row_bytes):
+    """Decoded size of a task's rows, falling back on the file size when the header is not readable."""
+    if n_rows is not None and row_bytes is not None:
+        if task["row_range"] is not None:
+            start, stop = task["row_range"]
+            return int((stop - start) * row_bytes)
+        return int(n_rows * row_bytes)
+
+    if isinstance(task["filepath"], str) and task["filepath"].endswith(".gz"):
+        return task["size"] * GZIP_EXPANSION
+    return task["size"]
+
+class MemoryBudget:
+    """
+    Admission control for `parallel_insertion` under `general.memory_budget_mb`.
+
+    A task is estimated to need `raw_bytes * factor` of worker memory, where `raw_bytes`
+    comes from the file header (rows x row width) and `factor` accounts for the
+    astropy / python copies made while preprocessing and encoding. The factor starts
+    at `general.memory_expansion_factor` and is learned from the peak RSS reported by
+    the workers: it follows larger observations immediately and decays slowly.
+
+    A task only starts when its estimate fits in what is left of the budget, so small
+    files can keep more workers busy while a large one waits for room.
+    """
+
+    def __init__(self, config):
+        general = config["general"]
+        budget_mb = general.get("memory_budget_mb")
+
+        self.enabled = bool(budget_mb)
+        self.budget = int(budget_mb * 1024 ** 2) if budget_mb else None
+        self.factor = general.get("memory_expansion_factor", 4.0)
+        self.reserved = 0
+        self._reservations = {}
+
+    def estimate(self, task):
+        return int(task.get("raw_bytes", 0) * self.factor)
+
+    def fits(self, task):
+        if not self.enabled:
+            return True
+        return self.reserved + self.estimate(task) <= self.budget
+
+    def admit(self, task):
+        estimate = self.estimate(task) if self.enabled else 0
+        self._reservations[task["task_id"]] = estimate
+        self.reserved += estimate
+
+    def release(self, task, result):
+        self.reserved -= self._reservations.pop(task["task_id"], 0)
+
+        raw_bytes = task.get("raw_bytes")
+        peak = (result or {}).get("peak_rss_delta")
+        if not self.enabled or not raw_bytes or not peak:
+            return
+
+        observed = peak / raw_bytes
+        if observed > self.factor:
+            self.factor = observed
+        else:
+            self.factor = 0.9 * self.factor + 0.1 * observed
+
+    def next_task(self, pending, in_flight):
+        """
+        Pop the first pending task (`PendingTasks`, in scheduling order) that fits the budget.
+        When nothing is running the first task starts regardless, otherwise it would never run.
+        """
+        task = pending.pop(self.fits)
+        if task is not None:
+            return task
+
+        if pending and not in_flight:
+            task = pending.pop()
+            control.warn(
+                f"{task['filepath']} needs ~{self.estimate(task) / 1024 ** 2:.0f} MB, "
+                f"above the memory budget; running it alone"
+            )
+            return task
+        return None
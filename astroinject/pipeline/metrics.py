@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import threading
+import logpool as control
+
+def _human(n, unit=""):
+    for prefix in ("", "k", "M", "G", "T"):
+        if abs(n) < 1000:
+            return f"{n:.1f}{prefix}{unit}"
+        n /= 1000
+    return f"{n:.1f}P{unit}"
+
+def _duration(seconds):
+    if seconds is None:
+        return "?"
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s"
+
+class IngestionMetrics:
+    """
+    Aggregates the result dicts returned by the workers of `parallel_insertion`.
+
+    Tracks files / tasks done and remaining, rows read and copied, bytes read from disk
+    (`bytes_in`) and sent to the server (`bytes_out`), time per stage and errors.
+    Every `general.metrics_interval` seconds (default 30) a progress line is logged and,
+    when `general.metrics_file` is set, a snapshot is written there: Prometheus text
+    format if the name ends in `.prom`, JSON otherwise.
+    """
+
+    def __init__(self, tasks, config, rows_total=None):
+        general = config.get("general", {})
+        self.table = config["tablename"]
+        self.path = general.get("metrics_file")
+        self.interval = general.get("metrics_interval", 30)
+
+        self.tasks_total = 0
+        # rows of every file when known (`general.prescan`), the ETA then follows rows read
+        self.rows_total = rows_total
+        self.bytes_total = 0
+        self.files_total = 0
+        self.discovering = True
+        self._tasks_per_file = {}
+
+        self.tasks_done = 0
+        self.files_done = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.rows_rejected = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.status = {}
+        self.stages = {}
+        self.errors = []
+
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        for task in tasks:
+            self.add_task(task)
+        if tasks:
+            self.discovery_done()
+
+    def add_task(self, task):
+        """Account for a newly scheduled task (files can be discovered while loading)."""
+        with self._lock:
+            self.tasks_total += 1
+            self.bytes_total += task["size"]
+            key = str(task["filepath"])
+            if key not in self._tasks_per_file:
+                self.files_total += 1
+                self._tasks_per_file[key] = 0
+            self._tasks_per_file[key] += 1
+
+    def discovery_done(self):
+        with self._lock:
+            self.discovering = False
+
+    def record(self, task, result):
+        with self._lock:
+            self.tasks_done += 1
+            self.bytes_in += task["size"]
+
+            key = str(task["filepath"])
+            self._tasks_per_file[key] -= 1
+            if self._tasks_per_file[key] == 0:
+                self.files_done += 1
+
+            status = result.get("status", "error")
+            self.status[status] = self.status.get(status, 0) + 1
+            self.rows_in += result.get("rows_in", 0)
+            self.rows_out += result.get("rows", 0)
+            self.rows_rejected += result.get("rejected", 0)
+            self.bytes_out += result.get("bytes_out", 0)
+            for stage, seconds in result.get("stages", {}).items():
+                self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+            if status == "error":
+                self.errors.append({"task": key, "row_range": task["row_range"], "error": result.get("error")})
+
+    def snapshot(self):
+        with self._lock:
+            elapsed = time.time() - self.started
+            eta = None
+            if self.rows_total and self.rows_in:
+                eta = elapsed * max(0, self.rows_total - self.rows_in) / self.rows_in
+            elif self.bytes_in and self.bytes_total:
+                eta = elapsed * (self.bytes_total - self.bytes_in) / self.bytes_in
+            return {
+                "table": self.table,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": eta,
+                "files_total": self.files_total,
+                "files_done": self.files_done,
+                "files_remaining": self.files_total - self.files_done,
+                "tasks_total": self.tasks_total,
+                "tasks_done": self.tasks_done,
+                "rows_total": self.rows_total,
+                "rows_in": self.rows_in,
+                "rows_out": self.rows_out,
+                "rows_rejected": self.rows_rejected,
+                "bytes_total": self.bytes_total,
+                "bytes_in": self.bytes_in,
+                "bytes_out": self.bytes_out,
+                "rows_per_second": self.rows_out / elapsed if elapsed else 0.0,
+                "bytes_in_per_second": self.bytes_in / elapsed if elapsed else 0.0,
+                "bytes_out_per_second": self.bytes_out / elapsed if elapsed else 0.0,
+                "status": dict(self.status),
+                "stage_seconds": dict(self.stages),
+                "discovering": self.discovering,
+                "errors": len(self.errors),
+                "last_errors": self.errors[-10:],
+            }
+
+    def progress_line(self, snap=None):
+        snap = snap or self.snapshot()
+        return (
+            f"files {snap['files_done']}/{snap['files_total']} | "
+            f"tasks {snap['tasks_done']}/{snap['tasks_total']} | "
+            f"rows {_human(snap['rows_out'])}"
+            + (f"/{_human(snap['rows_total'])}" if snap["rows_total"] else "")
+            + f" ({_human(snap['rows_per_second'], ' rows/s')}) | "
+            f"in {_human(snap['bytes_in_per_second'], 'B/s')} | "
+            f"out {_human(snap['bytes_out_per_second'], 'B/s')} | "
+            f"errors {snap['errors']} | "
+            + (f"rejected rows {snap['rows_rejected']} | " if snap["rows_rejected"] else "")
+            + f"elapsed {_duration(snap['elapsed_seconds'])} | ETA {_duration(snap['eta_seconds'])}"
+            + (" (still discovering files)" if snap["discovering"] else "")
+        )
+
+    def to_prometheus(self, snap):
+        labels = f'table="{self.table}"'
+        gauges = [
+            ("files_total", "Files scheduled for this run."),
+            ("files_done", "Files with every task finished."),
+            ("tasks_total", "Tasks (files or row ranges) scheduled."),
+            ("tasks_done", "Tasks finished, whatever their status."),
+            ("rows_in", "Rows read from the input files."),
+            ("rows_out", "Rows written through COPY."),
+            ("bytes_total", "Bytes on disk of every scheduled task."),
+            ("bytes_in", "Bytes on disk of finished tasks."),
+            ("bytes_out", "Bytes of COPY payload sent to the server."),
+            ("elapsed_seconds", "Seconds since the run started."),
+            ("errors", "Tasks that failed."),
+            ("rows_rejected", "Rows refused by COPY and quarantined."),
+        ]
+        lines = []
+        for name, help_text in gauges:
+            lines.append(f"# HELP astroinject_{name} {help_text}")
+            lines.append(f"# TYPE astroinject_{name} gauge")
+            lines.append(f"astroinject_{name}{{{labels}}} {snap[name]}")
+
+        if snap["rows_total"] is not None:
+            lines.append("# HELP astroinject_rows_total Rows of every input file, from the pre-scan.")
+            lines.append("# TYPE astroinject_rows_total gauge")
+            lines.append(f"astroinject_rows_total{{{labels}}} {snap['rows_total']}")
+
+        lines.append("# HELP astroinject_stage_seconds Worker time spent per stage.")
+        lines.append("# TYPE astroinject_stage_seconds gauge")
+        for stage, seconds in snap["stage_seconds"].items():
+            lines.append(f'astroinject_stage_seconds{{{labels},stage="{stage}"}} {seconds}')
+
+        lines.append("# HELP astroinject_tasks Finished tasks per status.")
+        lines.append("# TYPE astroinject_tasks gauge")
+        for status, count in snap["status"].items():
+            lines.append(f'astroinject_tasks{{{labels},status="{status}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, snap=None):
+        if not self.path:
+            return
+        snap = snap or self.snapshot()
+        if self.path.endswith(".prom"):
+            content = self.to_prometheus(snap)
+        else:
+            content = json.dumps(snap, indent=2, default=str)
+
+        # write + rename so readers never see a half written file
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(content)
+        os.replace(tmp, self.path)
+
+    def report(self):
+        snap = self.snapshot()
+        control.info(self.progress_line(snap))
+        try:
+            self.write(snap)
+        except Exception as e:
+            control.warn(f"could not write metrics to {self.path}: {e}")
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.report()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.report()
@@ -0,0 +1,155 @@
+import logpool as control
+from concurrent.futures import ThreadPoolExecutor
+
+from astroinject.io import open_table, read_table_shape, resolve_format
+from astroinject.processing import preprocess_table
+from astroinject.database.dbpool import PostgresConnectionManager
+from astroinject.database.utils import table_stats, merge_column_stats, pg_type_from_stats
+
+# columns of the target table with their type name (int4, float8, text...)
+TABLE_COLUMNS_QUERY = """
+SELECT a.attname, t.typname
+FROM   pg_attribute a
+JOIN   pg_type t ON t.oid = a.atttypid
+WHERE  a.attrelid = to_regclass(%s) AND a.attnum > 0 AND NOT a.attisdropped
+"""
+
+# PostgreSQL type names of `pg_type_from_stats`, from narrowest to widest
+PROMOTION_ORDER = ("SMALLINT", "INTEGER", "BIGINT", "NUMERIC", "FLOAT4", "FLOAT8", "TEXT")
+TYPNAMES = {
+    "int2": "SMALLINT", "int4": "INTEGER", "int8": "BIGINT", "numeric": "NUMERIC",
+    "float4": "FLOAT4", "float8": "FLOAT8", "text": "TEXT", "varchar": "TEXT", "bpchar": "TEXT",
+}
+
+def wider_type(a, b):
+    """
+    The wider of two `pg_type_from_stats` types of a column (scalars, or arrays of scalars,
+    in `PROMOTION_ORDER`); `a` when they cannot be compared, `b` when `a` is None.
+    """
+    if a is None:
+        return b
+    if b is None or a.endswith("[]") != b.endswith("[]"):
+        return a
+    base_a, base_b = a.replace("[]", ""), b.replace("[]", "")
+    if base_a in PROMOTION_ORDER and base_b in PROMOTION_ORDER and PROMOTION_ORDER.index(base_b) > PROMOTION_ORDER.index(base_a):
+        return b
+    return a
+
+def scan_file(path, config):
+    """
+    Row count and columns of one FITS / parquet file, read from its header and first row:
+    {"path", "rows", "columns": {final column name: `column_stats`}}, columns named as
+    after `preprocess_table`. Other formats are not scanned (`rows` and `columns` None).
+    """
+    scan = {"path": path, "rows": None, "columns": None}
+    format = resolve_format(path, config)
+    if format != "fits" and format != "parquet" and ".parquet" not in path:
+        return scan
+
+    scan["rows"], _ = read_table_shape(path, config)
+    table = preprocess_table(open_table(path, config, row_range=(0, 1)), config)
+    scan["columns"] = table_stats(table)
+    for stats in scan["columns"].values():
+        # one row says nothing about the range of the column, types follow the dtypes
+        stats["min"] = stats["max"] = None
+    return scan
+
+def prescan(files, config):
+    """`scan_file` of every file, `general.prescan_threads` (default 8) at a time."""
+    paths = [item[0] if isinstance(item, tuple) else item for item in files]
+
+    def scan(path):
+        try:
+            return scan_file(path, config)
+        except Exception as e:
+            return {"path": path, "rows": None, "columns": None, "error": str(e)}
+
+    with ThreadPoolExecutor(max_workers=config.get("general", {}).get("prescan_threads", 8)) as executor:
+        return list(executor.map(scan, paths))
+
+def union_schema(scans):
+    """Column stats of the union of the columns of all scans, types promoted (see `merge_column_stats`)."""
+    union = {}
+    for scan in scans:
+        for col, stats in (scan["columns"] or {}).items():
+            union[col] = merge_column_stats(union[col], stats) if col in union else stats
+    return union
+
+def schema_drift(scans, union_types):
+    """
+    Per file differences with the union schema: {"path", "missing": [columns],
+    "promoted": {column: (file type, union type)}}, only for files that differ.
+    """
+    drift = []
+    for scan in scans:
+        if scan["columns"] is None:
+            continue
+        missing = [col for col in union_types if col not in scan["columns"]]
+        promoted = {}
+        for col, stats in scan["columns"].items():
+            file_type = pg_type_from_stats(stats)
+            if file_type != union_types.get(col):
+                promoted[col] = (file_type, union_types.get(col))
+        if missing or promoted:
+            drift.append({"path": scan["path"], "missing": missing, "promoted": promoted})
+    return drift
+
+def apply_union_schema(config, union_types):
+    """
+    Add the columns of `union_types` missing from `config["tablename"]` (ALTER TABLE ... ADD COLUMN,
+    in one transaction) and warn about existing columns narrower than the union type.
+    Returns the columns added.
+    """
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    try:
+        existing = dict(pg_conn.execute_query(TABLE_COLUMNS_QUERY, (config["tablename"],), fetch=True) or [])
+        added = [col for col in union_types if col not in existing]
+
+        for col, typname in existing.items():
+            current, wanted = TYPNAMES.get(typname), union_types.get(col)
+            if current in PROMOTION_ORDER and wanted in PROMOTION_ORDER and PROMOTION_ORDER.index(wanted) > PROMOTION_ORDER.index(current):
+                control.warn(f"column {col} is {current} in {config['tablename']} but some files need {wanted}")
+
+        if added:
+            query = f"ALTER TABLE {config['tablename']} " + ", ".join(
+                f"ADD COLUMN IF NOT EXISTS {col} {union_types[col]} NULL" for col in added
+            ) + ";"
+            control.info(f"executing:\n{query}")
+            pg_conn.execute_query(query)
+    finally:
+        pg_conn.close()
+    return added
+
+def run_prescan(files, config):
+    """
+    Pre-scan stage of `parallel_insertion` (`general.prescan`): scan every file, report
+    the per-file schema drift and return (PostgreSQL type of every column of the union
+    schema, total rows or None when some file could not be scanned).
+    """
+    scans = prescan(files, config)
+    union_types = {}
+    for col, stats in union_schema(scans).items():
+        pg_type = pg_type_from_stats(stats)
+        if pg_type is not None:
+            union_types[col] = pg_type
+
+    for scan in scans:
+        if "error" in scan:
+            control.warn(f"could not scan {scan['path']}: {scan['error']}")
+
+    drift = schema_drift(scans, union_types)
+    for item in drift:
+        details = []
+        if item["missing"]:
+            details.append(f"missing {', '.join(item['missing'])}")
+        for col, (file_type, union_type) in item["promoted"].items():
+            details.append(f"{col} {file_type} -> {union_type}")
+        control.warn(f"schema drift in {item['path']}: {'; '.join(details)}")
+
+    scanned = [scan for scan in scans if scan["rows"] is not None]
+    rows_total = sum(scan["rows"] for scan in scanned) if len(scanned) == len(scans) else None
+    control.info(
+        f"pre-scan: {len(scanned)}/{len(scans)} files scanned, {len(union_types)} columns, "
+        f"{len(drift)} files with schema drift, {sum(scan['rows'] for scan in scanned)} rows"
+    )
+    return union_types, rows_total
@@ -0,0 +1,185 @@
+import os
+import heapq
+import itertools
+import logpool as control
+
+from astroinject.io import read_table_shape, resolve_format, open_table, parquet_row_group_bounds
+from astroinject.spatial import table_pixels, source_column
+from astroinject.pipeline.memory import raw_task_bytes
+
+def task_label(task):
+    """Human readable name of a task, used in logs."""
+    if task["row_range"] is None:
+        return str(task["filepath"])
+    start, stop = task["row_range"]
+    return f"{task['filepath']}[{start}:{stop}]"
+
+def split_row_ranges(stop, split_rows, bounds=None, start=0):
+    """
+    Split rows [start, stop) into consecutive (start, stop) ranges of at most `split_rows` rows.
+    With `bounds` (row group offsets of a parquet file, see `parquet_row_group_bounds`) ranges
+    end on row group boundaries instead, at least `split_rows` rows each when possible,
+    so that no row group is decoded by two tasks.
+    """
+    if bounds is None:
+        cuts = list(range(start, stop, split_rows)) + [stop]
+    else:
+        cuts = [start]
+        for bound in bounds:
+            if bound >= stop:
+                break
+            if bound - cuts[-1] >= split_rows:
+                cuts.append(bound)
+        cuts.append(stop)
+    return [(lo, hi) for lo, hi in zip(cuts, cuts[1:]) if hi > lo]
+
+def file_tasks(filepath, config, size=None):
+    """
+    Tasks of a single file: one task for the whole file, or row-range tasks when it has
+    more than `general.split_rows` rows (FITS binary tables and parquet only).
+
+    Each task is a dict with `filepath`, `row_range` (None for the whole file),
+    `size` (bytes on disk), `raw_bytes` (decoded size, used by the memory budget) and
+    `file_tasks` (number of tasks of the file). Parquet ranges follow row groups.
+    """
+    if not isinstance(filepath, str):
+        # in-memory astropy table
+        return [{"filepath": filepath, "row_range": None, "size": 0, "raw_bytes": 0}]
+
+    general = config.get("general", {})
+    split_rows = general.get("split_rows")
+    read_headers = bool(split_rows or general.get("memory_budget_mb"))
+
+    if size is None:
+        size = os.path.getsize(filepath)
+
+    n_rows = row_bytes = None
+    if read_headers:
+        try:
+            n_rows, row_bytes = read_table_shape(filepath, config)
+        except Exception as e:
+            control.warn(f"could not read the header of {filepath}: {e}")
+
+    tasks = []
+    if split_rows and n_rows and n_rows > split_rows:
+        bounds = parquet_row_group_bounds(filepath) if resolve_format(filepath, config) != "fits" else None
+        ranges = split_row_ranges(n_rows, split_rows, bounds)
+        control.info(f"splitting {filepath} ({n_rows} rows) into {len(ranges)} row-range tasks")
+        for start, stop in ranges:
+            tasks.append({
+                "filepath": filepath,
+                "row_range": (start, stop),
+                "size": size * (stop - start) // n_rows,
+            })
+    else:
+        tasks.append({"filepath": filepath, "row_range": None, "size": size})
+
+    for task in tasks:
+        # a file is complete once all its tasks committed (see `CompletionLedger`)
+        task["file_tasks"] = len(tasks)
+        task["raw_bytes"] = raw_task_bytes(task, n_rows, row_bytes)
+        if config.get("spatial_schedule"):
+            task["pixel"] = task_pixel(task, config)
+    return tasks
+
+def task_pixel(task, config):
+    """
+    Coarse HEALPix pixel of the first row of a task, used to load the files in sky order.
+    Only FITS binary tables and parquet files are probed (they can read a single row);
+    None for the others or when the probe fails.
+    """
+    if resolve_format(task["filepath"], config) not in ("fits", "parquet"):
+        return None
+    start = task["row_range"][0] if task["row_range"] else 0
+    try:
+        table = open_table(task["filepath"], config, row_range=(start, start + 1))
+        pixels = table_pixels(
+            table,
+            source_column(config, config["ra_col"]),
+            source_column(config, config["dec_col"]),
+            config.get("spatial_schedule_order", 8),
+        )
+    except Exception as e:
+        control.warn(f"could not read the position of {task_label(task)}: {e}")
+        return None
+    return int(pixels[0]) if len(pixels) and pixels[0] >= 0 else None
+
+def task_order_key(task):
+    """Tasks with a sky pixel (`spatial_schedule`) first, in pixel order, then the others largest first."""
+    if task.get("pixel") is not None:
+        return (0, task["pixel"])
+    return (1, -task["size"])
+
+def build_tasks(files, config):
+    """
+    Turn a list of files (paths or `(path, size)` pairs) into the work list consumed
+    by `parallel_insertion`, see `file_tasks`.
+
+    Tasks are ordered largest first so the long tail is made of small files
+    (or in sky order with `spatial_schedule`, see `task_order_key`),
+    and numbered with a `task_id`.
+    """
+    tasks = []
+    for item in files:
+        filepath, size = item if isinstance(item, tuple) else (item, None)
+        tasks.extend(file_tasks(filepath, config, size))
+
+    tasks.sort(key=task_order_key)
+    for task_id, task in enumerate(tasks):
+        task["task_id"] = task_id
+    return tasks
+
+class PendingTasks:
+    """
+    Tasks waiting to be submitted, in scheduling order (`task_order_key`, then arrival order).
+
+    Kept as a heap, so queueing a discovered task is O(log n) whatever the number of files;
+    a list already in scheduling order (`build_tasks`) is taken as is.
+    """
+
+    def __init__(self, tasks=()):
+        self._seq = itertools.count()
+        self._heap = [(task_order_key(task), next(self._seq), task) for task in tasks]
+        heapq.heapify(self._heap)
+
+    def __len__(self):
+        return len(self._heap)
+
+    def add(self, task):
+        heapq.heappush(self._heap, (task_order_key(task), next(self._seq), task))
+
+    def pop(self, accept=None):
+        """Remove and return the first task for which `accept(task)` is true (any when None), or None."""
+        skipped = []
+        found = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            if accept is None or accept(entry[2]):
+                found = entry[2]
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(self._heap, entry)
+        return found
+
+def stream_tasks(files, config, events):
+    """
+    Turn files into tasks as they are discovered (`files` may be a generator, e.g.
+    `iter_files_with_pattern`) and put `("task", task)` on the `events` queue, then
+    `("discovered", None)` once the iterator is exhausted. Meant to run in a thread.
+    """
+    task_id = 0
+    try:
+        for item in files:
+            filepath, size = item if isinstance(item, tuple) else (item, None)
+            try:
+                tasks = file_tasks(filepath, config, size)
+            except Exception as e:
+                control.critical(f"could not schedule {filepath}: {e}")
+                continue
+            for task in tasks:
+                task["task_id"] = task_id
+                task_id += 1
+                events.put(("task", task))
+    finally:
+        events.put(("discovered", None))
@@ -0,0 +1,214 @@
+import os
+import numpy as np
+import logpool as control
+from abc import ABC, abstractmethod
+
+from astroinject.database.dbpool import PostgresConnectionManager
+from astroinject.database.gen_base_queries import grid_table_name
+from astroinject.pipeline.checkpoint import checkpoint_statement
+from psycopg2.extras import execute_values
+from astroinject.profiling import stage
+
+class Sink(ABC):
+    """
+    Destination of the preprocessed tables written by `injection_procedure`.
+
+    `write` receives the preprocessed astropy table, a `records()` callable returning the
+    COPY records (converted once, only if a sink asks for them) and the task label.
+    It returns {"rows": rows written, "bytes": bytes produced} or raises on failure.
+    """
+    name = None
+
+    def __init__(self, config):
+        self.config = config
+
+    @abstractmethod
+    def write(self, table, records, label):
+        pass
+
+    def close(self):
+        pass
+
+class PostgresSink(Sink):
+    """
+    COPY into `config["tablename"]`, the default sink.
+    With `skip_existing_ids` and an `id_col`, rows whose id is already in the table are
+    skipped (COPY into a temporary table, then INSERT ... ON CONFLICT DO NOTHING).
+    With `dedup_columns`, the wavelength grids of the table not yet in `<tablename>_grids`
+    are added there first (see `dedup_grid_columns`).
+    With `quarantine_dir`, rows refused by the server do not fail the task: the COPY is
+    bisected down to them (see `copy_isolating`), the others are loaded and the refused rows
+    are written to `quarantine_dir` with their error (`quarantine_format`: parquet or csv).
+    The checkpoint of a chunk (`table.meta["checkpoint"]`, see `checkpointed_injection`)
+    is saved in the COPY transaction, so a chunk is never committed without it.
+    """
+    name = "postgres"
+
+    def write(self, table, records, label):
+        rows = records()
+        id_col = self.config.get("id_col")
+        isolate = bool(self.config.get("quarantine_dir"))
+        before_commit = []
+        if table.meta.get("checkpoint"):
+            before_commit.append(checkpoint_statement(self.config, table.meta["checkpoint"]))
+        pg_conn = PostgresConnectionManager(use_pool=False, **self.config["database"])
+        try:
+            if table.meta.get("grids"):
+                with stage("insert_grids"):
+                    insert_grids(pg_conn, self.config["tablename"], table.meta["grids"])
+            with stage("insert_data_copy"):
+                if self.config.get("skip_existing_ids") and id_col:
+                    copied = pg_conn.insert_data_copy_w_idhandling(self.config["tablename"], table.columns, rows, id_col, isolate=isolate, before_commit=before_commit)
+                    written = copied or 0
+                    copied = copied is not None
+                else:
+                    copied = pg_conn.insert_data_copy(self.config["tablename"], table.columns, rows, isolate=isolate, before_commit=before_commit)
+                    written = len(rows) - len(pg_conn.last_rejects)
+        finally:
+            pg_conn.close()
+        if not copied:
+            raise RuntimeError("COPY failed")
+        if pg_conn.last_rejects:
+            with stage("write_quarantine"):
+                path = write_quarantine(table, pg_conn.last_rejects, label, self.config)
+            control.warn(f"{len(pg_conn.last_rejects)} rows of {label} refused, written to {path}")
+        return {"rows": written, "bytes": pg_conn.last_copy_bytes, "rejected": len(pg_conn.last_rejects)}
+
+def insert_grids(pg_conn, table_name, grids):
+    """Add the grids ({grid id: array}) missing from the companion table of `table_name`, in one statement."""
+    conn = pg_conn.get_connection()
+    try:
+        with conn.cursor() as cur:
+            execute_values(
+                cur,
+                f"INSERT INTO {grid_table_name(table_name)} (grid_id, grid) VALUES %s ON CONFLICT (grid_id) DO NOTHING",
+                [(grid, np.asarray(values, dtype=np.float64).tolist()) for grid, values in grids.items()],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pg_conn.release_connection(conn)
+
+class NullSink(Sink):
+    """Encode the COPY payload exactly as `PostgresSink` would, then drop it. Measures client side throughput."""
+    name = "null"
+
+    def write(self, table, records, label):
+        rows = records()
+        with stage("encode_copy_records"):
+            payload = PostgresConnectionManager.encode_copy_records(rows)
+        return {"rows": len(rows), "bytes": payload.seek(0, os.SEEK_END)}
+
+def table_to_arrow(table):
+    """Convert a preprocessed astropy table (masked, multidimensional and object columns included) to pyarrow."""
+    import pyarrow as pa
+
+    arrays = []
+    for col in table.colnames:
+        data = table[col]
+        mask = np.asarray(data.mask) if hasattr(data, "mask") else None
+
+        if data.dtype == object or data.ndim > 1:
+            values = [None if v is None else np.asarray(v).tolist() for v in data]
+            if mask is not None and mask.ndim == 1:
+                values = [None if m else v for v, m in zip(values, mask)]
+            arrays.append(pa.array(values))
+        else:
+            values = np.asarray(data)
+            if not values.dtype.isnative:
+                # FITS columns are big endian, arrow only takes native byte order
+                values = values.astype(values.dtype.newbyteorder("="))
+            if mask is not None and mask.any():
+                arrays.append(pa.array(values, mask=mask))
+            else:
+                arrays.append(pa.array(values))
+    return pa.Table.from_arrays(arrays, names=table.colnames)
+
+def _file_name(label):
+    name = os.path.basename(label)
+    for ch in "[]:":
+        name = name.replace(ch, "_")
+    return name
+
+def write_quarantine(table, rejects, label, config):
+    """
+    Write the rows of `table` refused by COPY (`rejects`: [(row index, error)]) to
+    `quarantine_dir`, with an `astroinject_error` column. Returns the path written.
+    """
+    folder = config["quarantine_dir"]
+    os.makedirs(folder, exist_ok=True)
+    rejected = table[[index for index, _ in rejects]]
+    errors = [error for _, error in rejects]
+
+    if config.get("quarantine_format", "parquet") == "csv":
+        import csv
+        path = os.path.join(folder, f"{_file_name(label)}.rejects.csv")
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(rejected.colnames + ["astroinject_error"])
+            for row, error in zip(rejected, errors):
+                writer.writerow([row[col] for col in rejected.colnames] + [error])
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        path = os.path.join(folder, f"{_file_name(label)}.rejects.parquet")
+        arrow_table = table_to_arrow(rejected).append_column("astroinject_error", pa.array(errors))
+        pq.write_table(arrow_table, path)
+    return path
+
+class ParquetSink(Sink):
+    """
+    Write the preprocessed, sanitized table to `parquet_sink_dir` (one file per task),
+    i.e. a columnar copy of exactly what is loaded in the database.
+    """
+    name = "parquet"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.folder = config.get("parquet_sink_dir")
+        if not self.folder:
+            raise ValueError("the parquet sink needs `parquet_sink_dir` in the config")
+        self.compression = config.get("parquet_sink_compression", "zstd")
+        os.makedirs(self.folder, exist_ok=True)
+
+    def output_path(self, label):
+        return os.path.join(self.folder, f"{_file_name(label)}.parquet")
+
+    def write(self, table, records, label):
+        import pyarrow.parquet as pq
+
+        path = self.output_path(label)
+        with stage("write_parquet"):
+            pq.write_table(table_to_arrow(table), path, compression=self.compression)
+            if table.meta.get("grids"):
+                # grids of the `<column>_grid_id` columns, next to the file
+                import pyarrow as pa
+                grids = table.meta["grids"]
+                pq.write_table(pa.table({
+                    "grid_id": list(grids), "grid": [np.asarray(v).tolist() for v in grids.values()],
+                }), path.replace(".parquet", ".grids.parquet"), compression=self.compression)
+        return {"rows": len(table), "bytes": os.path.getsize(path)}
+
+SINKS = {sink.name: sink for sink in (PostgresSink, NullSink, ParquetSink)}
+
+def sink_names(config):
+    names = config.get("sinks") or ["postgres"]
+    if isinstance(names, str):
+        names = [names]
+    for name in names:
+        if name not in SINKS:
+            raise ValueError(f"unknown sink {name}, available: {list(SINKS)}")
+    return names
+
+def uses_database(config):
+    """True when the data goes to PostgreSQL, i.e. table creation, id checks and indexes apply."""
+    return "postgres" in sink_names(config)
+
+def open_sinks(config):
+    return [SINKS[name](config) for name in sink_names(config)]
+
+def counting_sink(sinks):
+    """The sink whose row count is reported (rows now in the table): the database one, else the first."""
+    return next((sink for sink in sinks if isinstance(sink, PostgresSink)), sinks[0] if sinks else None)
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import fnmatch
+
+import logpool as control
+from astropy.table import vstack
+
+from astroinject.io import open_table
+from astroinject.processing import preprocess_table
+from astroinject.database.utils import convert_table_to_postgres_records
+from astroinject.database.dbpool import PostgresConnectionManager
+from astroinject.database.types import build_type_map
+from astroinject.pipeline.sinks import open_sinks, counting_sink, uses_database
+
+# directories modified less than this many seconds before they were listed are listed
+# again at the next poll: a file created in the same mtime tick would otherwise be missed
+MTIME_SLACK = 2
+
+class FolderWatcher:
+    """
+    Tracks the files of `folder` matching `patterns` across polls, by size and mtime.
+
+    Only directories whose mtime changed are listed again (adding, removing or renaming
+    a file updates the mtime of its directory), the others are a single `stat`.
+    A new or changed file is returned by `poll` once its size and mtime did not move
+    between two polls, i.e. once whoever writes it is done.
+
+    Files rewritten in place do not touch their directory: `rescan_interval` seconds
+    (None to disable) forces every directory to be listed again to catch them.
+
+    The state (files loaded or failed, directory mtimes) is kept in `state_path`
+    so a restarted watcher picks up where it stopped.
+    """
+
+    def __init__(self, folder, patterns, state_path, rescan_interval=None):
+        self.folder = folder
+        self.patterns = [patterns] if isinstance(patterns, str) else list(patterns)
+        self.state_path = state_path
+        self.rescan_interval = rescan_interval
+
+        self.loaded = {}    # path -> [size, mtime_ns] of the version in the table
+        self.failed = {}    # path -> [size, mtime_ns] of a version that could not be loaded
+        self.dirs = {}      # dir -> [mtime_ns, subdirs]
+        self.changing = {}  # path -> (size, mtime_ns) seen at the last poll, not stable yet
+        self.last_rescan = time.time()
+        self.load_state()
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path) as f:
+            state = json.load(f)
+        self.loaded = state.get("loaded", {})
+        self.failed = state.get("failed", {})
+        self.dirs = state.get("dirs", {})
+        control.info(f"watch state {self.state_path}: {len(self.loaded)} files already loaded")
+
+    def save_state(self):
+        state = {"folder": self.folder, "loaded": self.loaded, "failed": self.failed, "dirs": self.dirs}
+        tmp = f"{self.state_path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def _matches(self, path):
+        return any(fnmatch.fnmatchcase(path, p) for p in self.patterns)
+
+    def _is_known(self, path, signature):
+        return self.loaded.get(path) == signature or self.failed.get(path) == signature
+
+    def _list(self, path, mtime, seen):
+        """List `path`, remember its subdirectories and collect matching files not loaded yet."""
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file() and self._matches(entry.path):
+                        st = entry.stat()
+                        signature = [st.st_size, st.st_mtime_ns]
+                        if not self._is_known(entry.path, signature):
+                            seen[entry.path] = tuple(signature)
+                except OSError:
+                    continue
+        if time.time() - mtime / 1e9 > MTIME_SLACK:
+            self.dirs[path] = [mtime, subdirs]
+        else:
+            self.dirs.pop(path, None)
+        return subdirs
+
+    def scan(self):
+        """Walk the folder, listing only changed directories. Returns {path: (size, mtime_ns)} of candidate files."""
+        if self.rescan_interval and time.time() - self.last_rescan > self.rescan_interval:
+            control.info(f"rescanning every directory of {self.folder}")
+            self.dirs = {}
+            self.last_rescan = time.time()
+
+        seen = {}
+        stack = [self.folder]
+        while stack:
+            path = stack.pop()
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                # directory removed
+                self.dirs.pop(path, None)
+                continue
+
+            known = self.dirs.get(path)
+            if known is not None and known[0] == mtime:
+                stack.extend(known[1])
+                continue
+            try:
+                stack.extend(self._list(path, mtime, seen))
+            except OSError as e:
+                control.warn(f"could not scan {path}: {e}")
+        return seen
+
+    def poll(self):
+        """Returns `(path, size)` of the new or changed files that stopped changing since the last poll."""
+        seen = self.scan()
+
+        # files still being written do not change their directory, look at them again
+        for path in self.changing:
+            if path in seen:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature = [st.st_size, st.st_mtime_ns]
+            if not self._is_known(path, signature):
+                seen[path] = tuple(signature)
+
+        ready = []
+        changing = {}
+        for path, signature in seen.items():
+            if self.changing.get(path) == signature:
+                ready.append((path, signature))
+            else:
+                changing[path] = signature
+        self.changing = changing
+        return ready
+
+    def mark_loaded(self, path, signature):
+        self.loaded[path] = list(signature)
+        self.failed.pop(path, None)
+
+    def mark_failed(self, path, signature):
+        """A failed file is tried again only when it changes."""
+        self.failed[path] = list(signature)
+
+def _batches(ready, config):
+    """Group ready files in micro-batches of at most `watch_batch_files` files / `watch_batch_bytes` bytes."""
+    general = config.get("general", {})
+    max_files = general.get("watch_batch_files", 50)
+    max_bytes = general.get("watch_batch_mb", 512) * 1024 ** 2
+
+    batch, size = [], 0
+    for path, signature in sorted(ready):
+        if batch and (len(batch) >= max_files or size + signature[0] > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append((path, signature))
+        size += signature[0]
+    if batch:
+        yield batch
+
+def _write_members(members, config):
+    """Write the tables of `members` ((path, signature, table) with the same columns) in one go, returns the rows written."""
+    table = vstack([member[2] for member in members], join_type="exact", metadata_conflicts="silent")
+    label = f"watch-{time.strftime('%Y%m%dT%H%M%S')}-{os.path.basename(members[0][0])}"
+    records = None
+
+    def get_records():
+        nonlocal records
+        if records is None:
+            records = convert_table_to_postgres_records(table)
+        return records
+
+    rows = 0
+    sinks = open_sinks(config)
+    counted = counting_sink(sinks)
+    for sink in sinks:
+        try:
+            written = sink.write(table, get_records, label)
+        finally:
+            sink.close()
+        if sink is counted:
+            rows = written["rows"]
+    return rows
+
+def load_batch(batch, watcher, types_map, config):
+    """
+    Read and preprocess every file of `batch`, then write them through the sinks in as
+    few COPYs as possible (one per distinct set of columns).
+    When a group fails, its files are written again one by one, so a bad file does not
+    block the others of its micro-batch.
+    """
+    groups = {}
+    for path, signature in batch:
+        try:
+            table = open_table(path, config)
+            if len(table) == 0:
+                control.warn(f"Table {path} is empty. Skipping...")
+                watcher.mark_loaded(path, signature)
+                continue
+            table = preprocess_table(table, config, types_map)
+        except Exception as e:
+            control.critical(f"could not read {path}: {e}")
+            watcher.mark_failed(path, signature)
+            continue
+        groups.setdefault(tuple(table.colnames), []).append((path, signature, table))
+
+    rows = 0
+    for members in groups.values():
+        try:
+            rows += _write_members(members, config)
+        except Exception as e:
+            if len(members) == 1:
+                control.critical(f"could not load {members[0][0]}: {e}")
+                watcher.mark_failed(members[0][0], members[0][1])
+                continue
+            control.warn(f"could not load {len(members)} files together ({members[0][0]}, ...): {e}, loading them one by one")
+            for member in members:
+                try:
+                    rows += _write_members([member], config)
+                except Exception as e:
+                    control.critical(f"could not load {member[0]}: {e}")
+                    watcher.mark_failed(member[0], member[1])
+                    continue
+                watcher.mark_loaded(member[0], member[1])
+            continue
+
+        for path, signature, _ in members:
+            watcher.mark_loaded(path, signature)
+    return rows
+
+def _table_exists(config):
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    try:
+        found = pg_conn.execute_query("SELECT to_regclass(%s);", (config["tablename"],), fetch=True)
+    finally:
+        pg_conn.close()
+    return bool(found and found[0][0])
+
+def watch_folder(config, baseline=False):
+    """
+    Long running incremental ingestion: poll `config["folder"]` every
+    `general.watch_interval` seconds (default 60) and load new or changed files into the
+    existing table, in micro-batches (see `FolderWatcher` and `load_batch`).
+
+    The table is never created here, run a normal injection first. When `id_col` is set,
+    rows whose id is already in the table are skipped, so changed files only add their new
+    rows; without it a changed file would be loaded twice and is skipped with a warning.
+
+    With `baseline`, the files present at start are recorded as loaded without being read
+    (for a folder that was loaded by a previous full run).
+    """
+    general = config.get("general", {})
+    interval = general.get("watch_interval", 60)
+    state_path = general.get("watch_state_file") or f"{config['tablename']}.watch.json"
+
+    if uses_database(config) and not _table_exists(config):
+        control.critical(f"table {config['tablename']} does not exist, run astroinject without --watch first")
+        return
+
+    config = dict(config)
+    config["skip_existing_ids"] = True
+
+    watcher = FolderWatcher(config["folder"], config["pattern"], state_path, general.get("watch_rescan_interval", 86400))
+    if baseline:
+        for path, signature in watcher.scan().items():
+            watcher.mark_loaded(path, signature)
+        watcher.save_state()
+        control.info(f"baseline: {len(watcher.loaded)} files recorded as loaded")
+
+    types_map = build_type_map(config) if config.get("force_cast_correction") and uses_database(config) else None
+
+    control.info(f"watching {config['folder']} for {config['pattern']} every {interval}s (state in {state_path})")
+    try:
+        while True:
+            ready = []
+            for path, signature in watcher.poll():
+                if path in watcher.loaded and not config.get("id_col"):
+                    control.warn(f"{path} changed but the table has no id_col to skip rows already loaded, not loading it again")
+                    watcher.mark_failed(path, signature)
+                    continue
+                ready.append((path, signature))
+
+            for batch in _batches(ready, config):
+                start = time.perf_counter()
+                rows = load_batch(batch, watcher, types_map, config)
+                watcher.save_state()
+                control.info(f"loaded {rows} rows from {len(batch)} files in {time.perf_counter() - start:.1f}s")
+
+            watcher.save_state()
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        control.info("stopping watch")
+    finally:
+        watcher.save_state()
@@ -1,9 +1,12 @@
 import numpy as np
+import hashlib
 import logpool as control
-from astropy.table import MaskedColumn
+from astropy.table import MaskedColumn, Column
 
 from astroinject.utils import first_valid_index
 from astroinject.database.types import force_cast_types
+from astroinject.profiling import stage
+from astroinject.spatial import add_pixel_column
 
 def vectorized_string_to_array(column_data):
     """Fully vectorized conversion of formatted string arrays to NumPy arrays (handling sequences properly)."""
@@ -37,6 +40,116 @@ def convert_str_arrays_to_arrays(table):
     return table
             
 
+def grid_id(values):
+    """Id of a wavelength grid: the first 8 bytes of the sha1 of its float32 values, as a signed BIGINT."""
+    digest = hashlib.sha1(np.asarray(values, dtype="<f4").tobytes()).digest()
+    return int.from_bytes(digest[:8], "little", signed=True)
+
+def dedup_object_grids(data, grids):
+    """Grid ids of an object or masked column of arrays (None for missing values), new grids added to `grids`."""
+    ids = []
+    seen = {}  # readers often put the same array object in every row
+    for value in data:
+        if value is None or (np.ma.is_masked(value) and np.ma.getmaskarray(value).all()):
+            ids.append(None)
+            continue
+        key = id(value)
+        if key not in seen:
+            # keep the value alive: rows of a masked 2D column are views, their id would be reused
+            seen[key] = (value, grid_id(value))
+            grids.setdefault(seen[key][1], np.asarray(value, dtype=np.float32))
+        ids.append(seen[key][1])
+    return ids
+
+def dedup_grid_columns(table, columns):
+    """
+    Replace each array column of `columns` (`dedup_columns`, e.g. wave_b or wave) by a
+    `<column>_grid_id` column, the `grid_id` of its value. The distinct grids are kept in
+    `table.meta["grids"]` ({id: float32 array}) and written once to `<tablename>_grids`.
+    """
+    grids = table.meta.setdefault("grids", {})
+    for col in columns:
+        col = col.lower()
+        if col not in table.colnames:
+            continue
+        data = table[col]
+        if data.dtype != object and data.ndim == 2 and not hasattr(data, "mask"):
+            # fixed-length grids (FITS vector columns): hash each distinct row once
+            unique, inverse = np.unique(np.asarray(data), axis=0, return_inverse=True)
+            unique_ids = [grid_id(row) for row in unique]
+            for grid, row in zip(unique_ids, unique):
+                grids.setdefault(grid, row.astype(np.float32))
+            ids = [unique_ids[i] for i in np.ravel(inverse)]
+        else:
+            ids = dedup_object_grids(data, grids)
+        index = table.colnames.index(col)
+        table.remove_column(col)
+        table.add_column(MaskedColumn(
+            np.array([0 if i is None else i for i in ids], dtype=np.int64),
+            mask=[i is None for i in ids], name=f"{col}_grid_id",
+        ), index=index)
+    return table
+
+def encode_bytea_columns(table, columns):
+    """
+    Store the float arrays of `columns` as raw little-endian float32 bytes (`bytea_columns`),
+    in the bytea hex text format (`\\x0a1b...`) COPY writes to BYTEA columns as is;
+    decode with `decode_float32_bytea` or the SQL `astroinject_float4_array`.
+    """
+    for col in columns:
+        col = col.lower()
+        if col not in table.colnames:
+            continue
+        table[col] = Column(
+            [None if value is None else "\\x" + np.asarray(value, dtype="<f4").tobytes().hex() for value in table[col]],
+            name=col, dtype=object,
+        )
+    return table
+
+def decode_float32_bytea(value):
+    """
+    Float32 array of a value of a `bytea_columns` column: bytes or memoryview from psycopg2,
+    or the hex text written by `encode_bytea_columns` (e.g. read back from the parquet sink).
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = bytes.fromhex(value[2:])
+    return np.frombuffer(bytes(value), dtype="<f4")
+
+# numpy dtype of each scalar PostgreSQL type `optimize_table_types` casts to
+PG_NUMPY_TYPES = {
+    "SMALLINT": np.int16,
+    "INTEGER": np.int32,
+    "BIGINT": np.int64,
+    "FLOAT4": np.float32,
+    "FLOAT8": np.float64,
+}
+
+def optimize_table_types(table, column_types):
+    """
+    Cast the numeric columns of `table` to the numpy dtype of their PostgreSQL type
+    (`column_types`, e.g. from `pg_type_from_stats`): less memory in the workers and a
+    shorter COPY payload for REAL columns. Integer columns are only cast when every
+    valid value fits; a column that does not is left as is (COPY will reject the row).
+    """
+    for col, pg_type in column_types.items():
+        if col not in table.colnames or pg_type not in PG_NUMPY_TYPES or table[col].ndim != 1:
+            continue
+        dtype = np.dtype(PG_NUMPY_TYPES[pg_type])
+        kind = table[col].dtype.kind
+        if table[col].dtype == dtype or kind not in "iuf" or (dtype.kind == "i" and kind == "f"):
+            continue
+
+        if dtype.kind == "i":
+            valid = np.ma.compressed(np.ma.asarray(table[col]))
+            info = np.iinfo(dtype)
+            if valid.size and (valid.min() < info.min or valid.max() > info.max):
+                control.warn(f"column {col} has values out of the {pg_type} range")
+                continue
+        table[col] = table[col].astype(dtype)
+    return table
+
 def preprocess_table(
         table, 
         config,
@@ -50,7 +163,8 @@ def preprocess_table(
         table.rename_column(col, col.lower())
     
     if types_map:
-        table = force_cast_types(table, types_map)
+        with stage("force_cast_types"):
+            table = force_cast_types(table, types_map)
     
     for col in table.colnames:
         if "|S" in str(table[col].dtype):
@@ -116,7 +230,18 @@ def preprocess_table(
             table.rename_column(col, new_col)
     
     table = convert_str_arrays_to_arrays(table)
-    # TODO: Add type optimization
-    #table = optimize_table_types(table)
+
+    if config.get("dedup_columns"):
+        table = dedup_grid_columns(table, config["dedup_columns"])
+
+    if config.get("bytea_columns"):
+        table = encode_bytea_columns(table, config["bytea_columns"])
+
+    if config.get("index_type") == "brin":
+        # stored HEALPix pixel column, indexed with BRIN after the load
+        table = add_pixel_column(table, config)
+    if config.get("column_types"):
+        # types inferred when the table was created (see `infer_types_files`)
+        table = optimize_table_types(table, config["column_types"])
     
     return table
\ No newline at end of file
@@ -0,0 +1,137 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import logpool as control
+
+_task = None
+
+def begin_task(name, format=None, profile=False):
+    """Start collecting stage records for one task in the current process."""
+    global _task
+    if profile and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _task = {"name": name, "format": format, "profile": profile, "stages": [], "stack": []}
+
+def end_task():
+    """Stop collecting and return the task record (None if no task was started)."""
+    global _task
+    task, _task = _task, None
+    if task is not None:
+        del task["stack"]
+    return task
+
+def _reset_peak():
+    # tracemalloc.reset_peak only exists from python 3.9 on
+    if hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+
+@contextmanager
+def stage(name):
+    """
+    Time the wrapped block as stage `name` of the current task.
+
+    Records wall time, and CPU time plus peak traced memory when the task is profiled.
+    Stages may nest (`force_cast_types` runs inside `preprocess_table`); each record
+    keeps its depth and its exclusive wall time. Outside a task this does nothing.
+    """
+    if _task is None:
+        yield
+        return
+
+    profile = _task["profile"]
+    stack = _task["stack"]
+    frame = {"stage": name, "depth": len(stack), "children_wall": 0.0}
+
+    if profile:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["peak_abs"] = max(stack[-1]["peak_abs"], peak)
+        frame["base"] = current
+        frame["peak_abs"] = current
+        _reset_peak()
+        cpu_start = time.process_time()
+
+    stack.append(frame)
+    wall_start = time.perf_counter()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        stack.pop()
+
+        record = {
+            "stage": name,
+            "depth": frame["depth"],
+            "wall": wall,
+            "self_wall": wall - frame["children_wall"],
+        }
+        if profile:
+            record["cpu"] = time.process_time() - cpu_start
+            frame["peak_abs"] = max(frame["peak_abs"], tracemalloc.get_traced_memory()[1])
+            record["peak_memory"] = frame["peak_abs"] - frame["base"]
+            _reset_peak()
+
+        if stack:
+            stack[-1]["children_wall"] += wall
+            if profile:
+                stack[-1]["peak_abs"] = max(stack[-1]["peak_abs"], frame["peak_abs"])
+
+        _task["stages"].append(record)
+
+def stage_seconds(task_record, depth=0):
+    """Wall seconds per stage at the given depth (top level stages by default)."""
+    seconds = {}
+    for record in task_record["stages"]:
+        if record["depth"] == depth:
+            seconds[record["stage"]] = seconds.get(record["stage"], 0.0) + record["wall"]
+    return seconds
+
+def summarize_profiles(task_records):
+    """
+    Aggregate profiled tasks per file format.
+
+    Returns {format: {"tasks": n, "stages": {stage: {wall, self_wall, cpu, peak_memory}},
+    "dominant_stage": stage with the largest exclusive wall time}}.
+    """
+    summary = {}
+    for task_record in task_records:
+        fmt = summary.setdefault(task_record["format"] or "unknown", {"tasks": 0, "stages": {}})
+        fmt["tasks"] += 1
+        for record in task_record["stages"]:
+            agg = fmt["stages"].setdefault(
+                record["stage"], {"wall": 0.0, "self_wall": 0.0, "cpu": 0.0, "peak_memory": 0}
+            )
+            agg["wall"] += record["wall"]
+            agg["self_wall"] += record["self_wall"]
+            agg["cpu"] += record.get("cpu", 0.0)
+            agg["peak_memory"] = max(agg["peak_memory"], record.get("peak_memory", 0))
+
+    for fmt in summary.values():
+        total = sum(agg["self_wall"] for agg in fmt["stages"].values())
+        for agg in fmt["stages"].values():
+            agg["share"] = agg["self_wall"] / total if total else 0.0
+        fmt["dominant_stage"] = max(fmt["stages"], key=lambda s: fmt["stages"][s]["self_wall"], default=None)
+    return summary
+
+def format_summary(summary):
+    lines = []
+    for fmt, info in summary.items():
+        lines.append(f"format {fmt} ({info['tasks']} tasks) - dominant stage: {info['dominant_stage']}")
+        lines.append(f"  {'stage':<36}{'wall s':>10}{'self s':>10}{'cpu s':>10}{'share':>8}{'peak MB':>10}")
+        stages = sorted(info["stages"].items(), key=lambda item: item[1]["self_wall"], reverse=True)
+        for name, agg in stages:
+            lines.append(
+                f"  {name:<36}{agg['wall']:>10.2f}{agg['self_wall']:>10.2f}{agg['cpu']:>10.2f}"
+                f"{agg['share']:>8.1%}{agg['peak_memory'] / 1024 ** 2:>10.1f}"
+            )
+    return "\n".join(lines)
+
+def write_profile_report(path, task_records):
+    """Write every task record plus the per-format summary to `path` (JSON) and log the summary."""
+    summary = summarize_profiles(task_records)
+    with open(path, "w") as f:
+        json.dump({"summary": summary, "tasks": task_records}, f, indent=2, default=str)
+    control.info(f"profile summary (full report in {path}):\n{format_summary(summary)}")
+    return summary
@@ -0,0 +1,158 @@
+import numpy as np
+
+# HEALPix order used to sort rows: nside = 2**16, pixels of ~3.2 arcsec
+DEFAULT_ORDER = 16
+
+def _spread_bits(v):
+    """Move bit i of `v` (uint64, < 2**29) to bit 2i."""
+    v = v & np.uint64(0x1FFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+def ang2pix_nest(order, ra, dec):
+    """
+    HEALPix NESTED pixel of (ra, dec) in degrees at resolution `order` (nside = 2**order, order <= 29).
+
+    Nested pixels are a Z-order curve inside each of the 12 base faces, so sorting rows by
+    pixel puts neighbours on the sky next to each other. Non finite coordinates get -1.
+    """
+    ra = np.asarray(ra, dtype=np.float64)
+    dec = np.asarray(dec, dtype=np.float64)
+    nside = 1 << order
+
+    valid = np.isfinite(ra) & np.isfinite(dec)
+    z = np.sin(np.radians(np.where(valid, np.clip(dec, -90.0, 90.0), 0.0)))
+    tt = np.mod(np.where(valid, ra, 0.0), 360.0) / 90.0  # in [0, 4)
+    za = np.abs(z)
+
+    face = np.empty(z.shape, dtype=np.int64)
+    ix = np.empty(z.shape, dtype=np.int64)
+    iy = np.empty(z.shape, dtype=np.int64)
+
+    # equatorial region
+    eq = za <= 2.0 / 3.0
+    t1 = nside * (0.5 + tt[eq])
+    t2 = nside * z[eq] * 0.75
+    jp = (t1 - t2).astype(np.int64)
+    jm = (t1 + t2).astype(np.int64)
+    ifp = jp >> order
+    ifm = jm >> order
+    face[eq] = np.where(ifp == ifm, ifp | 4, np.where(ifp < ifm, ifp, ifm + 8))
+    ix[eq] = jm & (nside - 1)
+    iy[eq] = nside - (jp & (nside - 1)) - 1
+
+    # polar caps
+    pol = ~eq
+    ntt = np.minimum(tt[pol].astype(np.int64), 3)
+    tp = tt[pol] - ntt
+    tmp = nside * np.sqrt(3.0 * (1.0 - za[pol]))
+    jp = np.minimum((tp * tmp).astype(np.int64), nside - 1)
+    jm = np.minimum(((1.0 - tp) * tmp).astype(np.int64), nside - 1)
+    north = z[pol] >= 0
+    face[pol] = np.where(north, ntt, ntt + 8)
+    ix[pol] = np.where(north, nside - jm - 1, jp)
+    iy[pol] = np.where(north, nside - jp - 1, jm)
+
+    xy = _spread_bits(ix.astype(np.uint64)) | (_spread_bits(iy.astype(np.uint64)) << np.uint64(1))
+    pix = (face << (2 * order)) + xy.astype(np.int64)
+    return np.where(valid, pix, -1)
+
+def find_column(table, name):
+    """Column of `table` named `name`, ignoring case."""
+    if name in table.colnames:
+        return name
+    for col in table.colnames:
+        if col.lower() == name.lower():
+            return col
+    raise KeyError(f"column {name} not found")
+
+def source_column(config, name):
+    """Name of the input column that `preprocess_table` turns into `name` (undoes `rename_columns`)."""
+    for original, renamed in (config.get("rename_columns") or {}).items():
+        if renamed.lower() == name.lower():
+            return original
+    return name
+
+def table_pixels(table, ra_col, dec_col, order=DEFAULT_ORDER):
+    ra = np.ma.filled(np.ma.asarray(table[find_column(table, ra_col)], dtype=np.float64), np.nan)
+    dec = np.ma.filled(np.ma.asarray(table[find_column(table, dec_col)], dtype=np.float64), np.nan)
+    return ang2pix_nest(order, ra, dec)
+
+def pixel_column(config):
+    """Name and HEALPix order of the stored pixel column of `index_type: brin` tables."""
+    return config.get("pixel_col") or "hpx", config.get("pixel_order", DEFAULT_ORDER)
+
+def add_pixel_column(table, config):
+    """Add the stored pixel column (see `pixel_column`) to a preprocessed table."""
+    name, order = pixel_column(config)
+    table[name] = table_pixels(table, config["ra_col"], config["dec_col"], order)
+    return table
+
+def sort_by_pixel(table, config):
+    """
+    Sort the rows of a preprocessed table by HEALPix nested pixel of (`ra_col`, `dec_col`),
+    at order `spatial_sort_order` (default 16). Rows without coordinates go first.
+    When the table already has its pixel column (`index_type: brin`) that one is used:
+    nested pixels are hierarchical, so the order is the same at any resolution.
+    """
+    name, _ = pixel_column(config)
+    if config.get("index_type") == "brin" and name in table.colnames:
+        pixels = np.asarray(table[name])
+    else:
+        pixels = table_pixels(table, config["ra_col"], config["dec_col"], config.get("spatial_sort_order", DEFAULT_ORDER))
+    return table[np.argsort(pixels, kind="stable")]
+
+def _cone_order(radius, order):
+    """Coarsest useful order for a cone of `radius` radians: pixels about the size of the cone."""
+    coarse = int(np.floor(np.log2(np.sqrt(np.pi / 3) / radius))) if radius > 0 else order
+    return max(0, min(order, coarse))
+
+def cone_pixel_ranges(ra, dec, radius, order=DEFAULT_ORDER):
+    """
+    Ranges `[(lo, hi), ...]` (inclusive) of pixels at `order` covering a cone of `radius` degrees.
+
+    The cone is sampled on a gnomonic grid at a coarse order whose pixels are about the size
+    of the cone; the grid is finer than those pixels and extends one pixel diameter beyond
+    the cone, so every coarse pixel touching it is found (a few extra ones are harmless,
+    the query filters on the exact distance). Same algorithm as the `astroinject_cone_ranges` SQL function.
+    """
+    radius = np.radians(radius)
+    coarse = _cone_order(radius, order)
+    nside = 1 << coarse
+    reach = radius + 2.2 / nside
+    if reach > np.pi / 3:
+        return [(0, 12 * 4 ** order - 1)]
+
+    extent = np.tan(reach)
+    steps = int(np.ceil(extent / (0.25 / nside)))
+    grid = np.linspace(-extent, extent, 2 * steps + 1)
+    xi, eta = np.meshgrid(grid, grid)
+    ra0, dec0 = np.radians(ra), np.radians(dec)
+    sample_dec = np.arcsin((np.sin(dec0) + eta * np.cos(dec0)) / np.sqrt(1 + xi ** 2 + eta ** 2))
+    sample_ra = ra0 + np.arctan2(xi, np.cos(dec0) - eta * np.sin(dec0))
+    pixels = np.unique(ang2pix_nest(coarse, np.degrees(sample_ra).ravel(), np.degrees(sample_dec).ravel()))
+
+    shift = 2 * (order - coarse)
+    ranges = []
+    for pixel in pixels.tolist():
+        lo, hi = pixel << shift, ((pixel + 1) << shift) - 1
+        if ranges and ranges[-1][1] + 1 == lo:
+            ranges[-1] = (ranges[-1][0], hi)
+        else:
+            ranges.append((lo, hi))
+    return ranges
+
+def cone_search_query(config, ra, dec, radius, columns="*"):
+    """
+    SQL selecting the rows of `config["tablename"]` within `radius` degrees of (ra, dec),
+    using the BRIN index on the pixel column (`index_type: brin`).
+    """
+    name, order = pixel_column(config)
+    ranges = " OR ".join(f"{name} BETWEEN {lo} AND {hi}" for lo, hi in cone_pixel_ranges(ra, dec, radius, order))
+    return f"""SELECT {columns} FROM {config['tablename']}
+    WHERE ({ranges})
+    AND astroinject_distance("{config['ra_col']}", "{config['dec_col']}", {float(ra)}, {float(dec)}) <= {float(radius)};"""
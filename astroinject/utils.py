@@ -1,4 +1,10 @@
 import os
+import queue
+import fnmatch
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import logpool as control
 
 def first_valid_index(col_data):
     # check if column is masked
@@ -8,6 +14,75 @@ def first_valid_index(col_data):
             return key
     return key
 
+def iter_files_with_pattern(folder, patterns, workers=8):
+    """
+    Walks `folder` with `os.scandir` on a pool of threads and yields `(path, size)` for
+    every file matching one of `patterns`, as soon as it is found.
+
+    Parameters
+    ----------
+    folder : str
+        Path of the folder to search within.
+    patterns : str or list of str
+        Shell-style wildcard patterns matched against the whole path, like `find -path`
+        (so "*" also matches "/"): "*.fits", "*/dual/*.fits", ...
+    workers : int
+        Number of directories scanned at the same time.
+
+    Yields
+    ------
+    tuple
+        (path, size in bytes) of each matching file, in discovery order.
+
+    Notes
+    -----
+    - Symbolic links to directories are not followed, like `find`.
+    - Unreadable directories are logged and skipped.
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+
+    found = queue.Queue()
+    done = object()
+    lock = threading.Lock()
+    outstanding = [0]
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(path):
+        with lock:
+            outstanding[0] += 1
+        executor.submit(scan, path)
+
+    def scan(path):
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            submit(entry.path)
+                        elif entry.is_file() and any(fnmatch.fnmatchcase(entry.path, p) for p in patterns):
+                            found.put((entry.path, entry.stat().st_size))
+                    except OSError:
+                        continue
+        except OSError as e:
+            control.warn(f"could not scan {path}: {e}")
+        finally:
+            with lock:
+                outstanding[0] -= 1
+                finished = outstanding[0] == 0
+            if finished:
+                found.put(done)
+
+    submit(folder)
+    try:
+        while True:
+            item = found.get()
+            if item is done:
+                return
+            yield item
+    finally:
+        executor.shutdown(wait=False)
+
 def find_files_with_pattern(folder, pattern):
     """
     Finds files within a folder that match a given pattern.
@@ -16,8 +91,8 @@ def find_files_with_pattern(folder, pattern):
     ----------
     folder : str
         Path of the folder to search within.
-    pattern : str
-        Pattern to match files against. This should be a shell-style wildcard pattern.
+    pattern : str or list of str
+        Pattern(s) to match files against. This should be a shell-style wildcard pattern.
 
     Returns
     -------
@@ -34,14 +109,8 @@ def find_files_with_pattern(folder, pattern):
 
     Notes
     -----
-    - Uses `os.popen` and the `find` command-line utility to perform the file search, so this function is specific to Unix-like systems.
-    - The pattern should be a shell-style wildcard pattern (e.g., "*.csv" for CSV files).
+    - Built on `iter_files_with_pattern`, which streams matches with their sizes.
+    - The pattern is matched against the whole path, like `find -path` (e.g., "*.csv" for CSV files).
 
     """
-    files = os.popen(f"""find {folder} -path "{pattern}" """).read()
-    if not files:
-        return []
-
-    files = files.split('\n')
-    files = [f for f in files if os.path.isfile(f)]
-    return files
\ No newline at end of file
+    return [path for path, _ in iter_files_with_pattern(folder, pattern)]
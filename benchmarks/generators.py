@@ -0,0 +1,198 @@
+"""
+Synthetic catalogues shaped like the inputs astroinject loads in production.
+
+Every generator takes an output path, a number of rows and a width (number of
+columns, or pixels per spectrum for the spectral formats) and returns the list of
+files it wrote. Values are random but deterministic for a given seed.
+"""
+import os
+import gzip
+
+import numpy as np
+import pandas as pd
+from astropy.io import fits
+from astropy.table import Table, MaskedColumn
+
+SPLUS_FILTERS = ["u", "j0378", "j0395", "j0410", "j0430", "g", "j0515", "r", "j0660", "i", "j0861", "z"]
+
+def _sky(rng, n_rows):
+    ra = rng.uniform(0, 360, n_rows)
+    dec = np.degrees(np.arcsin(rng.uniform(-1, 1, n_rows)))
+    return ra, dec
+
+def make_splus_fits(path, n_rows, width=64, seed=0):
+    """S-PLUS like photometry: string id + field, ra/dec, per filter magnitudes/errors/flags."""
+    rng = np.random.default_rng(seed)
+    ra, dec = _sky(rng, n_rows)
+    field = f"STRIPE82-{seed:04d}"
+
+    table = Table()
+    table["ID"] = np.array([f"iDR5.{field}.{i:07d}" for i in range(n_rows)])
+    table["FIELD"] = np.array([field] * n_rows)
+    table["RA"] = ra
+    table["DEC"] = dec
+    table["FWHM"] = rng.normal(1.2, 0.2, n_rows).astype(np.float32)
+    table["CLASS_STAR"] = rng.uniform(0, 1, n_rows).astype(np.float32)
+
+    i = 0
+    while len(table.colnames) < width:
+        band = SPLUS_FILTERS[i % len(SPLUS_FILTERS)]
+        aperture = i // len(SPLUS_FILTERS)
+        mag = rng.normal(20, 2, n_rows).astype(np.float32)
+        mag[rng.random(n_rows) < 0.05] = 99.0
+        table[f"{band}_auto_{aperture}"] = mag
+        table[f"e_{band}_auto_{aperture}"] = rng.exponential(0.05, n_rows).astype(np.float32)
+        table[f"flag_{band}_{aperture}"] = rng.integers(0, 4, n_rows).astype(np.int16)
+        i += 1
+
+    table.write(path, overwrite=True)
+    return [path]
+
+def make_parquet_vac(path, n_rows, width=32, seed=0):
+    """Value added catalogue in parquet: integer id, ra/dec, float columns and a small PDF array."""
+    rng = np.random.default_rng(seed)
+    ra, dec = _sky(rng, n_rows)
+
+    data = {
+        "id": np.arange(seed * n_rows, (seed + 1) * n_rows, dtype=np.int64),
+        "ra": ra,
+        "dec": dec,
+        "pdf": list(rng.random((n_rows, 16)).astype(np.float32)),
+    }
+    i = 0
+    while len(data) < width:
+        values = rng.normal(0.5, 0.3, n_rows)
+        values[rng.random(n_rows) < 0.02] = np.nan
+        data[f"zml_{i}"] = values
+        i += 1
+
+    pd.DataFrame(data).to_parquet(path, index=False)
+    return [path]
+
+def make_gaia_ecsv_gz(path, n_rows, width=24, seed=0):
+    """Gaia-style gzipped ECSV chunk with masked values."""
+    rng = np.random.default_rng(seed)
+    ra, dec = _sky(rng, n_rows)
+
+    table = Table()
+    table["source_id"] = rng.integers(1, 2 ** 62, n_rows, dtype=np.int64)
+    table["ra"] = ra
+    table["dec"] = dec
+    table["parallax"] = MaskedColumn(rng.normal(1, 0.5, n_rows), mask=rng.random(n_rows) < 0.2)
+    table["phot_g_mean_mag"] = rng.normal(18, 2, n_rows).astype(np.float32)
+    i = 0
+    while len(table.colnames) < width:
+        table[f"col_{i}"] = MaskedColumn(rng.normal(0, 1, n_rows), mask=rng.random(n_rows) < 0.1)
+        i += 1
+
+    plain = path[:-3] if path.endswith(".gz") else path
+    table.write(plain, format="ascii.ecsv", overwrite=True)
+    # the Gaia archive writes masked values as `null`, astropy as an empty string
+    with open(plain) as src, gzip.open(path, "wt") as dst:
+        for line in src:
+            dst.write(line if line.startswith("#") else line.replace('""', "null"))
+    os.remove(plain)
+    return [path]
+
+def make_desi_coadd(path, n_rows, width=2000, seed=0):
+    """DESI coadd like file: FIBERMAP, REDSHIFTS and b/r/z WAVELENGTH/FLUX/IVAR images of `width` pixels."""
+    rng = np.random.default_rng(seed)
+    ra, dec = _sky(rng, n_rows)
+
+    fibermap = Table()
+    fibermap["TARGETID"] = np.arange(seed * n_rows, (seed + 1) * n_rows, dtype=np.int64)
+    fibermap["TARGET_RA"] = ra
+    fibermap["TARGET_DEC"] = dec
+    fibermap["OBJTYPE"] = np.array(["TGT"] * n_rows)
+    fibermap["EBV"] = rng.uniform(0, 0.1, n_rows).astype(np.float32)
+    for band in ("G", "R", "Z", "W1", "W2"):
+        fibermap[f"FLUX_{band}"] = rng.exponential(10, n_rows).astype(np.float32)
+        fibermap[f"FLUX_IVAR_{band}"] = rng.exponential(1, n_rows).astype(np.float32)
+
+    redshifts = Table()
+    redshifts["TARGETID"] = fibermap["TARGETID"]
+    redshifts["Z"] = rng.uniform(0, 3, n_rows)
+    redshifts["ZERR"] = rng.exponential(1e-4, n_rows)
+    redshifts["ZWARN"] = rng.integers(0, 2, n_rows)
+    redshifts["SPECTYPE"] = rng.choice(["STAR", "GALAXY", "QSO"], n_rows)
+    redshifts["DELTACHI2"] = rng.exponential(100, n_rows)
+
+    hdus = [
+        fits.PrimaryHDU(),
+        fits.BinTableHDU(fibermap, name="FIBERMAP"),
+        fits.BinTableHDU(redshifts, name="REDSHIFTS"),
+    ]
+    for band, start in (("B", 3600.0), ("R", 5760.0), ("Z", 7520.0)):
+        wave = (start + 0.8 * np.arange(width)).astype(np.float32)
+        hdus.append(fits.ImageHDU(wave, name=f"{band}_WAVELENGTH"))
+        hdus.append(fits.ImageHDU(rng.normal(1, 0.1, (n_rows, width)).astype(np.float32), name=f"{band}_FLUX"))
+        hdus.append(fits.ImageHDU(rng.exponential(1, (n_rows, width)).astype(np.float32), name=f"{band}_IVAR"))
+
+    fits.HDUList(hdus).writeto(path, overwrite=True)
+    return [path]
+
+def make_sdss_spectra(path, n_rows, width=4600, seed=0):
+    """
+    SDSS/BOSS spectrum files, one spectrum (one output row) per file.
+    `path` is used as a prefix: `n_rows` files named <path>-NNNNN.fits are written.
+    """
+    rng = np.random.default_rng(seed)
+    files = []
+    for i in range(n_rows):
+        loglam = (3.55 + 1e-4 * np.arange(width)).astype(np.float32)
+        spec = Table()
+        spec["FLUX"] = rng.normal(1, 0.1, width).astype(np.float32)
+        spec["LOGLAM"] = loglam
+        spec["IVAR"] = rng.exponential(1, width).astype(np.float32)
+        spec["AND_MASK"] = rng.integers(0, 2, width).astype(np.int32)
+        spec["OR_MASK"] = rng.integers(0, 2, width).astype(np.int32)
+        spec["WDISP"] = rng.normal(1, 0.05, width).astype(np.float32)
+        spec["SKY"] = rng.normal(0.5, 0.05, width).astype(np.float32)
+        spec["MODEL"] = rng.normal(1, 0.1, width).astype(np.float32)
+
+        ra, dec = _sky(rng, 1)
+        meta = Table()
+        meta["SPECOBJID"] = np.array([seed * n_rows + i], dtype=np.int64)
+        meta["PLUG_RA"] = ra
+        meta["PLUG_DEC"] = dec
+        meta["Z"] = rng.uniform(0, 3, 1)
+        meta["CLASS"] = np.array(["GALAXY"])
+
+        zall = Table()
+        zall["Z"] = rng.uniform(0, 3, 5)
+        zall["CLASS"] = np.array(["GALAXY", "QSO", "STAR", "GALAXY", "QSO"])
+
+        zline = Table()
+        zline["LINENAME"] = np.array(["Ly_alpha", "H_beta", "H_alpha"])
+        zline["LINEAREA"] = rng.exponential(10, 3).astype(np.float32)
+
+        filename = f"{path}-{i:05d}.fits"
+        fits.HDUList([
+            fits.PrimaryHDU(),
+            fits.BinTableHDU(spec),
+            fits.BinTableHDU(meta),
+            fits.BinTableHDU(zall),
+            fits.BinTableHDU(zline),
+        ]).writeto(filename, overwrite=True)
+        files.append(filename)
+    return files
+
+# name: (generator, file suffix, astroinject `format`, default rows, default width)
+FORMATS = {
+    "splus_fits": (make_splus_fits, ".fits", "fits", 200_000, 64),
+    "parquet_vac": (make_parquet_vac, ".parquet", "parquet", 200_000, 32),
+    "gaia_ecsv_gz": (make_gaia_ecsv_gz, ".ecsv.gz", "gaia", 50_000, 24),
+    "desi_coadd": (make_desi_coadd, ".fits", "desi_coadd", 500, 2000),
+    "sdss_spectrum": (make_sdss_spectra, "", "sdss_boss_dr19_spectrum", 50, 4600),
+}
+
+def generate(name, folder, n_rows=None, width=None, n_files=1):
+    """Write `n_files` synthetic inputs of format `name` into `folder` and return their paths."""
+    generator, suffix, _, default_rows, default_width = FORMATS[name]
+    os.makedirs(folder, exist_ok=True)
+
+    files = []
+    for seed in range(n_files):
+        path = os.path.join(folder, f"{name}_{seed:03d}{suffix}")
+        files.extend(generator(path, n_rows or default_rows, width or default_width, seed=seed))
+    return files
@@ -0,0 +1,270 @@
+"""
+Benchmark astroinject on synthetic catalogues.
+
+For every input format it generates files (see generators.py), times each pipeline
+stage in-process (open_table, preprocess_table, record conversion and COPY encoding)
+and, when a PostgreSQL server is available, the end-to-end `parallel_insertion` load.
+Results are written as JSON so runs of different versions can be compared.
+
+Examples:
+  # every format, default sizes, throwaway local PostgreSQL (initdb/pg_ctl on PATH)
+  python benchmarks/run_benchmarks.py
+
+  # wider S-PLUS tables, 3 files each, against an existing database
+  python benchmarks/run_benchmarks.py --formats splus_fits --rows 500000 --width 128 --files 3 -b base.yaml
+
+  # stages only, then compare with a previous run
+  python benchmarks/run_benchmarks.py --no-load --compare benchmarks/results/1.1-20250101T000000.json
+"""
+import os
+import sys
+import json
+import glob
+import time
+import socket
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generators import FORMATS, generate
+
+from astroinject import profiling
+from astroinject.profiling import stage
+from astroinject.config import load_config
+from astroinject.io import open_table
+from astroinject.processing import preprocess_table
+from astroinject.database.utils import convert_table_to_postgres_records
+from astroinject.database.dbpool import PostgresConnectionManager
+
+import logpool as control
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+def _version():
+    try:
+        from importlib.metadata import version
+        return version("astroinject")
+    except Exception:
+        return "unknown"
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except Exception:
+        return None
+
+def _table_config(name, folder, fmt):
+    return {
+        "folder": folder,
+        "pattern": "*",
+        "format": fmt,
+        "tablename": f"bench.{name}",
+        "id_col": None,
+        "force_cast_correction": False,
+        "rename_columns": {},
+        "delete_columns": [],
+        "patterns_to_replace": [],
+        "mask_value": None,
+    }
+
+def time_stages(files, config, repeat):
+    """Best-of-`repeat` wall seconds of every stage, summed over `files`."""
+    best = None
+    rows = 0
+    for _ in range(repeat):
+        totals = {}
+        rows = 0
+        for path in files:
+            profiling.begin_task(path, config["format"])
+            with stage("open_table"):
+                table = open_table(path, config)
+            with stage("preprocess_table"):
+                table = preprocess_table(table, config)
+            with stage("convert_table_to_postgres_records"):
+                records = convert_table_to_postgres_records(table)
+            with stage("encode_copy_records"):
+                PostgresConnectionManager.encode_copy_records(records)
+            rows += len(records)
+
+            for record in profiling.end_task()["stages"]:
+                totals[record["stage"]] = totals.get(record["stage"], 0.0) + record["wall"]
+        best = totals if best is None else {k: min(v, best.get(k, v)) for k, v in totals.items()}
+    return best, rows
+
+def load_end_to_end(files, config, processes):
+    """Load `files` into a fresh table with `parallel_insertion` and time it."""
+    from astroinject.pipeline.injection import parallel_insertion
+
+    pg_conn = PostgresConnectionManager(use_pool=False, **config["database"])
+    pg_conn.execute_query("CREATE SCHEMA IF NOT EXISTS bench;")
+    pg_conn.execute_query(f"DROP TABLE IF EXISTS {config['tablename']};")
+
+    config = dict(config)
+    config["general"] = {"injection_processes": processes, "metrics_interval": 3600}
+    start = time.perf_counter()
+    parallel_insertion(files, config)
+    seconds = time.perf_counter() - start
+
+    loaded = pg_conn.execute_query(f"SELECT count(*) FROM {config['tablename']};", fetch=True)
+    size = pg_conn.execute_query(f"SELECT pg_total_relation_size('{config['tablename']}');", fetch=True)
+    pg_conn.close()
+
+    rows = loaded[0][0] if loaded else 0
+    return {
+        "seconds": seconds,
+        "rows": rows,
+        "rows_per_second": rows / seconds if seconds else 0.0,
+        "table_bytes": size[0][0] if size else None,
+        "processes": processes,
+    }
+
+def _find_pg_binary(name):
+    found = shutil.which(name)
+    if found:
+        return found
+    candidates = sorted(glob.glob(f"/usr/lib/postgresql/*/bin/{name}") + glob.glob(f"/usr/local/pgsql/bin/{name}"))
+    return candidates[-1] if candidates else None
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+@contextmanager
+def throwaway_postgres():
+    """
+    Start a disposable PostgreSQL cluster (no fsync, unix socket only) and yield its
+    connection parameters, or None when initdb/pg_ctl are not installed.
+    """
+    initdb, pg_ctl = _find_pg_binary("initdb"), _find_pg_binary("pg_ctl")
+    if not (initdb and pg_ctl):
+        yield None
+        return
+
+    # short path: unix socket paths are limited to ~100 characters
+    workdir = tempfile.mkdtemp(prefix="aibench")
+    datadir = os.path.join(workdir, "data")
+    port = _free_port()
+    try:
+        subprocess.run([initdb, "-D", datadir, "-U", "postgres", "-A", "trust", "--no-sync"],
+                       check=True, stdout=subprocess.DEVNULL)
+        options = f"-p {port} -k {workdir} -c listen_addresses='' -c fsync=off -c full_page_writes=off"
+        subprocess.run([pg_ctl, "-D", datadir, "-o", options, "-w", "-l", os.path.join(workdir, "log"), "start"],
+                       check=True, stdout=subprocess.DEVNULL)
+        try:
+            yield {"host": workdir, "port": port, "user": "postgres", "dbname": "postgres"}
+        finally:
+            subprocess.run([pg_ctl, "-D", datadir, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def compare(current, previous_path):
+    """Print stage by stage ratios against a previous results file."""
+    with open(previous_path) as f:
+        previous = json.load(f)
+
+    control.info(f"comparing with {previous_path} (version {previous.get('version')}, commit {previous.get('git_commit')})")
+    for name, result in current["formats"].items():
+        old = previous.get("formats", {}).get(name)
+        if not old:
+            continue
+        for stage_name, seconds in result["stages"].items():
+            old_seconds = old["stages"].get(stage_name)
+            if not old_seconds:
+                continue
+            ratio = seconds / old_seconds
+            flag = "  <-- slower" if ratio > 1.1 else ""
+            control.info(f"{name:>14} {stage_name:<36} {old_seconds:8.3f}s -> {seconds:8.3f}s ({ratio:5.2f}x){flag}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark astroinject on synthetic catalogues")
+    parser.add_argument("--formats", nargs="*", default=list(FORMATS), choices=list(FORMATS),
+                        help="Input formats to benchmark")
+    parser.add_argument("--rows", type=int, help="Rows per file (spectra per run for sdss_spectrum)")
+    parser.add_argument("--width", type=int, help="Columns per table (pixels per spectrum for spectral formats)")
+    parser.add_argument("--files", type=int, default=1, help="Files generated per format")
+    parser.add_argument("--repeat", type=int, default=3, help="Stage timings keep the best of this many runs")
+    parser.add_argument("--processes", type=int, default=2, help="injection_processes for the end-to-end load")
+    parser.add_argument("-b", "--baseconfig", help="Use the database of this base config instead of a throwaway one")
+    parser.add_argument("--no-load", action="store_true", help="Only time the in-process stages")
+    parser.add_argument("--workdir", help="Where to write the synthetic files (default: a temporary folder)")
+    parser.add_argument("-o", "--output", help="Results file (default: benchmarks/results/<version>-<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous results file to compare with")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="astroinject-bench-")
+    created = datetime.now(timezone.utc)
+    results = {
+        "version": _version(),
+        "git_commit": _git_commit(),
+        "created": created.isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "parameters": vars(args),
+        "formats": {},
+    }
+
+    with (throwaway_postgres() if not (args.no_load or args.baseconfig) else _given_database(args)) as database:
+        if not args.no_load and database is None:
+            control.warn("no PostgreSQL available (initdb/pg_ctl not found and no --baseconfig), skipping end-to-end loads")
+
+        for name in args.formats:
+            _, _, fmt, _, _ = FORMATS[name]
+            folder = os.path.join(workdir, name)
+            control.info(f"generating {name} in {folder}")
+            files = generate(name, folder, n_rows=args.rows, width=args.width, n_files=args.files)
+            config = _table_config(name, folder, fmt)
+
+            stages, rows = time_stages(files, config, args.repeat)
+            total = sum(seconds for stage_name, seconds in stages.items()
+                        if stage_name in ("open_table", "preprocess_table",
+                                          "convert_table_to_postgres_records", "encode_copy_records"))
+            result = {
+                "files": len(files),
+                "rows": rows,
+                "bytes": sum(os.path.getsize(f) for f in files),
+                "stages": stages,
+                "client_rows_per_second": rows / total if total else 0.0,
+                "end_to_end": None,
+            }
+
+            if database is not None:
+                config["database"] = database
+                result["end_to_end"] = load_end_to_end(files, config, args.processes)
+
+            results["formats"][name] = result
+            control.info(f"{name}: {json.dumps(result, default=str)}")
+
+    if not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{results['version']}-{created.strftime('%Y%m%dT%H%M%S')}.json")
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    control.info(f"results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+@contextmanager
+def _given_database(args):
+    if args.no_load:
+        yield None
+    else:
+        yield load_config(args.baseconfig)["database"]
+
+if __name__ == "__main__":
+    main()
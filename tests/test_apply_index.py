@@ -0,0 +1,114 @@
+import threading
+import time
+
+import pytest
+
+from astroinject.pipeline import apply_index
+from astroinject.pipeline.apply_index import build_indexes, index_queries
+
+CONFIG = {"tablename": "sky.obj", "ra_col": "ra", "dec_col": "dec", "general": {}}
+
+
+def test_index_queries():
+    config = dict(CONFIG, index_type="q3c", additional_btree_index="field")
+    descriptions = [description for description, _ in index_queries(config)]
+    assert descriptions == ["btree on field", "q3c"]
+    assert index_queries(dict(CONFIG)) == []
+
+
+def test_build_indexes_runs_them_in_parallel_and_counts_failures(monkeypatch):
+    running, peak, ran = [0], [0], []
+    lock = threading.Lock()
+
+    def build(config, description, query, settings, conn=None):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+            ran.append((description, settings))
+        if description.startswith("btree on b"):
+            raise RuntimeError("no such column")
+
+    maintenance = []
+    monkeypatch.setattr(apply_index, "_build_index", build)
+    monkeypatch.setattr(apply_index, "run_maintenance", lambda config: maintenance.append(config["tablename"]))
+    config = dict(CONFIG, additional_btree_index=["a", "b", "c"],
+                  general={"index_jobs": 2, "maintenance_work_mem": "1GB"})
+
+    assert build_indexes(config) == 1
+    assert peak[0] == 2
+    assert len(ran) == 3 and all(settings == {"maintenance_work_mem": "1GB"} for _, settings in ran)
+    assert maintenance == ["sky.obj"]
+
+
+@pytest.mark.parametrize("setting, extra, mode", [
+    (None, {}, "vacuum_analyze"),
+    (None, {"fresh_table": True}, "analyze"),
+    (None, {"index_type": "q3c"}, "analyze"),
+    ("auto", {"index_type": "pgsphere"}, "vacuum_analyze"),
+    ("none", {"fresh_table": True}, "none"),
+    ("vacuum_analyze", {"index_type": "q3c"}, "vacuum_analyze"),
+])
+def test_maintenance_mode(setting, extra, mode):
+    config = dict(CONFIG, general={"post_load_maintenance": setting}, **extra)
+    assert apply_index.maintenance_mode(config) == mode
+
+
+def test_maintenance_mode_rejects_unknown_values():
+    with pytest.raises(ValueError):
+        apply_index.maintenance_mode(dict(CONFIG, general={"post_load_maintenance": "cluster"}))
+
+
+def test_pixel_column_queries():
+    config = dict(CONFIG, index_type="brin")
+    assert apply_index.pixel_column_queries(config, exists=True) == []
+    with pytest.raises(ValueError):
+        apply_index.pixel_column_queries(config, exists=False)
+    fill = dict(config, general={"fill_pixel_column": True})
+    queries = apply_index.pixel_column_queries(fill, exists=False)
+    assert queries[0].startswith("ALTER TABLE sky.obj ADD COLUMN IF NOT EXISTS hpx BIGINT")
+    assert "WHERE hpx IS NULL" in queries[1]
+
+
+def test_brin_index_query():
+    (description, query), = index_queries(dict(CONFIG, index_type="brin", brin_pages_per_range=16))
+    assert description == "brin"
+    assert "USING brin (hpx) WITH (pages_per_range = 16)" in query
+
+
+class FakeCursor:
+    def __init__(self, rows):
+        self.rows, self.executed = rows, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.rows
+
+
+class FakeConnection:
+    def __init__(self, rows):
+        self.cur = FakeCursor(rows)
+
+    def cursor(self):
+        return self.cur
+
+
+def test_index_prerequisites_without_functions():
+    config = dict(CONFIG, index_type="brin")
+    conn = FakeConnection([("hpx",)])
+    assert apply_index.index_prerequisites(config, conn, functions=False) == []
+    assert conn.cur.executed == [(apply_index.PIXEL_COLUMN_QUERY, ("sky.obj", "hpx"))]
+
+    prerequisites = apply_index.index_prerequisites(config, FakeConnection([("hpx",)]))
+    assert prerequisites == [("cone search functions", apply_index.PIXEL_FUNCTIONS)]
+    assert apply_index.index_prerequisites(CONFIG, conn, functions=False) == []
@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+from astropy.table import MaskedColumn, Table
+
+from astroinject.pipeline.checkpoint import (
+    checkpoint_path, checkpoint_rows, chunk_ranges, load_checkpoint, save_checkpoint, table_hash,
+)
+from astroinject.pipeline.injection import checkpointed_injection
+
+
+def make_config(tmp_path, rows=4):
+    return {
+        "tablename": "t", "sinks": ["parquet"], "parquet_sink_dir": str(tmp_path / "out"),
+        "id_col": None, "delete_columns": [], "rename_columns": {}, "patterns_to_replace": [],
+        "general": {"checkpoint_rows": rows, "checkpoint_dir": str(tmp_path / "checkpoints")},
+    }
+
+
+def write_catalog(path, n=10):
+    Table({"id": np.arange(n), "mag": np.linspace(15, 20, n)}).write(path, overwrite=True)
+    return path
+
+
+def test_checkpoint_rows_apply_to_fits_and_parquet_only(tmp_path):
+    config = make_config(tmp_path)
+    assert checkpoint_rows(config, "cat.fits") == 4
+    assert checkpoint_rows(config, "cat.parquet") == 4
+    assert checkpoint_rows(config, "cat.csv") is None
+    assert checkpoint_rows({}, "cat.fits") is None
+
+
+def test_chunk_ranges(tmp_path):
+    path = write_catalog(str(tmp_path / "cat.fits"))
+    config = make_config(tmp_path)
+    assert chunk_ranges(path, 0, 10, 4, config) == [(0, 4), (4, 8), (8, 10)]
+    assert chunk_ranges(path, 4, 10, 4, config) == [(4, 8), (8, 10)]
+    assert chunk_ranges(path, 10, 10, 4, config) == []
+
+
+def test_table_hash():
+    table = Table({"id": np.arange(3), "mag": MaskedColumn([1.0, 2.0, 3.0], mask=[False, True, False])})
+    same = Table({"id": np.arange(3), "mag": MaskedColumn([1.0, 2.0, 3.0], mask=[False, True, False])})
+    assert table_hash(table) == table_hash(same)
+    same["mag"].mask[1] = False
+    assert table_hash(table) != table_hash(same)
+    assert table_hash(table) != table_hash(table[:2])
+
+
+def test_checkpoint_files(tmp_path):
+    config = make_config(tmp_path)
+    path = checkpoint_path(config, "data/cat.fits", (0, 10))
+    assert path.startswith(str(tmp_path / "checkpoints" / "cat.fits."))
+    assert path != checkpoint_path(config, "data/cat.fits", (10, 20))
+    assert load_checkpoint(path) is None
+
+    save_checkpoint(path, {"offset": 4})
+    assert load_checkpoint(path) == {"offset": 4}
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_checkpointed_injection_resumes_after_the_last_chunk(tmp_path):
+    path = write_catalog(str(tmp_path / "cat.fits"))
+    config = make_config(tmp_path)
+
+    result = checkpointed_injection(path, None, config)
+    assert result["status"] == "ok" and result["rows"] == 10
+    state = load_checkpoint(checkpoint_path(config, path, None))
+    assert state["complete"] and state["offset"] == 10 and list(state["chunk"]) == [8, 10]
+
+    assert checkpointed_injection(path, None, config)["status"] == "skipped"
+
+    # interrupted after the first chunk
+    save_checkpoint(checkpoint_path(config, path, None), dict(state, offset=4, chunk=[0, 4], complete=False,
+                                                              chunk_hash=table_hash(Table.read(path)[0:4])))
+    result = checkpointed_injection(path, None, config)
+    assert result["status"] == "ok" and result["rows"] == 6
+
+
+def test_checkpointed_injection_refuses_a_changed_file(tmp_path):
+    path = write_catalog(str(tmp_path / "cat.fits"))
+    config = make_config(tmp_path)
+    state = {"task": "x", "file": path, "row_range": None, "offset": 4, "chunk": [0, 4],
+             "complete": False, "chunk_hash": table_hash(Table.read(path)[0:4])}
+    save_checkpoint(checkpoint_path(config, path, None), state)
+
+    Table({"id": np.arange(10) + 100, "mag": np.zeros(10)}).write(path, overwrite=True)
+    result = checkpointed_injection(path, None, config)
+    assert result["status"] == "error"
+    assert "changed since checkpoint" in result["error"]
@@ -0,0 +1,107 @@
+import pytest
+
+from astroinject.pipeline import commands
+from astroinject.pipeline.commands import maintenance_needed, schema_snapshot, spatial_indexes
+
+FRESH = {
+    "n_live_tup": 1000,
+    "n_mod_since_analyze": 0,
+    "n_dead_tup": 0,
+    "n_ins_since_vacuum": 0,
+    "last_analyze": "2026-01-01",
+    "last_autoanalyze": None,
+    "last_vacuum": None,
+    "last_autovacuum": "2026-01-01",
+}
+
+
+def test_no_statistics_entry():
+    assert maintenance_needed(None, 0.1) == "vacuum_analyze"
+    assert maintenance_needed(None, 0.1, analyze_only=True) == "analyze"
+
+
+def test_up_to_date_table():
+    assert maintenance_needed(FRESH, 0.1) is None
+
+
+@pytest.mark.parametrize("changes, expected", [
+    ({"n_mod_since_analyze": 101}, "analyze"),
+    ({"n_mod_since_analyze": 100}, None),
+    ({"n_dead_tup": 101}, "vacuum_analyze"),
+    ({"n_ins_since_vacuum": 101}, "vacuum_analyze"),
+    ({"n_ins_since_vacuum": None}, None),
+    ({"last_analyze": None}, "analyze"),
+    ({"last_autovacuum": None}, "vacuum_analyze"),
+])
+def test_thresholds(changes, expected):
+    assert maintenance_needed(dict(FRESH, **changes), 0.1) == expected
+
+
+def test_analyze_only_never_vacuums():
+    assert maintenance_needed(dict(FRESH, n_dead_tup=500), 0.1, analyze_only=True) is None
+    stale = dict(FRESH, n_dead_tup=500, n_mod_since_analyze=500)
+    assert maintenance_needed(stale, 0.1, analyze_only=True) == "analyze"
+
+
+def test_threshold_zero_on_empty_table():
+    empty = dict(FRESH, n_live_tup=0)
+    assert maintenance_needed(empty, 0) is None
+    assert maintenance_needed(dict(empty, n_mod_since_analyze=1), 0) == "analyze"
+
+
+class SnapshotCursor:
+    def __init__(self, results):
+        self.results, self.rows, self.executed = results, [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(params)
+        self.rows = self.results[query]
+
+    def fetchall(self):
+        return self.rows
+
+
+class SnapshotConnection:
+    def __init__(self, results):
+        self.cur = SnapshotCursor(results)
+
+    def cursor(self):
+        return self.cur
+
+
+INDEXES = [
+    ("a", "a_spoint", "gist", "CREATE INDEX a_spoint ON s.a USING gist (spoint(ra, dec))", False, 1, ["gist_spoint_ops"], []),
+    ("a", "a_pkey", "btree", "CREATE UNIQUE INDEX a_pkey ON s.a USING btree (id)", True, 1, ["int8_ops"], ["id"]),
+    ("b", "b_q3c", "btree", "CREATE INDEX b_q3c ON s.b USING btree (q3c_ang2ipix(ra, dec))", False, 1, ["int8_ops"], []),
+    ("b", "b_hpx_brin", "brin", "CREATE INDEX b_hpx_brin ON s.b USING brin (hpx)", False, 1, ["int8_minmax_ops"], ["hpx"]),
+]
+
+
+def test_schema_snapshot_reads_all_tables_at_once():
+    conn = SnapshotConnection({
+        commands.SNAPSHOT_INDEXES_QUERY: INDEXES,
+        commands.SNAPSHOT_COLUMNS_QUERY: [("a", "ID", True), ("a", "RA", False), ("b", "ra", False)],
+        commands.SNAPSHOT_PKEYS_QUERY: [("a",)],
+    })
+    snapshot = schema_snapshot(conn, "s", ["a", "b", "c"])
+
+    assert conn.cur.executed == [("s", ["a", "b", "c"])] * 3
+    assert snapshot["c"] == {"indexes": [], "columns": {}, "has_pkey": False}
+    assert snapshot["a"]["has_pkey"] and not snapshot["b"]["has_pkey"]
+    assert snapshot["a"]["columns"] == {"id": ("ID", True), "ra": ("RA", False)}
+    assert snapshot["a"]["indexes"][1] == {
+        "name": "a_pkey", "am": "btree", "definition": INDEXES[1][3], "unique": True,
+        "key_count": 1, "opclasses": ["int8_ops"], "columns": ["id"],
+    }
+
+    assert spatial_indexes(snapshot["a"], "pgsphere") == ["a_spoint"]
+    assert spatial_indexes(snapshot["b"], "pgsphere") == []
+    assert spatial_indexes(snapshot["b"], "q3c") == ["b_q3c"]
+    assert spatial_indexes(snapshot["b"], "brin") == ["b_hpx_brin"]
+    assert spatial_indexes(snapshot["b"], "brin", "pix") == []
@@ -0,0 +1,103 @@
+import csv
+import io
+
+import numpy as np
+import psycopg2
+import pytest
+
+from astroinject.database.dbpool import COPY_CSV_DIALECT, PostgresConnectionManager
+
+
+class DataError(psycopg2.DataError):
+    pgcode = "22003"
+    pgerror = "ERROR: value out of range"
+
+
+class ConnectionError_(psycopg2.OperationalError):
+    pgcode = "08006"
+    pgerror = "ERROR: connection lost"
+
+
+class FakeCursor:
+    """Refuses any COPY containing a row whose id is in `bad`; rows of accepted COPYs are kept."""
+
+    def __init__(self, bad, error=DataError):
+        self.bad = set(bad)
+        self.error = error
+        self.loaded = []
+        self.copies = 0
+
+    def execute(self, query, params=None):
+        pass
+
+    def copy_expert(self, query, payload):
+        self.copies += 1
+        rows = [int(row[0]) for row in csv.reader(payload.read().splitlines(), delimiter="\t")]
+        if self.bad.intersection(rows):
+            raise self.error("refused")
+        self.loaded.extend(rows)
+
+
+def isolate(n, bad, error=DataError):
+    records = [(i, f"name {i}", float(i) / 3) for i in range(n)]
+    cur = FakeCursor(bad, error)
+    payload = PostgresConnectionManager.encode_copy_records(records)
+    rejects = PostgresConnectionManager.copy_isolating(cur, "COPY t FROM STDIN", records, payload)
+    return cur, rejects
+
+
+@pytest.mark.parametrize("n, bad", [
+    (1000, []),
+    (1000, [0]),
+    (1000, [999]),
+    (1000, [499, 500]),
+    (1000, [3, 517, 998]),
+    (7, [0, 1, 2, 3, 4, 5, 6]),
+    (1, [0]),
+    (2, [1]),
+])
+def test_bisect_isolates_exactly_the_bad_rows(n, bad):
+    cur, rejects = isolate(n, bad)
+    assert [index for index, _ in rejects] == sorted(bad)
+    assert all("out of range" in error for _, error in rejects)
+    assert sorted(cur.loaded) == [i for i in range(n) if i not in bad]
+
+
+def test_bisect_cost_is_logarithmic():
+    cur, rejects = isolate(1024, [700])
+    assert len(rejects) == 1
+    # first attempt, then two halves per level down to a single row
+    assert cur.copies == 1 + 2 * 10
+
+
+def test_other_errors_are_raised():
+    with pytest.raises(psycopg2.OperationalError):
+        isolate(100, [42], ConnectionError_)
+
+
+
+def test_copy_payload_of_plain_rows_is_unchanged():
+    records = [(1, "plain", None, [1.0, 2.0], 1.5), (2, "{a}", "", [], -3)]
+    formatted = PostgresConnectionManager.format_pg_array_vectorized(np.array(records, dtype=object))
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter="\t", lineterminator="\n", quoting=csv.QUOTE_NONE, escapechar="\\").writerows(formatted)
+    assert PostgresConnectionManager.encode_copy_records(records).getvalue() == buffer.getvalue()
+
+
+def test_copy_payload_quotes_special_values():
+    values = ["tab\there", 'quote "x"', "new\nline", "back\\slash", "\\x0000803f"]
+    payload = PostgresConnectionManager.encode_copy_records([(i, value) for i, value in enumerate(values)]).getvalue()
+    assert "back\\slash" in payload and "\\x0000803f" in payload
+    rows = list(csv.reader(io.StringIO(payload), **COPY_CSV_DIALECT))
+    assert [row[1] for row in rows] == values
+
+
+def test_encode_copy_lines_matches_payload():
+    records = [(1, "tab\there", None), (2, 'quote "x"', [1.0, 2.0]), (3, "\\x00ff", 1.5)]
+    lines, ends = PostgresConnectionManager.encode_copy_lines(records)
+    assert lines == PostgresConnectionManager.encode_copy_records(records).getvalue()
+    assert ends[-1] == len(lines)
+    starts = [0] + ends[:-1]
+    parsed = [next(csv.reader([lines[a:b]], **COPY_CSV_DIALECT)) for a, b in zip(starts, ends)]
+    assert [row[0] for row in parsed] == ["1", "2", "3"]
+    assert parsed[0][1] == "tab\there" and parsed[2][1] == "\\x00ff"
@@ -0,0 +1,72 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from astropy.table import Table
+
+from astroinject.io import open_table, parquet_row_group_bounds, read_table_shape
+
+
+def assert_same_rows(whole, part):
+    assert whole.colnames == part.colnames
+    for col in whole.colnames:
+        if whole[col].dtype.kind in "US":
+            # without `table::len::` metadata the parquet reader sizes strings on the rows read
+            assert whole[col].dtype.kind == part[col].dtype.kind, col
+        else:
+            assert whole[col].dtype == part[col].dtype, col
+        assert whole[col].shape == part[col].shape, col
+        assert np.array_equal(np.ma.getmaskarray(whole[col]), np.ma.getmaskarray(part[col])), col
+        for a, b in zip(whole[col].tolist(), part[col].tolist()):
+            if isinstance(a, float) and np.isnan(a):
+                assert isinstance(b, float) and np.isnan(b), col
+            else:
+                assert np.array_equal(a, b), col
+
+
+@pytest.mark.parametrize("row_range", [(0, 100), (10, 37), (99, 100)])
+def test_fits_row_range_reads_like_the_whole_file(tmp_path, row_range):
+    path = str(tmp_path / "cat.fits")
+    table = Table({
+        "id": np.arange(100),
+        "ra": np.linspace(0, 360, 100),
+        "field": [f"f{i % 5}" for i in range(100)],
+        "mags": np.arange(300, dtype=np.float32).reshape(100, 3),
+    })
+    table.write(path)
+    assert read_table_shape(path, {"format": "fits"})[0] == 100
+    whole = open_table(path, {"format": "fits"})
+    part = open_table(path, {"format": "fits"}, row_range=row_range)
+    assert_same_rows(whole[row_range[0]:row_range[1]], part)
+
+
+def write_parquet(path, nulls):
+    n = 50
+    strings = [f"s{i}" * (i % 4 + 1) for i in range(n)]
+    if nulls:
+        strings[17] = None
+    pq.write_table(pa.table({
+        "id": pa.array([None if i % 7 == 3 else i for i in range(n)], pa.int64()),
+        "flag": pa.array([i % 2 == 0 for i in range(n)]),
+        "name": pa.array(strings),
+        "x": pa.array([np.nan if i % 11 == 0 else i / 3 for i in range(n)]),
+        "spectrum": pa.array([[float(i), float(i + 1), float(i + 2)] for i in range(n)]),
+    }), path, row_group_size=8)
+
+
+@pytest.mark.parametrize("nulls", [False, True])
+@pytest.mark.parametrize("row_range", [(0, 50), (0, 8), (3, 21), (16, 24), (45, 50)])
+def test_parquet_row_range_reads_like_the_whole_file(tmp_path, nulls, row_range):
+    path = str(tmp_path / "vac.parquet")
+    write_parquet(path, nulls)
+    whole = open_table(path, {})
+    part = open_table(path, {}, row_range=row_range)
+    assert len(part) == row_range[1] - row_range[0]
+    assert_same_rows(whole[row_range[0]:row_range[1]], part)
+
+
+def test_parquet_shape_and_row_groups(tmp_path):
+    path = str(tmp_path / "vac.parquet")
+    write_parquet(path, False)
+    assert read_table_shape(path, {})[0] == 50
+    assert parquet_row_group_bounds(path) == [0, 8, 16, 24, 32, 40, 48, 50]
@@ -0,0 +1,74 @@
+import json
+import os
+
+from astroinject.pipeline.ledger import CompletionLedger
+
+
+def make_config(tmp_path, **general):
+    return {"tablename": "t", "general": dict({"completion_ledger": str(tmp_path / "t.completed.jsonl")}, **general)}
+
+
+def touch(path, text="rows"):
+    with open(path, "w") as f:
+        f.write(text)
+    return str(path)
+
+
+def test_ledger_path():
+    assert CompletionLedger({"tablename": "t"}).path is None
+    assert CompletionLedger({"tablename": "t", "general": {"split_rows": 10}}).path == "t.completed.jsonl"
+    # files written by other sinks are not in the table
+    assert CompletionLedger({"tablename": "t", "sinks": ["parquet"], "general": {"split_rows": 10}}).path is None
+
+
+def test_file_recorded_only_when_every_task_committed(tmp_path):
+    config = make_config(tmp_path)
+    split, whole = touch(tmp_path / "split.fits"), touch(tmp_path / "whole.fits")
+    ledger = CompletionLedger(config)
+
+    ledger.record({"filepath": split, "file_tasks": 3}, {"status": "ok"})
+    ledger.record({"filepath": whole}, {"status": "ok"})
+    ledger.record({"filepath": split, "file_tasks": 3}, {"status": "skipped"})
+    assert ledger.pending([split, whole]) == [split]
+
+    ledger.record({"filepath": split, "file_tasks": 3}, {"status": "ok"})
+    assert ledger.pending([split, (whole, 4)]) == []
+
+    with open(config["general"]["completion_ledger"]) as f:
+        entries = [json.loads(line) for line in f]
+    assert [(entry["file"], entry["tasks"]) for entry in entries] == [(whole, 1), (split, 3)]
+
+    reloaded = CompletionLedger(config)
+    assert list(reloaded.pending(iter([split, whole]))) == []
+
+
+def test_failed_task_is_not_recorded(tmp_path):
+    config = make_config(tmp_path)
+    path = touch(tmp_path / "split.fits")
+    ledger = CompletionLedger(config)
+    ledger.record({"filepath": path, "file_tasks": 2}, {"status": "error"})
+    ledger.record({"filepath": path, "file_tasks": 2}, {"status": "ok"})
+    assert ledger.pending([path]) == [path]
+    assert not os.path.exists(config["general"]["completion_ledger"])
+
+
+def test_changed_file_is_loaded_again(tmp_path):
+    config = make_config(tmp_path)
+    path = touch(tmp_path / "cat.fits")
+    ledger = CompletionLedger(config)
+    ledger.record({"filepath": path}, {"status": "ok"})
+    assert ledger.pending([path]) == []
+
+    touch(path, "more rows")
+    assert ledger.pending([path]) == [path]
+
+
+def test_clear(tmp_path):
+    config = make_config(tmp_path)
+    path = touch(tmp_path / "cat.fits")
+    ledger = CompletionLedger(config)
+    ledger.record({"filepath": path}, {"status": "ok"})
+    ledger.clear()
+    assert ledger.pending([path]) == [path]
+    assert not os.path.exists(config["general"]["completion_ledger"])
+    assert CompletionLedger(config).pending([path]) == [path]
@@ -0,0 +1,103 @@
+import pytest
+
+from astroinject.pipeline import map_tap_schema
+from astroinject.pipeline.map_tap_schema import tap_rows, write_tap_rows
+
+COLUMNS = [
+    ("obj", "ID", "int8"),
+    ("obj", "ra", "float8"),
+    ("obj", "created", "timestamp"),
+    ("obj", "mag_r", "float4"),
+    ("vac", "objid", "int8"),
+]
+
+
+def test_tap_rows():
+    schema_rows, table_rows, column_rows = tap_rows("sky", COLUMNS, principal=("id", "ra", None))
+    assert schema_rows == [("sky", None, None)]
+    assert table_rows == [("sky", "sky.obj", "table", None, None, None),
+                          ("sky", "sky.vac", "table", None, None, None)]
+    assert [(row[0], row[1], row[2], row[10]) for row in column_rows] == [
+        ("sky.obj", "ID", "BIGINT", 1),
+        ("sky.obj", "ra", "DOUBLE", 1),
+        ("sky.obj", "mag_r", "REAL", 0),
+        ("sky.vac", "objid", "BIGINT", 0),
+    ]
+    assert all(len(row) == 13 for row in column_rows)
+
+
+def test_tap_rows_skip_tables_without_mapped_columns():
+    _, table_rows, column_rows = tap_rows("sky", [("log", "created", "timestamp")])
+    assert table_rows == [] and column_rows == []
+
+
+class FakeCursor:
+    def __init__(self):
+        self.executed = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append((query, params))
+
+
+class FakeConnection:
+    def __init__(self):
+        self.cur = FakeCursor()
+        self.committed = self.rolled_back = False
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class FakeManager:
+    def __init__(self):
+        self.conn, self.released = FakeConnection(), False
+
+    def get_connection(self):
+        return self.conn
+
+    def release_connection(self, conn):
+        self.released = True
+
+
+@pytest.fixture
+def inserted(monkeypatch):
+    inserted = []
+    monkeypatch.setattr(map_tap_schema, "execute_values",
+                        lambda cur, query, rows, page_size=100: inserted.append((query, rows)))
+    return inserted
+
+
+def test_write_tap_rows_replaces_the_mapped_tables_only(inserted):
+    schema_rows, table_rows, column_rows = tap_rows("sky", COLUMNS)
+    manager = FakeManager()
+    write_tap_rows(manager, "sky", schema_rows, table_rows, column_rows)
+
+    executed = manager.conn.cur.executed
+    assert executed[0] == (map_tap_schema.DELETE_COLUMNS_QUERY, (["sky.obj", "sky.vac"], ["obj", "vac"], "sky"))
+    assert executed[1][1] == ("sky", ["sky.obj", "sky.vac", "obj", "vac"])
+    assert executed[2] == (map_tap_schema.INSERT_SCHEMA_QUERY, ("sky", None, None, "sky"))
+    assert [rows for _, rows in inserted] == [table_rows, column_rows]
+    assert manager.conn.committed and manager.released
+
+
+def test_write_tap_rows_rolls_back_on_error(monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("insert failed")
+    monkeypatch.setattr(map_tap_schema, "execute_values", fail)
+
+    manager = FakeManager()
+    with pytest.raises(RuntimeError):
+        write_tap_rows(manager, "sky", *tap_rows("sky", COLUMNS))
+    assert manager.conn.rolled_back and not manager.conn.committed and manager.released
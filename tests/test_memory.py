@@ -0,0 +1,54 @@
+from astroinject.pipeline.memory import MemoryBudget, raw_task_bytes, GZIP_EXPANSION
+from astroinject.pipeline.scheduler import PendingTasks
+
+MB = 1024 ** 2
+
+
+def make_task(task_id, size, raw_bytes=None):
+    return {"filepath": f"f{task_id}.fits", "row_range": None, "size": size,
+            "raw_bytes": size if raw_bytes is None else raw_bytes, "task_id": task_id}
+
+
+def test_raw_task_bytes():
+    assert raw_task_bytes({"filepath": "a.fits", "row_range": None, "size": 10}, 100, 8) == 800
+    assert raw_task_bytes({"filepath": "a.fits", "row_range": (10, 30), "size": 10}, 100, 8) == 160
+    # header not readable: the file size, expanded for gzip text
+    assert raw_task_bytes({"filepath": "a.csv", "row_range": None, "size": 10}, None, None) == 10
+    assert raw_task_bytes({"filepath": "a.csv.gz", "row_range": None, "size": 10}, None, None) == 10 * GZIP_EXPANSION
+
+
+def test_memory_budget_admission():
+    budget = MemoryBudget({"general": {"memory_budget_mb": 100, "memory_expansion_factor": 1.0}})
+    pending = PendingTasks([make_task(0, 80 * MB), make_task(1, 60 * MB), make_task(2, 10 * MB)])
+
+    first = budget.next_task(pending, 0)
+    budget.admit(first)
+    assert first["task_id"] == 0
+    # 60 MB does not fit next to 80 MB, the small task does
+    second = budget.next_task(pending, 1)
+    budget.admit(second)
+    assert second["task_id"] == 2
+    assert budget.next_task(pending, 2) is None
+
+    budget.release(first, {"peak_rss_delta": 0})
+    budget.release(second, {"peak_rss_delta": 0})
+    assert budget.next_task(pending, 0)["task_id"] == 1
+
+
+def test_memory_budget_runs_oversized_task_alone():
+    budget = MemoryBudget({"general": {"memory_budget_mb": 10, "memory_expansion_factor": 1.0}})
+    pending = PendingTasks([make_task(0, 50 * MB)])
+    assert budget.next_task(pending, 1) is None
+    assert budget.next_task(pending, 0)["task_id"] == 0
+
+
+def test_memory_budget_learns_factor():
+    budget = MemoryBudget({"general": {"memory_budget_mb": 100, "memory_expansion_factor": 2.0}})
+    task = make_task(0, 1000)
+    budget.admit(task)
+    budget.release(task, {"peak_rss_delta": 5000})
+    assert budget.factor == 5.0
+    budget.admit(task)
+    budget.release(task, {"peak_rss_delta": 1000})
+    assert 4.0 < budget.factor < 5.0
+    assert budget.reserved == 0
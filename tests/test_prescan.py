@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from astroinject.pipeline.prescan import run_prescan, scan_file, schema_drift, union_schema, wider_type
+
+CONFIG = {"id_col": None, "delete_columns": [], "rename_columns": {}, "patterns_to_replace": []}
+
+
+@pytest.mark.parametrize("a, b, expected", [
+    ("INTEGER", "BIGINT", "BIGINT"),
+    ("FLOAT8", "INTEGER", "FLOAT8"),
+    ("BIGINT", "TEXT", "TEXT"),
+    ("FLOAT4[]", "FLOAT8[]", "FLOAT8[]"),
+    ("FLOAT8[]", "FLOAT8", "FLOAT8[]"),
+    ("BOOLEAN", "INTEGER", "BOOLEAN"),
+    (None, "INTEGER", "INTEGER"),
+    ("INTEGER", None, "INTEGER"),
+])
+def test_wider_type(a, b, expected):
+    assert wider_type(a, b) == expected
+
+
+@pytest.fixture
+def files(tmp_path):
+    tables = [
+        Table({"ID": np.array([1, 2], dtype=np.int32), "MAG": np.array([20.0, 21.0], dtype=np.float32)}),
+        Table({"ID": np.array([3], dtype=np.int64), "MAG": np.array([19.0], dtype=np.float32),
+               "FLAG": np.array([True])}),
+        Table({"ID": np.array([4, 5, 6], dtype=np.int32), "MAG": np.array([18.0, 17.0, 16.0])}),
+    ]
+    paths = []
+    for i, table in enumerate(tables):
+        paths.append(str(tmp_path / f"part{i}.fits"))
+        table.write(paths[-1])
+    return paths
+
+
+def test_scan_file_reads_the_header_and_first_row(files):
+    scan = scan_file(files[2], CONFIG)
+    assert scan["rows"] == 3
+    assert sorted(scan["columns"]) == ["id", "mag"]
+    assert scan["columns"]["id"]["min"] is None and scan["columns"]["mag"]["itemsize"] == 8
+
+    assert scan_file("table.csv", CONFIG) == {"path": "table.csv", "rows": None, "columns": None}
+
+
+def test_union_schema_and_drift(files):
+    scans = [scan_file(path, CONFIG) for path in files]
+    union = union_schema(scans + [{"path": "table.csv", "rows": None, "columns": None}])
+    assert sorted(union) == ["flag", "id", "mag"]
+    assert (union["id"]["itemsize"], union["mag"]["itemsize"], union["id"]["rows"]) == (8, 8, 3)
+
+    union_types = {"id": "BIGINT", "mag": "FLOAT8", "flag": "BOOLEAN"}
+    assert schema_drift(scans, union_types) == [
+        {"path": files[0], "missing": ["flag"], "promoted": {"id": ("INTEGER", "BIGINT"), "mag": ("FLOAT4", "FLOAT8")}},
+        {"path": files[1], "missing": [], "promoted": {"mag": ("FLOAT4", "FLOAT8")}},
+        {"path": files[2], "missing": ["flag"], "promoted": {"id": ("INTEGER", "BIGINT")}},
+    ]
+
+
+def test_run_prescan(files, tmp_path):
+    assert run_prescan(files, CONFIG) == ({"id": "BIGINT", "mag": "FLOAT8", "flag": "BOOLEAN"}, 6)
+
+    broken = str(tmp_path / "broken.fits")
+    with open(broken, "w") as f:
+        f.write("not a FITS file")
+    union_types, rows_total = run_prescan(files + [(broken, None)], CONFIG)
+    assert union_types == {"id": "BIGINT", "mag": "FLOAT8", "flag": "BOOLEAN"}
+    assert rows_total is None
@@ -0,0 +1,63 @@
+import numpy as np
+from astropy.table import MaskedColumn, Table
+
+from astroinject.database.utils import convert_table_to_postgres_records
+from astroinject.processing import decode_float32_bytea, dedup_grid_columns, encode_bytea_columns, grid_id
+
+
+def test_bytea_columns_round_trip():
+    spectra = np.array([[1.0, 2.5, -3.0], [0.0, np.nan, 1e30]])
+    table = Table({"id": [1, 2], "flux": spectra, "wave": spectra})
+    encode_bytea_columns(table, ["FLUX", "missing"])
+
+    assert table["flux"].dtype == object
+    assert table["flux"][0] == "\\x" + np.array([1.0, 2.5, -3.0], dtype="<f4").tobytes().hex()
+    assert table["wave"].dtype == np.float64
+    for value, expected in zip(table["flux"], spectra):
+        np.testing.assert_array_equal(decode_float32_bytea(value), expected.astype(np.float32))
+
+    raw = bytes.fromhex(table["flux"][1][2:])
+    np.testing.assert_array_equal(decode_float32_bytea(memoryview(raw)), spectra[1].astype(np.float32))
+    assert decode_float32_bytea(None) is None
+
+
+def test_bytea_columns_are_copied_as_hex_text():
+    table = encode_bytea_columns(Table({"id": [1], "flux": np.array([[1.0, 2.0]])}), ["flux"])
+    (record,) = convert_table_to_postgres_records(table)
+    assert record[1] == "\\x0000803f00000040"
+
+
+WAVE_B = np.linspace(3600.0, 6000.0, 5)
+WAVE_R = np.linspace(6000.0, 9000.0, 5)
+
+
+def test_grid_id_is_stable():
+    assert grid_id(WAVE_B) == grid_id(WAVE_B.astype(np.float32)) == grid_id(list(WAVE_B))
+    assert grid_id(WAVE_B) != grid_id(WAVE_R)
+    assert -2**63 <= grid_id(WAVE_B) < 2**63
+
+
+def test_dedup_fixed_length_grids():
+    table = Table({"id": [1, 2, 3], "wave": np.array([WAVE_B, WAVE_R, WAVE_B]), "flux": np.ones((3, 5))})
+    dedup_grid_columns(table, ["WAVE", "missing"])
+
+    assert table.colnames == ["id", "wave_grid_id", "flux"]
+    assert table["wave_grid_id"].tolist() == [grid_id(WAVE_B), grid_id(WAVE_R), grid_id(WAVE_B)]
+    assert sorted(table.meta["grids"]) == sorted([grid_id(WAVE_B), grid_id(WAVE_R)])
+    assert table.meta["grids"][grid_id(WAVE_R)].dtype == np.float32
+    np.testing.assert_array_equal(table.meta["grids"][grid_id(WAVE_R)], WAVE_R.astype(np.float32))
+
+
+def test_dedup_object_and_masked_grids():
+    shared = WAVE_B.copy()
+    objects = np.empty(4, dtype=object)
+    objects[:] = [shared, shared, None, WAVE_R[:3]]
+    masked = MaskedColumn(np.array([WAVE_B, WAVE_R, WAVE_R]), mask=[[False] * 5, [True] * 5, [False] * 5])
+    table = Table({"wave": objects, "wave_r": masked[[0, 1, 2, 2]]})
+    dedup_grid_columns(table, ["wave", "wave_r"])
+
+    assert table["wave_grid_id"].mask.tolist() == [False, False, True, False]
+    assert table["wave_grid_id"].compressed().tolist() == [grid_id(WAVE_B)] * 2 + [grid_id(WAVE_R[:3])]
+    assert table["wave_r_grid_id"].mask.tolist() == [False, True, False, False]
+    assert table["wave_r_grid_id"].compressed().tolist() == [grid_id(WAVE_B)] + [grid_id(WAVE_R)] * 2
+    assert sorted(table.meta["grids"]) == sorted([grid_id(WAVE_B), grid_id(WAVE_R), grid_id(WAVE_R[:3])])
@@ -0,0 +1,103 @@
+import numpy as np
+from astropy.table import Table
+
+from astroinject.pipeline import scheduler
+from astroinject.pipeline.memory import MemoryBudget
+from astroinject.pipeline.scheduler import PendingTasks, build_tasks, split_row_ranges, task_order_key
+from astroinject.utils import iter_files_with_pattern
+
+
+def make_task(task_id, size, pixel=None, raw_bytes=None):
+    task = {"filepath": f"f{task_id}.fits", "row_range": None, "size": size,
+            "raw_bytes": size if raw_bytes is None else raw_bytes, "task_id": task_id}
+    if pixel is not None:
+        task["pixel"] = pixel
+    return task
+
+
+def drain(pending, budget=None):
+    budget = budget or MemoryBudget({"general": {}})
+    order = []
+    while len(pending):
+        order.append(budget.next_task(pending, 0)["task_id"])
+    return order
+
+
+def test_split_row_ranges_plain():
+    assert split_row_ranges(10, 4) == [(0, 4), (4, 8), (8, 10)]
+    assert split_row_ranges(10, 4, start=3) == [(3, 7), (7, 10)]
+    assert split_row_ranges(3, 4) == [(0, 3)]
+
+
+def test_split_row_ranges_on_row_groups():
+    bounds = [0, 3, 6, 9, 12, 15]
+    assert split_row_ranges(15, 5, bounds) == [(0, 6), (6, 12), (12, 15)]
+    assert split_row_ranges(15, 5, bounds, start=6) == [(6, 12), (12, 15)]
+    assert split_row_ranges(15, 100, bounds) == [(0, 15)]
+
+
+def test_build_tasks_splits_and_orders(tmp_path):
+    big, small = tmp_path / "big.fits", tmp_path / "small.fits"
+    Table({"id": np.arange(1000), "ra": np.zeros(1000)}).write(big)
+    Table({"id": np.arange(10), "ra": np.zeros(10)}).write(small)
+
+    tasks = build_tasks([str(small), str(big)], {"general": {"split_rows": 300}})
+    assert [task["task_id"] for task in tasks] == list(range(5))
+    assert [task["row_range"] for task in tasks if task["filepath"] == str(big)] == [(0, 300), (300, 600), (600, 900), (900, 1000)]
+    assert all(task["file_tasks"] == 4 for task in tasks if task["filepath"] == str(big))
+    sizes = [task["size"] for task in tasks]
+    assert sizes == sorted(sizes, reverse=True)
+
+
+def test_pending_tasks_largest_first():
+    pending = PendingTasks()
+    for task in (make_task(0, 10), make_task(1, 30), make_task(2, 20)):
+        pending.add(task)
+    assert drain(pending) == [1, 2, 0]
+
+
+def test_pending_tasks_ties_keep_arrival_order():
+    pending = PendingTasks([make_task(i, 100) for i in range(5)])
+    pending.add(make_task(5, 100))
+    assert drain(pending) == [0, 1, 2, 3, 4, 5]
+
+
+def test_pending_tasks_cost_is_linear_in_key_computations(monkeypatch):
+    calls = []
+
+    def counting_key(task):
+        calls.append(task["task_id"])
+        return task_order_key(task)
+
+    monkeypatch.setattr(scheduler, "task_order_key", counting_key)
+    pending = PendingTasks([make_task(i, i) for i in range(1000)])
+    for i in range(1000, 3000):
+        pending.add(make_task(i, i % 97))
+    # one key per task, never recomputed on insert
+    assert len(calls) == 3000
+    assert len(pending) == 3000
+
+
+def test_pending_tasks_pop_skips_without_losing_tasks():
+    pending = PendingTasks([make_task(0, 300), make_task(1, 200), make_task(2, 100)])
+    assert pending.pop(lambda task: task["size"] < 250)["task_id"] == 1
+    assert pending.pop(lambda task: False) is None
+    assert drain(pending) == [0, 2]
+
+
+def test_iter_files_with_pattern(tmp_path):
+    for name in ("a.fits", "b.csv", "sub/c.fits", "sub/deep/d.fits", "other/e.fits"):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"x" * len(name))
+    found = dict(iter_files_with_pattern(str(tmp_path), "*.fits", workers=3))
+    assert sorted(found) == sorted(str(tmp_path / name) for name in ("a.fits", "sub/c.fits", "sub/deep/d.fits", "other/e.fits"))
+    assert found[str(tmp_path / "sub/c.fits")] == len("sub/c.fits")
+    # like `find -path`, "*" also matches "/"
+    found = sorted(path for path, _ in iter_files_with_pattern(str(tmp_path), ["*/sub/*.fits", "*.csv"]))
+    assert found == [str(tmp_path / name) for name in ("b.csv", "sub/c.fits", "sub/deep/d.fits")]
+
+
+def test_pending_tasks_sky_pixels_before_sizes():
+    pending = PendingTasks([make_task(0, 10), make_task(1, 30), make_task(2, 5, pixel=7), make_task(3, 1, pixel=2)])
+    assert drain(pending) == [3, 2, 1, 0]
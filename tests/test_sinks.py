@@ -0,0 +1,89 @@
+import numpy as np
+import pyarrow.parquet as pq
+import pytest
+from astropy.table import Table, MaskedColumn
+
+from astroinject.database.utils import convert_table_to_postgres_records
+from astroinject.pipeline.sinks import (
+    Sink, NullSink, ParquetSink, PostgresSink, counting_sink, open_sinks, sink_names, table_to_arrow, uses_database,
+)
+
+
+def sample_table():
+    return Table({
+        "id": np.arange(4),
+        "mag": MaskedColumn([1.5, 2.5, 3.5, 4.5], mask=[False, True, False, False]),
+        "name": ["a", "b", "c", "d"],
+        "flux": np.arange(12, dtype=np.float32).reshape(4, 3),
+    })
+
+
+def test_sink_is_abstract():
+    with pytest.raises(TypeError):
+        Sink({})
+
+
+def test_sink_names():
+    assert sink_names({}) == ["postgres"]
+    assert sink_names({"sinks": "null"}) == ["null"]
+    assert uses_database({}) and uses_database({"sinks": ["null", "postgres"]})
+    assert not uses_database({"sinks": ["null", "parquet"]})
+    with pytest.raises(ValueError):
+        sink_names({"sinks": ["csv"]})
+
+
+def test_counting_sink_prefers_the_database(tmp_path):
+    config = {"sinks": ["null", "parquet"], "parquet_sink_dir": str(tmp_path)}
+    sinks = open_sinks(config)
+    assert counting_sink(sinks) is sinks[0]
+    postgres = PostgresSink({})
+    assert counting_sink([sinks[1], postgres]) is postgres
+    assert counting_sink([]) is None
+
+
+def test_null_sink_encodes_the_copy_payload():
+    table = sample_table()
+    calls = []
+
+    def records():
+        calls.append(1)
+        return convert_table_to_postgres_records(table)
+
+    written = NullSink({}).write(table, records, "t")
+    assert written["rows"] == 4 and written["bytes"] > 0
+    assert len(calls) == 1
+
+
+def test_parquet_sink_writes_the_table(tmp_path):
+    with pytest.raises(ValueError):
+        ParquetSink({})
+    sink = ParquetSink({"parquet_sink_dir": str(tmp_path / "out")})
+    written = sink.write(sample_table(), lambda: pytest.fail("records not needed"), "dir/file.fits[0:4]")
+    path = sink.output_path("dir/file.fits[0:4]")
+    assert path.endswith("file.fits_0_4_.parquet")
+    assert written["rows"] == 4
+    back = pq.read_table(path).to_pydict()
+    assert back["mag"] == [1.5, None, 3.5, 4.5]
+    assert back["flux"][1] == [3.0, 4.0, 5.0]
+
+
+def test_table_to_arrow_big_endian_and_objects():
+    table = Table({"x": np.arange(3, dtype=">i4"), "o": np.array([None, [1, 2], [3]], dtype=object)})
+    arrow = table_to_arrow(table)
+    assert arrow.column("x").to_pylist() == [0, 1, 2]
+    assert arrow.column("o").to_pylist() == [None, [1, 2], [3]]
+
+
+def test_injection_reports_the_rows_of_the_counting_sink(tmp_path):
+    from astroinject.pipeline.injection import injection_procedure
+
+    path = str(tmp_path / "cat.fits")
+    sample_table().write(path)
+    config = {
+        "tablename": "t", "sinks": ["null", "parquet"], "parquet_sink_dir": str(tmp_path / "out"),
+        "id_col": None, "delete_columns": [], "rename_columns": {}, "patterns_to_replace": [],
+    }
+    result = injection_procedure(path, None, config)
+    assert result["status"] == "ok"
+    assert result["rows_in"] == result["rows"] == 4
+    assert len(Table.read(ParquetSink(config).output_path(path))) == 4
@@ -0,0 +1,100 @@
+import numpy as np
+from astropy.table import Table, MaskedColumn
+
+from astroinject.spatial import ang2pix_nest, add_pixel_column, cone_pixel_ranges, sort_by_pixel
+
+# centres of the 12 base pixels: north cap, equator, south cap
+BASE_DEC = np.degrees(np.arcsin(2.0 / 3.0))
+BASE_CENTRES = (
+    [(45.0 + 90.0 * k, BASE_DEC) for k in range(4)]
+    + [(90.0 * k, 0.0) for k in range(4)]
+    + [(45.0 + 90.0 * k, -BASE_DEC) for k in range(4)]
+)
+
+
+def random_points(n, seed=0):
+    rng = np.random.default_rng(seed)
+    ra = rng.uniform(0.0, 360.0, n)
+    dec = np.degrees(np.arcsin(rng.uniform(-1.0, 1.0, n)))
+    return ra, dec
+
+
+def test_base_pixels():
+    ra, dec = np.array(BASE_CENTRES).T
+    assert ang2pix_nest(0, ra, dec).tolist() == list(range(12))
+
+
+def test_base_pixel_centres_at_every_order():
+    ra, dec = np.array(BASE_CENTRES).T
+    for order in (1, 8, 16, 29):
+        assert (ang2pix_nest(order, ra, dec) >> (2 * order)).tolist() == list(range(12))
+
+
+def test_nested_hierarchy():
+    ra, dec = random_points(20000)
+    fine = ang2pix_nest(16, ra, dec)
+    for order in (0, 3, 10, 15):
+        assert np.array_equal(fine >> (2 * (16 - order)), ang2pix_nest(order, ra, dec))
+
+
+def test_pixel_range_and_equal_areas():
+    ra, dec = random_points(240000, seed=1)
+    pixels = ang2pix_nest(2, ra, dec)
+    assert pixels.min() >= 0 and pixels.max() < 12 * 4 ** 2
+    counts = np.bincount(pixels, minlength=12 * 4 ** 2)
+    # 1250 points expected per pixel
+    assert counts.min() > 1050 and counts.max() < 1450
+
+
+def test_poles_wrap_and_missing_coordinates():
+    pixels = ang2pix_nest(10, [0.0, 0.0, 360.0, -90.0, np.nan, 10.0], [90.0, -90.0, 10.0, 10.0, 0.0, np.inf])
+    assert 0 <= pixels[0] < 4 * 4 ** 10
+    assert 8 * 4 ** 10 <= pixels[1] < 12 * 4 ** 10
+    assert pixels[2] == ang2pix_nest(10, 0.0, 10.0)
+    assert pixels[3] == ang2pix_nest(10, 270.0, 10.0)
+    assert pixels[4] == pixels[5] == -1
+
+
+def test_sort_by_pixel_groups_neighbours():
+    ra, dec = random_points(2000, seed=3)
+    table = Table({"RA": MaskedColumn(ra, mask=np.arange(2000) == 5), "dec": dec, "n": np.arange(2000)})
+    out = sort_by_pixel(table, {"ra_col": "ra", "dec_col": "dec", "spatial_sort_order": 10})
+    pixels = ang2pix_nest(10, np.ma.filled(out["RA"], np.nan), out["dec"])
+    assert np.all(np.diff(pixels) >= 0)
+    # rows without coordinates first, every row kept
+    assert out["n"][0] == 5
+    assert sorted(out["n"]) == list(range(2000))
+
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    return np.degrees(2 * np.arcsin(np.sqrt(
+        np.sin((dec2 - dec1) / 2) ** 2 + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2
+    )))
+
+
+def test_cone_ranges_cover_every_point_of_the_cone():
+    rng = np.random.default_rng(2)
+    for ra0, dec0, radius in ((150.1, 2.2, 0.05), (0.01, -30.0, 0.5), (359.9, 89.5, 1.0), (45.0, 41.8, 0.01)):
+        ranges = cone_pixel_ranges(ra0, dec0, radius)
+        ra = ra0 + rng.uniform(-3 * radius, 3 * radius, 20000) / max(np.cos(np.radians(dec0)), 0.01)
+        dec = np.clip(dec0 + rng.uniform(-3 * radius, 3 * radius, 20000), -90.0, 90.0)
+        inside = angular_distance(ra0, dec0, ra, dec) <= radius
+        pixels = ang2pix_nest(16, ra[inside], dec[inside])
+        lo = np.array([r[0] for r in ranges])
+        hi = np.array([r[1] for r in ranges])
+        slot = np.searchsorted(lo, pixels, side="right") - 1
+        assert inside.sum() > 100
+        assert np.all((slot >= 0) & (pixels <= hi[slot]))
+
+
+def test_cone_ranges_sorted_and_merged():
+    ranges = cone_pixel_ranges(10.0, 10.0, 0.2)
+    assert all(a[1] + 1 < b[0] for a, b in zip(ranges, ranges[1:]))
+    assert cone_pixel_ranges(0.0, 0.0, 80.0, order=3) == [(0, 12 * 4 ** 3 - 1)]
+
+
+def test_add_pixel_column():
+    table = Table({"ra": [10.0, np.nan], "dec": [20.0, 0.0]})
+    add_pixel_column(table, {"ra_col": "ra", "dec_col": "dec", "pixel_col": "pix", "pixel_order": 12})
+    assert table["pix"].tolist() == [int(ang2pix_nest(12, 10.0, 20.0)), -1]
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from astropy.table import MaskedColumn, Table
+
+from astroinject.database.utils import column_stats, merge_column_stats, pg_type_from_stats
+from astroinject.pipeline.injection import infer_table_types
+
+CONFIG = {"id_col": None, "delete_columns": [], "rename_columns": {}, "patterns_to_replace": []}
+
+
+def test_column_stats_counts_masked_and_nan_as_nulls():
+    stats = column_stats(MaskedColumn(np.array([5, -3, 70000], dtype=np.int64), mask=[False, False, True]))
+    assert stats == {"kind": "i", "itemsize": 8, "shape": (), "rows": 3, "nulls": 1, "min": -3, "max": 5}
+
+    stats = column_stats(np.array([1.0, np.nan, 2.0], dtype=np.float32))
+    assert (stats["kind"], stats["itemsize"], stats["nulls"], stats["min"]) == ("f", 4, 1, None)
+
+    stats = column_stats(np.array([[1.0, np.nan], [np.nan, np.nan]]))
+    assert (stats["shape"], stats["nulls"]) == ((2,), 1)
+
+
+def test_merge_column_stats():
+    small = column_stats(np.array([1, 2], dtype=np.int16))
+    big = column_stats(np.array([-40000], dtype=np.int32))
+    merged = merge_column_stats(small, big)
+    assert merged == {"kind": "i", "itemsize": 4, "shape": (), "rows": 3, "nulls": 0, "min": -40000, "max": 2}
+
+    floats = column_stats(np.array([0.5]))
+    assert merge_column_stats(small, floats)["kind"] == "f"
+    assert merge_column_stats(floats, column_stats(np.array(["a"])))["kind"] == "U"
+
+    empty = column_stats(MaskedColumn(np.array([0], dtype=np.int64), mask=[True]))
+    assert (merge_column_stats(empty, small)["min"], merge_column_stats(empty, small)["max"]) == (1, 2)
+
+
+@pytest.mark.parametrize("values, expected, narrow", [
+    (np.array([1, 2], dtype=np.int16), "SMALLINT", "SMALLINT"),
+    (np.array([1, 2], dtype=np.int32), "INTEGER", "SMALLINT"),
+    (np.array([1, 2], dtype=np.int64), "BIGINT", "SMALLINT"),
+    (np.array([1, 2**40], dtype=np.int64), "BIGINT", "BIGINT"),
+    (np.array([1], dtype=np.uint16), "INTEGER", "SMALLINT"),
+    (np.array([1], dtype=np.uint32), "BIGINT", "SMALLINT"),
+    (np.array([2**64 - 1], dtype=np.uint64), "NUMERIC", "NUMERIC"),
+    (np.array([0.5], dtype=np.float32), "FLOAT4", "FLOAT4"),
+    (np.array([0.5]), "FLOAT8", "FLOAT8"),
+    (np.array([True]), "BOOLEAN", "BOOLEAN"),
+    (np.array(["abc"]), "TEXT", "TEXT"),
+    (np.zeros((2, 3), dtype=np.float32), "FLOAT4[]", "FLOAT4[]"),
+    (np.zeros((2, 3), dtype=np.int16), "BIGINT[]", "BIGINT[]"),
+    (np.array([None, 1], dtype=object), None, None),
+])
+def test_pg_type_from_stats(values, expected, narrow):
+    stats = column_stats(values)
+    assert pg_type_from_stats(stats) == expected
+    assert pg_type_from_stats(stats, narrow_integers=True) == narrow
+
+
+def test_pg_type_from_stats_of_a_null_integer_column():
+    stats = column_stats(MaskedColumn(np.array([0], dtype=np.int32), mask=[True]))
+    assert pg_type_from_stats(stats, narrow_integers=True) == "INTEGER"
+
+
+def test_infer_table_types_reads_whole_columns_of_every_file(tmp_path):
+    # `table` is already preprocessed, the files are preprocessed (lower case names) when read
+    first = Table({"id": np.array([1, 2], dtype=np.int32), "mag": np.array([np.nan, 20.0], dtype=np.float32)})
+    second = Table({"ID": np.array([3, 2**40], dtype=np.int64), "mag": np.array([21.0, 22.0])})
+    path = str(tmp_path / "second.fits")
+    second.write(path)
+
+    assert infer_table_types([], CONFIG, table=first) == {"id": "INTEGER", "mag": "FLOAT4"}
+    assert infer_table_types([path], CONFIG, table=first) == {"id": "BIGINT", "mag": "FLOAT8"}
+    assert infer_table_types([str(tmp_path / "missing.fits")], CONFIG, table=first) == {"id": "INTEGER", "mag": "FLOAT4"}
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+from astroinject.database import types
+from astroinject.database.types import build_type_map, db_type, type_map_cache_path
+
+
+@pytest.mark.parametrize("typname, expected", [
+    ("float8", "DOUBLE"),
+    ("float4", "REAL"),
+    ("int2", "BIGINT"),
+    ("int8", "BIGINT"),
+    ("bool", "BOOL"),
+    ("varchar", "VARCHAR"),
+    ("text", "VARCHAR"),
+    ("bpchar", "VARCHAR"),
+    ("character varying", "VARCHAR"),
+    ("smallint", "SMALLINT"),
+    ("integer", "INTEGER"),
+])
+def test_db_type(typname, expected):
+    assert db_type(typname) == expected
+
+
+def test_type_map_cache_path():
+    assert type_map_cache_path({"tablename": "sky.obj"}) == "sky.obj.types.json"
+    assert type_map_cache_path({"tablename": "sky.obj", "general": {"type_map_cache": "/tmp/t.json"}}) == "/tmp/t.json"
+    assert type_map_cache_path({"tablename": "sky.obj", "general": {"type_map_cache": "None"}}) is None
+
+
+class FakeManager:
+    queries = []
+    key = [(16384, "700:700,700")]
+
+    def __init__(self, use_pool=True, **params):
+        assert not use_pool
+
+    def execute_query(self, query, params=None, fetch=False):
+        FakeManager.queries.append(query)
+        if query == types.TYPE_MAP_KEY_QUERY:
+            return FakeManager.key
+        return [("id", "int8"), ("ra", "float8"), ("flux", "_float4"), ("name", "varchar")]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    FakeManager.queries = []
+    FakeManager.key = [(16384, "700:700,700")]
+    monkeypatch.setattr(types, "PostgresConnectionManager", FakeManager)
+    return FakeManager
+
+
+def test_build_type_map_is_cached_until_the_relation_changes(manager, tmp_path):
+    cache = tmp_path / "obj.types.json"
+    config = {"tablename": "sky.obj", "database": {}, "general": {"type_map_cache": str(cache)}}
+    expected = {"id": "BIGINT", "ra": "DOUBLE", "name": "VARCHAR"}
+
+    assert build_type_map(config) == expected
+    assert json.loads(cache.read_text()) == {"key": "16384:700:700,700", "types": expected}
+    assert manager.queries.count(types.TYPE_MAP_QUERY) == 1
+
+    assert build_type_map(config) == expected
+    assert manager.queries.count(types.TYPE_MAP_QUERY) == 1
+
+    manager.key = [(16384, "701:700,701")]
+    assert build_type_map(config) == expected
+    assert manager.queries.count(types.TYPE_MAP_QUERY) == 2
+
+
+def test_build_type_map_of_a_missing_table(manager, tmp_path):
+    manager.key = []
+    config = {"tablename": "sky.obj", "database": {}, "general": {"type_map_cache": str(tmp_path / "t.json")}}
+    assert build_type_map(config) == {}
+    assert not (tmp_path / "t.json").exists()
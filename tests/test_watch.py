@@ -0,0 +1,139 @@
+import os
+
+import numpy as np
+import pytest
+from astropy.table import Table
+
+from astroinject.database import dbpool
+from astroinject.database.dbpool import PostgresConnectionManager
+from astroinject.pipeline import watch
+from astroinject.pipeline.watch import FolderWatcher, _batches, load_batch
+
+
+def write_fits(path, n, start=0):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Table({"id": np.arange(start, start + n), "ra": np.zeros(n)}).write(path, overwrite=True)
+
+
+def age(path, seconds=10):
+    """Move the mtime of `path` (and of its directory) back, past `MTIME_SLACK`."""
+    for target in (path, path.parent):
+        st = os.stat(target)
+        os.utime(target, ns=(st.st_atime_ns, st.st_mtime_ns - int(seconds * 1e9)))
+
+
+def test_new_files_are_ready_once_stable(tmp_path):
+    folder = tmp_path / "data"
+    write_fits(folder / "a.fits", 5)
+    age(folder / "a.fits")
+    watcher = FolderWatcher(str(folder), "*.fits", str(tmp_path / "state.json"))
+
+    assert watcher.poll() == []
+    ready = watcher.poll()
+    assert [path for path, _ in ready] == [str(folder / "a.fits")]
+
+    watcher.mark_loaded(*ready[0])
+    assert watcher.poll() == []
+
+    # rewritten in place (its directory does not change): seen after a rescan
+    write_fits(folder / "a.fits", 7)
+    watcher.dirs = {}
+    watcher.poll()
+    assert [path for path, _ in watcher.poll()] == [str(folder / "a.fits")]
+
+
+def test_state_survives_a_restart(tmp_path):
+    folder = tmp_path / "data"
+    write_fits(folder / "a.fits", 5)
+    watcher = FolderWatcher(str(folder), ["*.fits"], str(tmp_path / "state.json"))
+    for path, signature in watcher.scan().items():
+        watcher.mark_loaded(path, signature)
+    watcher.save_state()
+
+    restarted = FolderWatcher(str(folder), ["*.fits"], str(tmp_path / "state.json"))
+    assert restarted.loaded == watcher.loaded
+    assert restarted.scan() == {}
+
+
+def test_batches_by_files_and_size():
+    ready = [(f"f{i}", (10 * 1024 ** 2, 0)) for i in range(5)]
+    config = {"general": {"watch_batch_files": 2, "watch_batch_mb": 1000}}
+    assert [len(batch) for batch in _batches(ready, config)] == [2, 2, 1]
+    config = {"general": {"watch_batch_files": 50, "watch_batch_mb": 25}}
+    assert [len(batch) for batch in _batches(ready, config)] == [2, 2, 1]
+
+
+def test_failed_batch_is_retried_file_by_file(tmp_path, monkeypatch):
+    paths = []
+    for i in range(3):
+        write_fits(tmp_path / f"f{i}.fits", 4, start=10 * i)
+        paths.append(str(tmp_path / f"f{i}.fits"))
+    write_fits(tmp_path / "other.fits", 0)
+    batch = [(path, (1, 1)) for path in paths + [str(tmp_path / "other.fits"), str(tmp_path / "missing.fits")]]
+
+    written = []
+
+    def write_members(members, config):
+        if any(member[0].endswith("f1.fits") for member in members):
+            raise RuntimeError("COPY failed")
+        written.append([member[0] for member in members])
+        return sum(len(member[2]) for member in members)
+
+    monkeypatch.setattr(watch, "_write_members", write_members)
+    watcher = FolderWatcher(str(tmp_path), "*.fits", str(tmp_path / "state.json"))
+    config = {"id_col": None, "delete_columns": [], "rename_columns": {}, "patterns_to_replace": []}
+    rows = load_batch(batch, watcher, None, config)
+
+    assert rows == 8
+    assert written == [[paths[0]], [paths[2]]]
+    assert sorted(watcher.loaded) == sorted([paths[0], paths[2], str(tmp_path / "other.fits")])
+    assert sorted(watcher.failed) == sorted([paths[1], str(tmp_path / "missing.fits")])
+
+
+class FakeCursor:
+    def __init__(self, executed):
+        self.executed = executed
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed.append(query)
+
+    def copy_expert(self, query, payload):
+        self.executed.append(query)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.executed = []
+
+    def cursor(self):
+        return FakeCursor(self.executed)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_id_handling_temp_tables_do_not_collide(monkeypatch):
+    monkeypatch.setattr(dbpool.psycopg2, "connect", lambda **params: FakeConnection())
+    pg_conn = PostgresConnectionManager(use_pool=False)
+    for table in ("dr4.photoz", "dr5.photoz"):
+        assert pg_conn.insert_data_copy_w_idhandling(table, ["id", "z"], [(1, 0.5)], "id") == 0
+    creates = [query for query in pg_conn.connection.executed if query.startswith("CREATE TEMP TABLE")]
+    names = [query.split()[3] for query in creates]
+    assert len(set(names)) == 2
+    assert all(name.startswith("photoz_temp_") for name in names)
+    assert "LIKE dr4.photoz INCLUDING DEFAULTS" in creates[0]
+    copy = next(query for query in pg_conn.connection.executed if query.startswith("COPY"))
+    assert "NULL ''" in copy